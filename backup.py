@@ -0,0 +1,176 @@
+"""
+Incremental, content-addressed backups for PhoneBookSystem.
+
+Users and contacts are serialized as one JSON object per line (so field values
+may contain '|' or newlines), grouped into fixed ranges of IDs and stored as gzip chunks named by the SHA-256 of their
+content under backups/chunks. Each backup is a small JSON manifest listing the
+chunks it needs, so a backup only writes the chunks that changed since the
+last one. Manifests beyond the retention limit are removed together with any
+chunks no remaining manifest references.
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import datetime
+from typing import List, Dict, Tuple, Iterable, Optional
+from models import User, Contact
+
+BACKUP_CHUNK_RECORDS = 512
+BACKUP_RETENTION = 14
+MANIFEST_PREFIX = "backup_"
+MANIFEST_SUFFIX = ".json"
+
+
+def _record_line(record) -> str:
+    # sort_keys để cùng dữ liệu luôn cho cùng nội dung (và cùng chunk)
+    return json.dumps(record.to_dict(), ensure_ascii=False, sort_keys=True)
+
+
+class BackupStore:
+    """
+    Chunk store and manifests kept in one backups directory.
+    """
+
+    def __init__(self, backups_dir: str, chunk_records: int = BACKUP_CHUNK_RECORDS,
+                 retention: int = BACKUP_RETENTION):
+        self.backups_dir = backups_dir
+        self.chunks_dir = os.path.join(backups_dir, "chunks")
+        self.chunk_records = chunk_records
+        self.retention = retention
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest + ".gz")
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _store_chunks(self, records: Iterable[Tuple[int, str]], report: Dict) -> List[str]:
+        """
+        Group (id, line) records into ID ranges and store each range as one chunk.
+        Returns the chunk digests in ID order.
+        """
+        groups: Dict[int, List[Tuple[int, str]]] = {}
+        for record_id, line in records:
+            groups.setdefault(record_id // self.chunk_records, []).append((record_id, line))
+
+        digests = []
+        for key in sorted(groups):
+            data = "\n".join(line for _, line in sorted(groups[key])).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._chunk_path(digest)
+            if os.path.exists(path):
+                report["chunks_reused"] += 1
+            else:
+                # mtime=0 để cùng nội dung luôn cho cùng một file nén
+                compressed = gzip.compress(data, mtime=0)
+                self._write_atomic(path, compressed)
+                report["chunks_written"] += 1
+                report["bytes_written"] += len(compressed)
+            digests.append(digest)
+        return digests
+
+    def _read_chunk(self, digest: str) -> List[str]:
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = gzip.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Backup chunk {digest} is corrupted")
+        return data.decode('utf-8').split("\n") if data else []
+
+    def create(self, users: List[User], contacts: Iterable[Contact]) -> Dict:
+        """
+        Write a new backup and apply the retention policy.
+        Returns a report with the manifest path and how many chunks were written or reused.
+        """
+        created_at = datetime.datetime.now()
+        report = {"manifest": "", "users": len(users), "contacts": 0,
+                  "chunks_written": 0, "chunks_reused": 0, "bytes_written": 0, "chunks_removed": 0}
+
+        def contact_records():
+            for contact in contacts:
+                report["contacts"] += 1
+                yield contact.contact_id, _record_line(contact)
+
+        manifest = {
+            "created_at": created_at.isoformat(),
+            "chunk_records": self.chunk_records,
+            "users": self._store_chunks(((user.user_id, _record_line(user)) for user in users), report),
+            "contacts": self._store_chunks(contact_records(), report),
+        }
+        manifest["user_count"] = report["users"]
+        manifest["contact_count"] = report["contacts"]
+
+        name = f"{MANIFEST_PREFIX}{created_at.strftime('%Y%m%d_%H%M%S_%f')}{MANIFEST_SUFFIX}"
+        report["manifest"] = os.path.join(self.backups_dir, name)
+        self._write_atomic(report["manifest"], json.dumps(manifest, indent=1).encode('utf-8'))
+
+        report["chunks_removed"] = self.apply_retention()
+        return report
+
+    def list_backups(self) -> List[str]:
+        """Manifest paths, oldest first."""
+        if not os.path.isdir(self.backups_dir):
+            return []
+        names = sorted(name for name in os.listdir(self.backups_dir)
+                       if name.startswith(MANIFEST_PREFIX) and name.endswith(MANIFEST_SUFFIX))
+        return [os.path.join(self.backups_dir, name) for name in names]
+
+    def _load_manifest(self, manifest_path: str) -> Dict:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def restore(self, manifest_path: Optional[str] = None) -> Tuple[List[User], List[Contact]]:
+        """
+        Read users and contacts back from a manifest (the latest one by default).
+        """
+        if manifest_path is None:
+            backups = self.list_backups()
+            if not backups:
+                raise FileNotFoundError("No backups found")
+            manifest_path = backups[-1]
+        elif not os.path.isabs(manifest_path) and not os.path.exists(manifest_path):
+            manifest_path = os.path.join(self.backups_dir, manifest_path)
+        manifest = self._load_manifest(manifest_path)
+
+        users = [User.from_dict(json.loads(line))
+                 for digest in manifest["users"] for line in self._read_chunk(digest)]
+        contacts = [Contact.from_dict(json.loads(line))
+                    for digest in manifest["contacts"] for line in self._read_chunk(digest)]
+        return users, contacts
+
+    def apply_retention(self) -> int:
+        """
+        Keep the newest `retention` manifests and delete chunks none of them reference.
+        Returns the number of chunks removed.
+        """
+        backups = self.list_backups()
+        expired = backups[:-self.retention] if self.retention > 0 else []
+        for manifest_path in expired:
+            os.remove(manifest_path)
+
+        referenced = set()
+        for manifest_path in backups[len(expired):]:
+            try:
+                manifest = self._load_manifest(manifest_path)
+            except Exception as e:
+                # Không đọc được manifest: không xóa chunk nào để tránh mất dữ liệu
+                print(f"Error reading backup manifest {manifest_path}: {e}")
+                return 0
+            referenced.update(manifest["users"])
+            referenced.update(manifest["contacts"])
+
+        removed = 0
+        if not os.path.isdir(self.chunks_dir):
+            return removed
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                if name.endswith(".gz") and name[:-3] not in referenced:
+                    os.remove(os.path.join(prefix_dir, name))
+                    removed += 1
+        return removed
@@ -0,0 +1,453 @@
+"""
+Benchmark suite for PhoneBook Management System
+Run:
+    python bench_suite.py run [--sizes 1000 10000 100000 1000000] [--output results.json]
+    python bench_suite.py compare baseline.json results.json [--threshold 0.10]
+
+For every dataset size a deterministic dataset (one account holding `size` contacts)
+is generated and each case is timed with perf_counter_ns: `warmup` untimed runs,
+then `repeat` timed runs. Results are per-operation nanoseconds, emitted as JSON;
+the "memory" case also reports retained bytes per contact (tracemalloc).
+compare exits with status 1 when any case got slower (or, for memory, larger) than
+the baseline by more than the threshold, so it can gate a CI job.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import statistics
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from system import PhoneBookSystem
+from models import User, Contact, hash_password
+from contact_io import IMPORT_FIELDS
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+PASSWORD_HASH = "0" * 64
+STORAGE_OPTIONS = {
+    "text": {},
+    "log": {"use_contact_log": True},
+    "sqlite": {"storage": "sqlite"},
+}
+GROUPS = ["General", "Family", "Work", "Friends"]
+FAVORITE_EVERY = 10
+BENCH_PASSWORD = "password123"
+DEFAULT_THRESHOLD = 0.10
+LOGIN_WORKERS = os.cpu_count() or 1
+# Trạng thái so sánh được tính là hồi quy (compare trả về mã thoát 1)
+REGRESSIONS = ("slower", "larger")
+
+
+class Case:
+    """
+    One timed operation: run() performs `ops` operations and is timed as a whole.
+    setup(), when given, runs untimed before every run (e.g. to create rows to delete).
+    With track_memory, the bytes still allocated after run() are reported per operation.
+    """
+
+    def __init__(self, name: str, ops: int, run: Callable[[], None],
+                 setup: Optional[Callable[[], None]] = None, track_memory: bool = False):
+        self.name = name
+        self.ops = ops
+        self.run = run
+        self.setup = setup
+        self.track_memory = track_memory
+
+
+def build_system(num_users: int, contacts_per_user: int, seed: int = 42, **options) -> PhoneBookSystem:
+    """
+    Build a PhoneBookSystem in a temp directory with generated users and contacts.
+    Records are created directly (no file I/O); extra keyword options are passed
+    to PhoneBookSystem (e.g. use_contact_log=True).
+    """
+    rng = random.Random(seed)
+    data_dir = tempfile.mkdtemp()
+    system = PhoneBookSystem(data_dir=data_dir, **options)
+    system._bench_dir = data_dir
+
+    system.users = [User(i, f"user{i}", f"user{i}@bench.com", PASSWORD_HASH)
+                    for i in range(1, num_users + 1)]
+    contacts = []
+    contact_id = 1
+    for user in system.users:
+        for _ in range(contacts_per_user):
+            contacts.append(Contact(contact_id, user.user_id,
+                                    f"First{rng.randrange(100000)}",
+                                    f"Last{rng.randrange(100000)}",
+                                    f"09{rng.randrange(10 ** 8):08d}",
+                                    email=f"c{contact_id}@bench.com"))
+            contact_id += 1
+    system.contacts = contacts
+    system._rebuild_user_indexes()
+    system._rebuild_contact_indexes()
+    system.next_user_id = num_users + 1
+    system.next_contact_id = contact_id
+    return system
+
+
+def cleanup(system: PhoneBookSystem):
+    shutil.rmtree(system._bench_dir, ignore_errors=True)
+
+
+def build_dataset(size: int, storage: str) -> PhoneBookSystem:
+    """
+    Generate one account with `size` contacts spread over GROUPS (every
+    FAVORITE_EVERY-th one a favorite), persist it and log that account in.
+    """
+    system = build_system(num_users=1, contacts_per_user=size, login_workers=LOGIN_WORKERS,
+                          **STORAGE_OPTIONS[storage])
+    for contact in system.contacts:
+        contact.group = GROUPS[contact.contact_id % len(GROUPS)]
+        contact.is_favorite = contact.contact_id % FAVORITE_EVERY == 0
+    system._rebuild_contact_indexes()
+
+    # Mật khẩu thật (KDF) để ca "login" đo đúng chi phí đăng nhập
+    user = system.users[0]
+    user.password_hash = hash_password(BENCH_PASSWORD)
+    system._save_users()
+    system._save_contacts()
+    system.current_user = user
+    return system
+
+
+def make_cases(system: PhoneBookSystem, size: int, storage: str, batch: int) -> List[Case]:
+    """
+    Build the suite's cases against a dataset; each case draws from its own seeded RNG.
+    """
+    user = system.current_user
+    contact_ids = [contact.contact_id for contact in system.contacts]
+    work_dir = os.path.join(system.data_dir, "bench")
+    os.makedirs(work_dir, exist_ok=True)
+
+    def rng_for(name: str) -> random.Random:
+        return random.Random(f"{name}:{size}")
+
+    def new_row(rng: random.Random) -> Dict:
+        return {"first_name": f"First{rng.randrange(100000)}", "last_name": f"Last{rng.randrange(100000)}",
+                "phone": f"09{rng.randrange(10 ** 8):08d}", "group": rng.choice(GROUPS)}
+
+    def reformat_phone(phone: str) -> str:
+        # Cùng số nhưng viết khác: 0912345678 -> +84 912 345 678
+        digits = phone[1:]
+        return f"+84 {digits[:3]} {digits[3:6]} {digits[6:]}"
+
+    cases = []
+
+    def load():
+        PhoneBookSystem(data_dir=system.data_dir, **STORAGE_OPTIONS[storage]).storage.close()
+    cases.append(Case("load", 1, load))
+
+    rng = rng_for("add")
+    def add():
+        for _ in range(batch):
+            row = new_row(rng)
+            system.add_contact(row["first_name"], row["last_name"], row["phone"], group=row["group"])
+    cases.append(Case("add", batch, add))
+
+    import_file = os.path.join(work_dir, "import.csv")
+    import_rows = batch * 10
+    rng = rng_for("bulk_import")
+    with open(import_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=IMPORT_FIELDS)
+        writer.writeheader()
+        for _ in range(import_rows):
+            writer.writerow(new_row(rng))
+    cases.append(Case("bulk_import", import_rows, lambda: system.import_contacts_from_txt(import_file)))
+
+    rng = rng_for("edit")
+    def edit():
+        for _ in range(batch):
+            system.edit_contact(rng.choice(contact_ids), notes=f"note {rng.randrange(1000)}")
+    cases.append(Case("edit", batch, edit))
+
+    # Mỗi lượt xóa đúng các liên hệ vừa được thêm (không tính giờ) trong setup
+    rng = rng_for("delete")
+    pending: List[int] = []
+    def add_victims():
+        first_id = system.next_contact_id
+        system.add_contacts_bulk([new_row(rng) for _ in range(batch)])
+        pending[:] = range(first_id, system.next_contact_id)
+    def delete():
+        for contact_id in pending:
+            system.delete_contact(contact_id)
+    cases.append(Case("delete", batch, delete, setup=add_victims))
+
+    # Tra cứu điểm qua chỉ mục băm: độ trễ phải giữ nguyên khi dữ liệu tăng
+    rng = rng_for("contact_by_id")
+    lookup_ids = [rng.choice(contact_ids) for _ in range(batch)]
+    def contact_by_id():
+        for contact_id in lookup_ids:
+            system.get_contact_by_id(contact_id)
+    cases.append(Case("contact_by_id", batch, contact_by_id))
+
+    rng = rng_for("email_lookup")
+    emails = [user.email if rng.random() < 0.5 else f"missing{rng.randrange(size)}@bench.com"
+              for _ in range(batch)]
+    def email_lookup():
+        for email in emails:
+            system.email_exists(email)
+    cases.append(Case("email_lookup", batch, email_lookup))
+
+    rng = rng_for("phone_lookup")
+    numbers = [reformat_phone(rng.choice(system.contacts).phone) for _ in range(batch)]
+    def phone_lookup():
+        for number in numbers:
+            system.lookup_by_phone(number)
+    cases.append(Case("phone_lookup", batch, phone_lookup))
+
+    rng = rng_for("search")
+    terms = [rng.choice(system.contacts).first_name for _ in range(batch)]
+    def search():
+        for term in terms:
+            system.search_contacts(term)
+    cases.append(Case("search", batch, search))
+
+    rng = rng_for("complete")
+    prefixes = [rng.choice(system.contacts).first_name[:rng.randint(2, 8)] for _ in range(batch)]
+    def complete():
+        for prefix in prefixes:
+            system.complete(prefix, 10)
+    cases.append(Case("complete", batch, complete))
+
+    # Tên có một lỗi gõ: bỏ một ký tự ngẫu nhiên
+    rng = rng_for("fuzzy")
+    typos = []
+    for _ in range(batch):
+        name = rng.choice(system.contacts).first_name
+        position = rng.randrange(len(name))
+        typos.append(name[:position] + name[position + 1:])
+    def fuzzy():
+        for typo in typos:
+            system.fuzzy_search(typo, limit=10)
+    cases.append(Case("fuzzy", batch, fuzzy))
+
+    # Truy vấn nhóm/yêu thích trả về O(n) liên hệ nên dùng ít lượt hơn
+    queries = max(batch // 20, 1)
+    rng = rng_for("group")
+    groups = [rng.choice(GROUPS) for _ in range(queries)]
+    def group():
+        for name in groups:
+            system.get_contacts_by_group(name)
+    cases.append(Case("group", queries, group))
+
+    def favorites():
+        for _ in range(queries):
+            system.get_favorite_contacts()
+    cases.append(Case("favorites", queries, favorites))
+
+    cases.append(Case("dedupe", 1, system.find_duplicate_contacts))
+
+    # Mỗi lượt gộp đúng các bản sao vừa được nhập lại (không tính giờ) trong setup
+    rng = rng_for("merge")
+    proposals: List[Dict] = []
+    def add_copies():
+        sources = [system.get_contact_by_id(rng.choice(contact_ids)) for _ in range(batch)]
+        first_id = system.next_contact_id
+        system.add_contacts_bulk([{"first_name": source.first_name, "last_name": source.last_name,
+                                   "phone": reformat_phone(source.phone), "email": source.email.upper()}
+                                  for source in sources])
+        proposals[:] = [{"keep": source.contact_id, "duplicates": [first_id + i]}
+                        for i, source in enumerate(sources)]
+    cases.append(Case("merge", batch, lambda: system.apply_merges(proposals), setup=add_copies))
+
+    # Bộ nhớ giữ lại cho mỗi liên hệ; như dữ liệu đọc từ file, mọi chuỗi (cả tên nhóm) là đối tượng mới
+    built: List[Contact] = []
+    def build_contacts():
+        for i in range(batch):
+            built.append(Contact(i, user.user_id, f"First{i}", f"Last{i}", f"09{i:08d}",
+                                 group="".join(GROUPS[i % len(GROUPS)]),
+                                 created_at=f"2025-11-19T15:12:{i % 60:02d}.{i % 999999:06d}"))
+    cases.append(Case("memory", batch, build_contacts, setup=built.clear, track_memory=True))
+
+    export_file = os.path.join(work_dir, "export.csv")
+    cases.append(Case("export", 1, lambda: system.export_contacts(export_file, 'csv')))
+    cases.append(Case("backup", 1, system.create_backup))
+
+    logins = 3
+    def login():
+        for _ in range(logins):
+            system.login(user.email, BENCH_PASSWORD)
+    cases.append(Case("login", logins, login))
+
+    # Xác thực theo lô: KDF chạy song song trên pool LOGIN_WORKERS luồng
+    credentials = [(user.email, BENCH_PASSWORD)] * (logins * LOGIN_WORKERS)
+    cases.append(Case("login_pool", len(credentials), lambda: system.authenticate_many(credentials)))
+
+    # Khôi phục = đọc file + dựng lại chỉ mục, không ghi xuống bộ lưu trữ; chạy cuối cùng
+    # vì thay toàn bộ đối tượng liên hệ mà các ca trên đang tham chiếu
+    snapshot_file = os.path.join(work_dir, "bench.snap")
+    def ensure_snapshot():
+        if not os.path.exists(snapshot_file):
+            system.snapshot(snapshot_file)
+    cases.append(Case("snapshot", 1, lambda: system.snapshot(snapshot_file)))
+    cases.append(Case("snapshot_restore", 1, lambda: system.restore_snapshot(snapshot_file, persist=False),
+                      setup=ensure_snapshot))
+    return cases
+
+
+def time_case(case: Case, repeat: int, warmup: int) -> Dict:
+    """Run a case warmup + repeat times and summarize the timed runs in ns per operation."""
+    samples = []
+    retained = []
+    for iteration in range(warmup + repeat):
+        if case.setup:
+            case.setup()
+        # tracemalloc làm chậm lượt chạy; chỉ bật cho các ca đo bộ nhớ
+        if case.track_memory:
+            tracemalloc.start()
+        start = time.perf_counter_ns()
+        case.run()
+        elapsed = time.perf_counter_ns() - start
+        if case.track_memory:
+            allocated = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        if iteration >= warmup:
+            samples.append(elapsed / case.ops)
+            if case.track_memory:
+                retained.append(allocated / case.ops)
+    result = {
+        "ops": case.ops,
+        "median_ns": round(statistics.median(samples)),
+        "min_ns": round(min(samples)),
+        "mean_ns": round(statistics.mean(samples)),
+        "stdev_ns": round(statistics.stdev(samples)) if len(samples) > 1 else 0,
+        "runs_ns": [round(sample) for sample in samples],
+    }
+    if retained:
+        result["bytes_per_op"] = round(statistics.median(retained))
+    return result
+
+
+def run_suite(sizes: Optional[List[int]] = None, storage: str = "log", repeat: int = 5, warmup: int = 1,
+              batch: int = 200, cases: Optional[List[str]] = None, log=None) -> Dict:
+    """
+    Run the suite over every dataset size and return {"meta", "results"} (JSON-serializable).
+    cases restricts the run to the named cases; log receives a progress line per case.
+    """
+    results = []
+    for size in sizes or DEFAULT_SIZES:
+        system = build_dataset(size, storage)
+        try:
+            for case in make_cases(system, size, storage, batch):
+                if cases and case.name not in cases:
+                    continue
+                result = {"case": case.name, "size": size}
+                result.update(time_case(case, repeat, warmup))
+                results.append(result)
+                if log:
+                    log(f"{case.name:>12} @ {size:<8} {result['median_ns'] / 1000:12.1f} us/op")
+        finally:
+            system.close()
+            cleanup(system)
+
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": storage,
+            "repeat": repeat,
+            "warmup": warmup,
+            "batch": batch,
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    Match cases by (case, size) and classify each as "ok", "slower", "faster", "larger",
+    "new" or "missing". A case is "slower" when its median grew by more than `threshold`
+    (0.10 = 10%), and "larger" when its bytes_per_op did.
+    """
+    old = {(r["case"], r["size"]): r for r in baseline["results"]}
+    new = {(r["case"], r["size"]): r for r in current["results"]}
+    rows = []
+    for key in sorted(old.keys() | new.keys(), key=lambda key: (key[1], key[0])):
+        row = {"case": key[0], "size": key[1], "baseline_ns": None, "current_ns": None, "ratio": None,
+               "baseline_bytes": None, "current_bytes": None}
+        if key not in new:
+            row.update(baseline_ns=old[key]["median_ns"], status="missing")
+        elif key not in old:
+            row.update(current_ns=new[key]["median_ns"], status="new")
+        else:
+            before, after = old[key]["median_ns"], new[key]["median_ns"]
+            ratio = after / before if before else 1.0
+            status = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "ok"
+            row.update(baseline_ns=before, current_ns=after, ratio=round(ratio, 3), status=status)
+            if "bytes_per_op" in old[key] and "bytes_per_op" in new[key]:
+                row.update(baseline_bytes=old[key]["bytes_per_op"], current_bytes=new[key]["bytes_per_op"])
+                if row["current_bytes"] > row["baseline_bytes"] * (1 + threshold):
+                    row["status"] = "larger"
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict], threshold: float):
+    print(f"{'case':>12} | {'size':>8} | {'baseline us':>12} | {'current us':>12} | {'ratio':>6} | status")
+    print("-" * 72)
+    for row in rows:
+        before = f"{row['baseline_ns'] / 1000:.1f}" if row["baseline_ns"] is not None else "-"
+        after = f"{row['current_ns'] / 1000:.1f}" if row["current_ns"] is not None else "-"
+        ratio = f"{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+        memory = ""
+        if row["baseline_bytes"] is not None:
+            memory = f"  ({row['baseline_bytes']} -> {row['current_bytes']} bytes/op)"
+        flag = "  <-- REGRESSION" if row["status"] in REGRESSIONS else ""
+        print(f"{row['case']:>12} | {row['size']:>8} | {before:>12} | {after:>12} | {ratio:>6} | "
+              f"{row['status']}{memory}{flag}")
+    slower = sum(1 for row in rows if row["status"] in REGRESSIONS)
+    print(f"\n{slower} regression(s) beyond {threshold:.0%}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PhoneBook benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and emit JSON")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_parser.add_argument("--storage", choices=sorted(STORAGE_OPTIONS), default="log")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--warmup", type=int, default=1)
+    run_parser.add_argument("--batch", type=int, default=200, help="operations per run for per-call cases")
+    run_parser.add_argument("--cases", nargs="+", help="only run these cases")
+    run_parser.add_argument("--output", help="write JSON here instead of stdout")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        # Tiến độ ra stderr để stdout chỉ chứa JSON
+        report = run_suite(args.sizes, args.storage, args.repeat, args.warmup, args.batch, args.cases,
+                           log=lambda line: print(line, file=sys.stderr))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold)
+    print_comparison(rows, args.threshold)
+    return 1 if any(row["status"] in REGRESSIONS for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,228 @@
+import io
+import csv
+import gzip
+import json
+import time
+from typing import Dict, List, Iterator, Iterable, Callable, Optional, TextIO
+from models import Contact
+
+IMPORT_FIELDS = ['first_name', 'last_name', 'phone', 'email', 'address', 'group', 'notes']
+IMPORT_BATCH_SIZE = 5000
+
+EXPORT_FIELDS = IMPORT_FIELDS
+EXPORT_BUFFER_SIZE = 1024 * 1024
+EXPORT_CHUNK_ROWS = 1000
+
+
+class ImportProgress:
+    """
+    Running counters of a streaming import, handed to the progress callback after each batch.
+    """
+
+    def __init__(self, total_bytes: int = 0):
+        self.rows = 0
+        self.bytes_read = 0
+        self.total_bytes = total_bytes
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def percent(self) -> float:
+        if not self.total_bytes:
+            return 100.0
+        return min(100.0, self.bytes_read * 100.0 / self.total_bytes)
+
+    def to_dict(self) -> Dict:
+        return {
+            'rows': self.rows,
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'elapsed': self.elapsed,
+            'rows_per_sec': self.rows_per_sec
+        }
+
+
+ProgressCallback = Callable[[ImportProgress], None]
+
+
+def iter_csv_records(f: TextIO) -> Iterator[tuple]:
+    """
+    Yield (line_number, values) for every non-blank CSV record, honouring quoted fields.
+    """
+    reader = csv.reader(f)
+    for values in reader:
+        if not values or not any(v.strip() for v in values):
+            continue
+        yield reader.line_num, [v.strip() for v in values]
+
+
+def iter_import_rows(records: Iterable[tuple]) -> Iterator[Dict]:
+    """
+    Map CSV records onto contact field dicts using the header record.
+    Invalid records are yielded as {"line", "error"} dicts instead of contact rows.
+    """
+    header = None
+    for line_number, values in records:
+        if header is None:
+            header = values
+            continue
+
+        if len(header) != len(values):
+            yield {"line": line_number, "error": "Mismatched number of fields in line."}
+            continue
+
+        row = dict(zip(header, values))
+        row['line'] = line_number
+        yield row
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_import_batches(f: TextIO, batch_size: int = IMPORT_BATCH_SIZE,
+                          progress: Optional[ImportProgress] = None) -> Iterator[List[Dict]]:
+    """
+    Read, parse and validate an import file lazily, yielding fixed-size batches
+    of rows (and error dicts). Only one batch is held in memory at a time.
+    """
+    rows = iter_import_rows(iter_csv_records(f))
+    for batch in iter_batches(rows, batch_size):
+        if progress is not None:
+            progress.rows += len(batch)
+            progress.bytes_read = f.buffer.tell()
+        yield batch
+
+
+def print_import_progress(progress: ImportProgress):
+    print(f"\r  {progress.rows} rows | {progress.bytes_read / 1048576:.1f} MB "
+          f"({progress.percent:.0f}%) | {progress.rows_per_sec:.0f} rows/sec", end="", flush=True)
+
+
+class TxtFormatter:
+    """
+    Legacy layout: one line per contact, comma-separated with '\n' line endings and
+    newlines in values flattened to spaces. Values containing commas or quotes are
+    quoted as in CSV, so rows without them are byte-identical to the old unquoted file
+    and every file can be re-imported.
+    """
+
+    def __init__(self, f: TextIO, fields: List[str]):
+        self.writer = csv.writer(f, lineterminator='\n')
+        self.fields = fields
+
+    def write_header(self):
+        self.writer.writerow(self.fields)
+
+    def write_row(self, row: Dict):
+        self.writer.writerow([str(row[field]).replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
+                              for field in self.fields])
+
+
+class CsvFormatter:
+    """
+    RFC 4180 CSV: fields containing commas, quotes or newlines are quoted.
+    """
+
+    def __init__(self, f: TextIO, fields: List[str]):
+        self.writer = csv.writer(f, lineterminator='\r\n')
+        self.fields = fields
+
+    def write_header(self):
+        self.writer.writerow(self.fields)
+
+    def write_row(self, row: Dict):
+        self.writer.writerow([row[field] for field in self.fields])
+
+
+class JsonLinesFormatter:
+    """
+    One JSON object per line, keeping native value types.
+    """
+
+    def __init__(self, f: TextIO, fields: List[str]):
+        self.f = f
+        self.fields = fields
+
+    def write_header(self):
+        pass
+
+    def write_row(self, row: Dict):
+        self.f.write(json.dumps({field: row[field] for field in self.fields}, ensure_ascii=False) + '\n')
+
+
+EXPORT_FORMATS = {
+    'txt': TxtFormatter,
+    'csv': CsvFormatter,
+    'jsonl': JsonLinesFormatter
+}
+
+
+def open_export_file(filename: str, compress: bool = False) -> TextIO:
+    """
+    Open an export target behind a large write buffer, gzip-compressing on the fly if asked.
+    """
+    if compress:
+        raw = gzip.GzipFile(filename, 'wb', compresslevel=6)
+        return io.TextIOWrapper(io.BufferedWriter(raw, EXPORT_BUFFER_SIZE), encoding='utf-8', newline='')
+    return open(filename, 'w', encoding='utf-8', newline='', buffering=EXPORT_BUFFER_SIZE)
+
+
+def write_contacts(f: TextIO, contacts: Iterable[Contact], fmt: str = 'csv',
+                   fields: Optional[List[str]] = None) -> int:
+    """
+    Stream contacts through the chosen formatter. Returns the number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    fields = list(fields or EXPORT_FIELDS)
+    formatter = EXPORT_FORMATS[fmt](f, fields)
+    formatter.write_header()
+
+    count = 0
+    for contact in contacts:
+        formatter.write_row({field: getattr(contact, field) for field in fields})
+        count += 1
+    return count
+
+
+def iter_contact_chunks(contacts: Iterable[Contact], fmt: str = 'csv', fields: Optional[List[str]] = None,
+                        chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Format contacts like write_contacts, yielding the text in pieces of about chunk_rows rows
+    (the first piece also holds the header) instead of writing to a file.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    fields = list(fields or EXPORT_FIELDS)
+    buffer = io.StringIO(newline='')
+    formatter = EXPORT_FORMATS[fmt](buffer, fields)
+    formatter.write_header()
+
+    rows = 0
+    for contact in contacts:
+        formatter.write_row({field: getattr(contact, field) for field in fields})
+        rows += 1
+        if rows % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,180 @@
+"""
+Duplicate contact detection and merging.
+
+Contacts are grouped by blocking keys (normalized phone, lowercased email and
+folded full name) and pairs are scored only inside a block, so the cost grows
+with the number of contacts instead of the number of pairs. Pairs that reach
+the threshold are joined into clusters with union-find, and each cluster
+becomes one merge proposal that keeps its oldest contact. Blocks larger than
+MAX_BLOCK_SIZE are split by the other two keys instead of being skipped.
+"""
+
+import unicodedata
+from typing import Callable, Dict, List, Iterable, Tuple
+from models import Contact
+
+MERGE_THRESHOLD = 0.6
+# Khối lớn hơn mức này (ví dụ tên rất phổ biến) không so từng cặp mà được chia nhỏ
+# theo hai khóa còn lại (xem find_duplicates)
+MAX_BLOCK_SIZE = 100
+WEIGHTS = {'phone': 0.4, 'email': 0.4, 'name': 0.3}
+# Thứ tự các khóa chặn trong keys/blocks của find_duplicates
+KEY_NAMES = ('phone', 'email', 'name')
+
+
+def fold_text(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace: 'Nguyễn  Văn' -> 'nguyen van'."""
+    text = text.lower()
+    if not text.isascii():
+        text = text.replace('đ', 'd')
+        text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+    return ' '.join(text.split())
+
+
+def fold_name(first_name: str, last_name: str) -> str:
+    return fold_text(f"{first_name} {last_name}")
+
+
+def _name_similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+def find_duplicates(contacts: Iterable[Contact], phone_key: Callable[[Contact], str],
+                    threshold: float = MERGE_THRESHOLD, max_block_size: int = MAX_BLOCK_SIZE) -> List[Dict]:
+    """
+    Return merge proposals [{"keep", "duplicates", "score", "reasons"}] sorted by "keep".
+    phone_key maps a contact to its normalized phone number.
+    """
+    contacts = list(contacts)
+    keys: List[Tuple[str, str, str]] = []
+    # Mỗi khóa giữ một vị trí (int) cho tới khi có va chạm mới tạo danh sách,
+    # nên chỉ các khối có từ 2 liên hệ trở lên tốn bộ nhớ và được duyệt
+    blocks: Tuple[Dict[str, object], ...] = ({}, {}, {})
+    collisions: List[Tuple[int, List[int]]] = []
+    for position, contact in enumerate(contacts):
+        contact_keys = (phone_key(contact) or '', contact.email.strip().lower(),
+                        fold_name(contact.first_name, contact.last_name))
+        keys.append(contact_keys)
+        for key_index, (block, key) in enumerate(zip(blocks, contact_keys)):
+            if not key:
+                continue
+            members = block.get(key)
+            if members is None:
+                block[key] = position
+            elif type(members) is int:
+                members = block[key] = [members, position]
+                collisions.append((key_index, members))
+            else:
+                members.append(position)
+
+    parent = list(range(len(contacts)))
+
+    def find(position: int) -> int:
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    scored = set()
+    pair_scores: Dict[int, float] = {}
+    pair_reasons: Dict[int, set] = {}
+
+    def link(a: int, b: int):
+        if (a, b) in scored:
+            return
+        scored.add((a, b))
+
+        (phone_a, email_a, name_a), (phone_b, email_b, name_b) = keys[a], keys[b]
+        reasons = []
+        score = 0.0
+        if phone_a and phone_a == phone_b:
+            score += WEIGHTS['phone']
+            reasons.append('phone')
+        if email_a and email_a == email_b:
+            score += WEIGHTS['email']
+            reasons.append('email')
+        name_score = _name_similarity(name_a, name_b)
+        if name_score:
+            score += WEIGHTS['name'] * name_score
+            reasons.append('name')
+        if score < threshold:
+            return
+
+        root_a, root_b = find(a), find(b)
+        root = min(root_a, root_b)
+        parent[max(root_a, root_b)] = root
+        for old_root in (root_a, root_b):
+            if old_root != root:
+                pair_scores[root] = max(pair_scores.get(root, 0.0), pair_scores.pop(old_root, 0.0))
+                pair_reasons.setdefault(root, set()).update(pair_reasons.pop(old_root, set()))
+        pair_scores[root] = max(pair_scores.get(root, 0.0), score)
+        pair_reasons.setdefault(root, set()).update(reasons)
+
+    for key_index, members in collisions:
+        if len(members) <= max_block_size:
+            for i, a in enumerate(members):
+                for b in members[i + 1:]:
+                    link(a, b)
+            continue
+        # Khối quá lớn: chia theo từng khóa còn lại. Các liên hệ trong một khối con trùng hai khóa,
+        # nên mỗi cặp đạt ít nhất tổng trọng số của hai khóa đó; khi ngưỡng không vượt mức này
+        # thì khối con vẫn quá lớn chỉ cần nối các cặp liền kề, ngược lại phải so mọi cặp
+        for other_index in range(3):
+            if other_index == key_index:
+                continue
+            chain_only = threshold <= WEIGHTS[KEY_NAMES[key_index]] + WEIGHTS[KEY_NAMES[other_index]]
+            sub_blocks: Dict[str, List[int]] = {}
+            for position in members:
+                if keys[position][other_index]:
+                    sub_blocks.setdefault(keys[position][other_index], []).append(position)
+            for sub_members in sub_blocks.values():
+                if len(sub_members) <= max_block_size or not chain_only:
+                    for i, a in enumerate(sub_members):
+                        for b in sub_members[i + 1:]:
+                            link(a, b)
+                else:
+                    for a, b in zip(sub_members, sub_members[1:]):
+                        link(a, b)
+
+    clusters: Dict[int, List[int]] = {}
+    for root in pair_scores:
+        clusters[root] = []
+    for position in range(len(contacts)):
+        root = find(position)
+        if root in clusters:
+            clusters[root].append(contacts[position].contact_id)
+
+    proposals = []
+    for root, contact_ids in clusters.items():
+        contact_ids.sort()
+        proposals.append({
+            "keep": contact_ids[0],
+            "duplicates": contact_ids[1:],
+            "score": round(pair_scores[root], 3),
+            "reasons": sorted(pair_reasons[root]),
+        })
+    proposals.sort(key=lambda proposal: proposal["keep"])
+    return proposals
+
+
+def merge_contact_fields(keep: Contact, duplicate: Contact):
+    """
+    Fold a duplicate into the contact being kept: fill empty fields, append
+    distinct notes, adopt a non-default group and keep the favorite mark.
+    """
+    changes = {}
+    for field in ('last_name', 'email', 'address'):
+        if not getattr(keep, field) and getattr(duplicate, field):
+            changes[field] = getattr(duplicate, field)
+    if keep.group == 'General' and duplicate.group != 'General':
+        changes['group'] = duplicate.group
+    if duplicate.notes and duplicate.notes not in keep.notes:
+        changes['notes'] = f"{keep.notes}; {duplicate.notes}" if keep.notes else duplicate.notes
+    keep.update_contact(**changes)
+    if duplicate.is_favorite:
+        keep.mark_as_favorite()
@@ -0,0 +1,74 @@
+"""
+Write-behind support for PhoneBookSystem.
+
+In write-behind mode mutations only queue their changes and return; a
+BackgroundFlusher thread calls PhoneBookSystem.flush() every `interval` seconds,
+or as soon as it is woken because the number of pending changes reached the
+flush threshold. Repeated changes to one contact are coalesced so a flush
+writes each record once.
+"""
+
+import threading
+from typing import Callable, List
+
+FLUSH_INTERVAL = 1.0
+FLUSH_THRESHOLD = 1000
+
+
+def coalesce_contact_changes(changes: List[tuple]) -> List[tuple]:
+    """
+    Keep one (op, contact) change per contact, in order of its first change:
+    add + updates -> add, add + ... + delete -> nothing, updates + delete -> delete.
+    The contact object is written as it is at flush time, so updates carry the latest values.
+    """
+    first_ops = {}
+    latest = {}
+    for op, contact in changes:
+        first_ops.setdefault(contact.contact_id, op)
+        latest[contact.contact_id] = (op, contact)
+
+    coalesced = []
+    for contact_id, (op, contact) in latest.items():
+        if first_ops[contact_id] == 'A':
+            if op == 'D':
+                continue
+            op = 'A'
+        coalesced.append((op, contact))
+    return coalesced
+
+
+class BackgroundFlusher:
+    """
+    Daemon thread that runs flush() every `interval` seconds, or sooner after wake().
+    Errors are printed and the thread keeps running; stop() does not flush by itself.
+    """
+
+    def __init__(self, flush: Callable[[], None], interval: float = FLUSH_INTERVAL):
+        self._flush = flush
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="phonebook-flusher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping:
+                break
+            try:
+                self._flush()
+            except Exception as e:
+                print(f"Background flush error: {e}")
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
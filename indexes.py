@@ -0,0 +1,738 @@
+import re
+import json
+import base64
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Set, Optional, Iterable, Iterator, Callable
+from models import Contact
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'phone', 'email', 'address', 'group', 'notes')
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    Per-user inverted index from lowercased trigrams to contact IDs.
+    Used to narrow down substring searches before confirming each candidate.
+    A user's postings are built on their first search (build_user); until then
+    add() skips that user's contacts, so loading or restoring stays cheap.
+    """
+
+    def __init__(self, fields: Iterable[str] = SEARCH_FIELDS):
+        self.fields = tuple(fields)
+        # user_id -> trigram -> set of contact_id (only users that have been built)
+        self._postings: Dict[int, Dict[str, Set[int]]] = {}
+        # contact_id -> trigrams indexed for it, so removal does not need old field values
+        self._contact_grams: Dict[int, Set[str]] = {}
+
+    def _contact_trigrams(self, contact: Contact) -> Set[str]:
+        grams = set()
+        for field in self.fields:
+            text = str(getattr(contact, field)).lower()
+            grams.update([text[i:i + 3] for i in range(len(text) - 2)])
+        return grams
+
+    def has_user(self, user_id: int) -> bool:
+        return user_id in self._postings
+
+    def build_user(self, user_id: int, contacts: Iterable[Contact]):
+        """Index all of one user's contacts in one pass."""
+        postings = self._postings[user_id] = {}
+        contact_grams = self._contact_grams
+        for contact in contacts:
+            grams = self._contact_trigrams(contact)
+            contact_grams[contact.contact_id] = grams
+            contact_id = contact.contact_id
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids is None:
+                    postings[gram] = {contact_id}
+                else:
+                    ids.add(contact_id)
+
+    def add(self, contact: Contact):
+        postings = self._postings.get(contact.user_id)
+        if postings is None:
+            return
+        grams = self._contact_trigrams(contact)
+        for gram in grams:
+            postings.setdefault(gram, set()).add(contact.contact_id)
+        self._contact_grams[contact.contact_id] = grams
+
+    def remove(self, contact: Contact):
+        grams = self._contact_grams.pop(contact.contact_id, None)
+        postings = self._postings.get(contact.user_id)
+        if not grams or postings is None:
+            return
+        for gram in grams:
+            ids = postings.get(gram)
+            if ids is None:
+                continue
+            ids.discard(contact.contact_id)
+            if not ids:
+                del postings[gram]
+
+    def clear(self):
+        self._postings.clear()
+        self._contact_grams.clear()
+
+    def candidates(self, user_id: int, keyword_lower: str) -> Optional[Set[int]]:
+        """
+        Return the IDs of contacts that contain every trigram of the keyword,
+        or None when the keyword is too short to use the index.
+        The user must have been built with build_user first.
+        """
+        query_grams = trigrams(keyword_lower)
+        if not query_grams:
+            return None
+
+        postings = self._postings.get(user_id, {})
+        lists = []
+        for gram in query_grams:
+            ids = postings.get(gram)
+            if not ids:
+                return set()
+            lists.append(ids)
+
+        lists.sort(key=len)
+        result = set(lists[0])
+        for ids in lists[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+
+def encode_cursor(value) -> str:
+    """Wrap a position (int or key tuple) into an opaque page cursor."""
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str], shapes: tuple = (int,)):
+    """
+    Unwrap a page cursor and check it against the accepted shapes: int, or a tuple of
+    element types/fixed values (see CURSOR_SHAPES). Raises ValueError for any other value,
+    so a forged cursor never reaches the bisect comparisons.
+    """
+    if not cursor:
+        return None
+    value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if isinstance(value, list):
+        value = tuple(value)
+    if not any(_matches_shape(value, shape) for shape in shapes):
+        raise ValueError("Invalid page cursor")
+    return value
+
+
+def _matches_shape(value, shape) -> bool:
+    if isinstance(shape, type):
+        # bool là lớp con của int nhưng không phải vị trí hợp lệ
+        return type(value) is shape
+    if isinstance(shape, tuple):
+        return (isinstance(value, tuple) and len(value) == len(shape)
+                and all(_matches_shape(item, item_shape) for item, item_shape in zip(value, shape)))
+    return type(value) is type(shape) and value == shape
+
+
+def _updated_key(contact: Contact) -> tuple:
+    # Timestamp đã gói thành số nguyên giữ đúng thứ tự của chuỗi ISO, nên so sánh trực tiếp
+    # mà không cần giải mã; các giá trị không gói được (hiếm) xếp trước.
+    value = contact._updated_at
+    if type(value) is int:
+        return (1, value, contact.contact_id)
+    return (0, value or '', contact.contact_id)
+
+
+# Khóa sắp xếp: (hàm tạo khóa, duyệt ngược). contact_id ở cuối để khóa luôn duy nhất.
+SORT_ORDERS: Dict[str, tuple] = {
+    'name': (lambda c: (c.first_name.lower(), c.last_name.lower(), c.contact_id), False),
+    'last_name': (lambda c: (c.last_name.lower(), c.first_name.lower(), c.contact_id), False),
+    'updated': (_updated_key, True),
+}
+
+# Dạng cursor hợp lệ của từng thứ tự, để cursor luôn so sánh được với các khóa trong danh sách
+CURSOR_SHAPES: Dict[str, tuple] = {
+    'name': ((str, str, int),),
+    'last_name': ((str, str, int),),
+    'updated': ((1, int, int), (0, str, int)),
+}
+
+
+class SortedContactIndex:
+    """
+    Per-user sorted lists of contact keys for each order in SORT_ORDERS,
+    maintained with bisect on add/remove so listings never re-sort.
+    """
+
+    def __init__(self, orders: Dict[str, tuple] = SORT_ORDERS):
+        self.orders = orders
+        # order -> user_id -> sorted list of keys
+        self._keys: Dict[str, Dict[int, List[tuple]]] = {name: {} for name in orders}
+        # order -> contact_id -> key currently stored for it
+        self._contact_keys: Dict[str, Dict[int, tuple]] = {name: {} for name in orders}
+
+    def add(self, contact: Contact):
+        for name, (key_func, _) in self.orders.items():
+            key = key_func(contact)
+            insort(self._keys[name].setdefault(contact.user_id, []), key)
+            self._contact_keys[name][contact.contact_id] = key
+
+    def remove(self, contact: Contact):
+        for name in self.orders:
+            key = self._contact_keys[name].pop(contact.contact_id, None)
+            keys = self._keys[name].get(contact.user_id)
+            if key is None or keys is None:
+                continue
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+
+    def clear(self):
+        for name in self.orders:
+            self._keys[name].clear()
+            self._contact_keys[name].clear()
+
+    def rebuild(self, contacts: Iterable[Contact]):
+        """Replace the index contents with `contacts`, sorting each user's keys once."""
+        self.clear()
+        contacts = list(contacts)
+        for name, (key_func, _) in self.orders.items():
+            keys_by_user = self._keys[name]
+            contact_keys = self._contact_keys[name]
+            for contact in contacts:
+                key = key_func(contact)
+                contact_keys[contact.contact_id] = key
+                keys = keys_by_user.get(contact.user_id)
+                if keys is None:
+                    keys_by_user[contact.user_id] = [key]
+                else:
+                    keys.append(key)
+            for keys in keys_by_user.values():
+                keys.sort()
+
+    def remove_many(self, contacts: Iterable[Contact]):
+        """Remove many contacts, filtering each affected list once instead of deleting one by one."""
+        contacts = list(contacts)
+        for name in self.orders:
+            doomed_by_user: Dict[int, Set[tuple]] = {}
+            for contact in contacts:
+                key = self._contact_keys[name].pop(contact.contact_id, None)
+                if key is not None:
+                    doomed_by_user.setdefault(contact.user_id, set()).add(key)
+            for user_id, doomed in doomed_by_user.items():
+                keys = self._keys[name].get(user_id)
+                if keys is not None:
+                    keys[:] = [key for key in keys if key not in doomed]
+
+    def add_many(self, contacts: Iterable[Contact]):
+        """Add many contacts, re-sorting each affected list once (cheap on nearly sorted data)."""
+        contacts = list(contacts)
+        for name, (key_func, _) in self.orders.items():
+            touched = set()
+            for contact in contacts:
+                key = key_func(contact)
+                self._contact_keys[name][contact.contact_id] = key
+                self._keys[name].setdefault(contact.user_id, []).append(key)
+                touched.add(contact.user_id)
+            for user_id in touched:
+                self._keys[name][user_id].sort()
+
+    def iter_ids(self, user_id: int, order: str = 'name') -> Iterator[int]:
+        for key in self.iter_keys(user_id, order):
+            yield key[-1]
+
+    def iter_keys(self, user_id: int, order: str = 'name', after: Optional[tuple] = None) -> Iterator[tuple]:
+        """
+        Yield keys in list order, starting just after the key `after` (a page cursor)
+        without visiting the keys before it.
+        """
+        if order not in self.orders:
+            raise ValueError(f"Unknown sort order: {order}")
+        keys = self._keys[order].get(user_id, [])
+        if self.orders[order][1]:
+            start = len(keys) if after is None else bisect_left(keys, after)
+            for position in range(start - 1, -1, -1):
+                yield keys[position]
+        else:
+            start = 0 if after is None else bisect_right(keys, after)
+            for position in range(start, len(keys)):
+                yield keys[position]
+
+
+class ContactCounters:
+    """
+    Counts of contacts, favorites and blocked contacts per user and per (user, group),
+    plus overall totals, kept up to date on every add/remove so summaries are O(1).
+    """
+
+    def __init__(self):
+        # user_id -> {'contacts', 'favorites', 'blocked'}
+        self._users: Dict[int, Dict[str, int]] = {}
+        # user_id -> group -> contact count
+        self._groups: Dict[int, Dict[str, int]] = {}
+        self._totals = self._empty()
+        self._group_totals: Dict[str, int] = {}
+
+    @staticmethod
+    def _empty() -> Dict[str, int]:
+        return {'contacts': 0, 'favorites': 0, 'blocked': 0}
+
+    def _apply(self, contact: Contact, delta: int):
+        counts = self._users.get(contact.user_id)
+        if counts is None:
+            counts = self._users[contact.user_id] = self._empty()
+        for target in (counts, self._totals):
+            target['contacts'] += delta
+            if contact.is_favorite:
+                target['favorites'] += delta
+            if contact.is_blocked:
+                target['blocked'] += delta
+
+        for groups in (self._groups.setdefault(contact.user_id, {}), self._group_totals):
+            count = groups.get(contact.group, 0) + delta
+            if count:
+                groups[contact.group] = count
+            else:
+                groups.pop(contact.group, None)
+
+    def add(self, contact: Contact):
+        self._apply(contact, 1)
+
+    def remove(self, contact: Contact):
+        self._apply(contact, -1)
+
+    def rebuild(self, contacts: Iterable[Contact]):
+        self.__init__()
+        for contact in contacts:
+            self._apply(contact, 1)
+
+    def user_counts(self, user_id: int) -> Dict:
+        counts = dict(self._users.get(user_id) or self._empty())
+        counts['groups'] = dict(self._groups.get(user_id, {}))
+        return counts
+
+    def group_count(self, user_id: int, group: str) -> int:
+        return self._groups.get(user_id, {}).get(group, 0)
+
+    def totals(self) -> Dict:
+        counts = dict(self._totals)
+        counts['groups'] = dict(self._group_totals)
+        return counts
+
+    def snapshot(self) -> Dict:
+        """Per-user counts (users without contacts omitted) and totals, for comparisons."""
+        users = {user_id: self.user_counts(user_id) for user_id, counts in self._users.items()
+                 if counts['contacts']}
+        return {'users': users, 'totals': self.totals()}
+
+
+class PhoneIndex:
+    """
+    Hash index from normalized phone number to contact IDs, per user and across all users.
+    """
+
+    def __init__(self, normalize: Callable[[str], str]):
+        self.normalize = normalize
+        # user_id -> normalized number -> set of contact_id
+        self._by_user: Dict[int, Dict[str, Set[int]]] = {}
+        # normalized number -> set of contact_id (all users)
+        self._global: Dict[str, Set[int]] = {}
+        # contact_id -> normalized number currently indexed for it
+        self._contact_keys: Dict[int, str] = {}
+
+    def add(self, contact: Contact):
+        key = self.normalize(contact.phone)
+        if not key:
+            return
+        self._contact_keys[contact.contact_id] = key
+        self._by_user.setdefault(contact.user_id, {}).setdefault(key, set()).add(contact.contact_id)
+        self._global.setdefault(key, set()).add(contact.contact_id)
+
+    def remove(self, contact: Contact):
+        key = self._contact_keys.pop(contact.contact_id, None)
+        if key is None:
+            return
+        for postings in (self._by_user.get(contact.user_id, {}), self._global):
+            ids = postings.get(key)
+            if ids is not None:
+                ids.discard(contact.contact_id)
+                if not ids:
+                    del postings[key]
+
+    def rebuild(self, contacts: Iterable[Contact]):
+        self._by_user, self._global, self._contact_keys = {}, {}, {}
+        for contact in contacts:
+            self.add(contact)
+
+    def key_for(self, contact_id: int) -> Optional[str]:
+        """The normalized number indexed for a contact."""
+        return self._contact_keys.get(contact_id)
+
+    def lookup(self, phone: str, user_id: Optional[int] = None) -> Set[int]:
+        """Contact IDs whose number matches `phone`, for one user or (user_id None) for everyone."""
+        key = self.normalize(phone)
+        postings = self._global if user_id is None else self._by_user.get(user_id, {})
+        return postings.get(key, set())
+
+
+_NON_DIGITS = re.compile(r'\D')
+# Chuỗi chỉ gồm các ký tự này được hiểu là số điện thoại khi gợi ý
+_PHONE_CHARS = frozenset("0123456789+-(). ")
+
+
+class PrefixIndex:
+    """
+    Per-user sorted array of (term, contact_id) pairs for search-as-you-type completion.
+    Terms are the folded first, last and full name plus the phone digits, both as stored
+    and in normalized international form. A prefix query is one bisect followed by a
+    scan of the matching run, so its cost follows the number of results.
+    Like TrigramIndex, a user's array is built on first use (build_user).
+    """
+
+    def __init__(self, fold: Callable[[str], str], normalize_phone: Callable[[str], str]):
+        self.fold = fold
+        self.normalize_phone = normalize_phone
+        # user_id -> sorted list of (term, contact_id) (only users that have been built)
+        self._terms: Dict[int, List[tuple]] = {}
+        # contact_id -> terms indexed for it, so removal does not need old field values
+        self._contact_terms: Dict[int, Set[str]] = {}
+
+    def _terms_for(self, contact: Contact) -> Set[str]:
+        first, last = self.fold(contact.first_name), self.fold(contact.last_name)
+        terms = {first, last, f"{first} {last}".strip(),
+                 _NON_DIGITS.sub('', contact.phone),
+                 self.normalize_phone(contact.phone).lstrip('+')}
+        terms.discard('')
+        return terms
+
+    def has_user(self, user_id: int) -> bool:
+        return user_id in self._terms
+
+    def build_user(self, user_id: int, contacts: Iterable[Contact]):
+        """Index all of one user's contacts with a single sort."""
+        entries = []
+        for contact in contacts:
+            terms = self._contact_terms[contact.contact_id] = self._terms_for(contact)
+            entries.extend((term, contact.contact_id) for term in terms)
+        entries.sort()
+        self._terms[user_id] = entries
+
+    def add(self, contact: Contact):
+        entries = self._terms.get(contact.user_id)
+        if entries is None:
+            return
+        terms = self._contact_terms[contact.contact_id] = self._terms_for(contact)
+        for term in terms:
+            insort(entries, (term, contact.contact_id))
+
+    def remove(self, contact: Contact):
+        terms = self._contact_terms.pop(contact.contact_id, None)
+        entries = self._terms.get(contact.user_id)
+        if not terms or entries is None:
+            return
+        for term in terms:
+            entry = (term, contact.contact_id)
+            position = bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+
+    def remove_many(self, contacts: Iterable[Contact]):
+        """Remove many contacts, filtering each affected array once."""
+        doomed_by_user: Dict[int, Set[tuple]] = {}
+        for contact in contacts:
+            terms = self._contact_terms.pop(contact.contact_id, None)
+            if terms and contact.user_id in self._terms:
+                doomed = doomed_by_user.setdefault(contact.user_id, set())
+                doomed.update((term, contact.contact_id) for term in terms)
+        for user_id, doomed in doomed_by_user.items():
+            entries = self._terms[user_id]
+            entries[:] = [entry for entry in entries if entry not in doomed]
+
+    def add_many(self, contacts: Iterable[Contact]):
+        """Add many contacts, re-sorting each affected array once."""
+        touched = set()
+        for contact in contacts:
+            entries = self._terms.get(contact.user_id)
+            if entries is None:
+                continue
+            terms = self._contact_terms[contact.contact_id] = self._terms_for(contact)
+            entries.extend((term, contact.contact_id) for term in terms)
+            touched.add(contact.user_id)
+        for user_id in touched:
+            self._terms[user_id].sort()
+
+    def clear(self):
+        self._terms.clear()
+        self._contact_terms.clear()
+
+    def query_for(self, prefix: str) -> str:
+        """Fold a typed prefix the way terms are folded: digits only if it looks like a phone number."""
+        if prefix.strip() and set(prefix) <= _PHONE_CHARS:
+            return _NON_DIGITS.sub('', prefix)
+        return self.fold(prefix)
+
+    def iter_matches(self, user_id: int, prefix: str) -> Iterator[int]:
+        """
+        Yield each contact ID with a term starting with `prefix` once, in term order.
+        The user must have been built with build_user first.
+        """
+        query = self.query_for(prefix)
+        if not query:
+            return
+        entries = self._terms.get(user_id, [])
+        seen = set()
+        for position in range(bisect_left(entries, (query,)), len(entries)):
+            term, contact_id = entries[position]
+            if not term.startswith(query):
+                break
+            if contact_id not in seen:
+                seen.add(contact_id)
+                yield contact_id
+
+
+# Ký tự đệm hai đầu từ khi lấy trigram, để chữ cái đầu/cuối cũng nằm trong đủ 3 trigram
+_FUZZY_PAD = '$$'
+
+
+def auto_max_distance(length: int) -> int:
+    """Default typo allowance for a query token: 0 up to 2 characters, 1 up to 5, else 2."""
+    if length <= 2:
+        return 0
+    return 1 if length <= 5 else 2
+
+
+def _char_masks(pattern: str) -> Dict[str, int]:
+    """Bit i of masks[ch] is set when pattern[i] == ch."""
+    masks: Dict[str, int] = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def _bounded_distance(masks: Dict[str, int], length: int, text: str, limit: int) -> Optional[int]:
+    """
+    Levenshtein distance between a non-empty pattern (given by its _char_masks and length)
+    and text, or None once it must exceed `limit`. Bit-parallel (Myers/Hyyrö): one column of
+    the DP table is a pair of bit vectors, so each text character costs a few integer operations.
+    """
+    if abs(length - len(text)) > limit:
+        return None
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    positive, negative, score = full, 0, length
+    remaining = len(text)
+    for char in text:
+        equal = masks.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        up = negative | (~(horizontal | positive) & full)
+        down = positive & horizontal
+        if up & last:
+            score += 1
+        elif down & last:
+            score -= 1
+        remaining -= 1
+        # Mỗi ký tự còn lại giảm khoảng cách nhiều nhất 1
+        if score - remaining > limit:
+            return None
+        up = ((up << 1) | 1) & full
+        down = (down << 1) & full
+        positive = down | (~(vertical | up) & full)
+        negative = up & vertical
+    return score if score <= limit else None
+
+
+def edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """Levenshtein distance between a and b, or None when it exceeds `limit`."""
+    if not a:
+        return len(b) if len(b) <= limit else None
+    return _bounded_distance(_char_masks(a), len(a), b, limit)
+
+
+class FuzzyIndex:
+    """
+    Per-user typo-tolerant index over folded name tokens.
+    Each distinct token is stored once with the contact IDs that use it, plus an
+    inverted index from its padded trigrams to tokens. A token within edit distance
+    d of a query keeps all but at most 3*d of the query's trigrams, so candidates
+    come from the few rarest query trigrams only and are checked with a bounded
+    Levenshtein distance; the cost follows the vocabulary near the query, not the
+    number of contacts. Like TrigramIndex, a user is built on first use (build_user).
+    """
+
+    def __init__(self, fold: Callable[[str], str]):
+        self.fold = fold
+        # user_id -> token -> set of contact_id (only users that have been built)
+        self._tokens: Dict[int, Dict[str, Set[int]]] = {}
+        # user_id -> padded trigram -> tokens containing it
+        self._grams: Dict[int, Dict[str, Set[str]]] = {}
+        # user_id -> token length -> tokens, for queries too short for the trigram filter
+        self._lengths: Dict[int, Dict[int, Set[str]]] = {}
+        # user_id -> token -> number of distinct padded trigrams
+        self._gram_counts: Dict[int, Dict[str, int]] = {}
+        # contact_id -> tokens indexed for it, so removal does not need old field values
+        self._contact_tokens: Dict[int, Set[str]] = {}
+
+    @staticmethod
+    def _token_grams(token: str) -> Set[str]:
+        return trigrams(f"{_FUZZY_PAD}{token}{_FUZZY_PAD}")
+
+    def _tokens_for(self, contact: Contact) -> Set[str]:
+        return set(self.fold(f"{contact.first_name} {contact.last_name}").split())
+
+    def has_user(self, user_id: int) -> bool:
+        return user_id in self._tokens
+
+    def build_user(self, user_id: int, contacts: Iterable[Contact]):
+        self._tokens[user_id], self._grams[user_id], self._lengths[user_id] = {}, {}, {}
+        self._gram_counts[user_id] = {}
+        for contact in contacts:
+            self._add_to_user(user_id, contact)
+
+    def _add_to_user(self, user_id: int, contact: Contact):
+        tokens = self._tokens[user_id]
+        contact_tokens = self._contact_tokens[contact.contact_id] = self._tokens_for(contact)
+        for token in contact_tokens:
+            ids = tokens.get(token)
+            if ids is None:
+                ids = tokens[token] = set()
+                # Từ mới trong kho từ vựng của người dùng: thêm vào chỉ mục trigram và độ dài
+                grams = self._grams[user_id]
+                token_grams = self._token_grams(token)
+                for gram in token_grams:
+                    grams.setdefault(gram, set()).add(token)
+                self._lengths[user_id].setdefault(len(token), set()).add(token)
+                self._gram_counts[user_id][token] = len(token_grams)
+            ids.add(contact.contact_id)
+
+    def add(self, contact: Contact):
+        if contact.user_id in self._tokens:
+            self._add_to_user(contact.user_id, contact)
+
+    def remove(self, contact: Contact):
+        contact_tokens = self._contact_tokens.pop(contact.contact_id, None)
+        tokens = self._tokens.get(contact.user_id)
+        if not contact_tokens or tokens is None:
+            return
+        for token in contact_tokens:
+            ids = tokens.get(token)
+            if ids is None:
+                continue
+            ids.discard(contact.contact_id)
+            if ids:
+                continue
+            # Không còn liên hệ nào dùng từ này: gỡ khỏi kho từ vựng
+            del tokens[token]
+            grams = self._grams[contact.user_id]
+            for gram in self._token_grams(token):
+                holders = grams.get(gram)
+                if holders is not None:
+                    holders.discard(token)
+                    if not holders:
+                        del grams[gram]
+            self._lengths[contact.user_id][len(token)].discard(token)
+            del self._gram_counts[contact.user_id][token]
+
+    def clear(self):
+        self._tokens.clear()
+        self._grams.clear()
+        self._lengths.clear()
+        self._gram_counts.clear()
+        self._contact_tokens.clear()
+
+    def match_tokens(self, user_id: int, query: str, max_distance: int) -> Dict[str, int]:
+        """Indexed tokens within `max_distance` edits of a folded query token -> their distance."""
+        tokens = self._tokens.get(user_id, {})
+        if max_distance <= 0:
+            return {query: 0} if query in tokens else {}
+
+        query_grams = self._token_grams(query)
+        min_shared = len(query_grams) - 3 * max_distance
+        postings = self._grams.get(user_id, {})
+        if min_shared > 0:
+            # Token đủ gần phải chứa ít nhất min_shared trigram của truy vấn, nên chắc chắn
+            # nằm trong một trong (len - min_shared + 1) danh sách hiếm nhất
+            gram_sets = sorted((postings.get(gram, ()) for gram in query_grams), key=len)
+            candidates = set().union(*gram_sets[:len(gram_sets) - min_shared + 1])
+        else:
+            gram_sets = []
+            lengths = self._lengths.get(user_id, {})
+            candidates = set()
+            for length in range(len(query) - max_distance, len(query) + max_distance + 1):
+                candidates.update(lengths.get(length, ()))
+
+        gram_counts = self._gram_counts.get(user_id, {})
+        masks = _char_masks(query)
+        matches = {}
+        shortest, longest = len(query) - max_distance, len(query) + max_distance
+        for token in candidates:
+            if not shortest <= len(token) <= longest:
+                continue
+            if gram_sets:
+                shared = sum([token in grams for grams in gram_sets])
+                # Điều kiện đối xứng: token cũng giữ tất cả trừ tối đa 3*d trigram của chính nó
+                if shared < min_shared or shared < gram_counts[token] - 3 * max_distance:
+                    continue
+            distance = _bounded_distance(masks, len(query), token, max_distance)
+            if distance is not None:
+                matches[token] = distance
+        return matches
+
+    def query_limits(self, query: str, max_distance: Optional[int] = None) -> Dict[str, int]:
+        """Folded query tokens -> edits allowed for each (auto_max_distance when max_distance is None)."""
+        return {token: auto_max_distance(len(token)) if max_distance is None else max_distance
+                for token in self.fold(query).split()}
+
+    def search(self, user_id: int, query: str, max_distance: Optional[int] = None,
+               max_total: Optional[int] = None) -> Dict[int, int]:
+        """
+        Contact IDs matching every token of `query` -> summed edit distance, where each query
+        token counts its closest name token (see query_limits for the allowed edits).
+        max_total additionally drops contacts whose summed distance exceeds it.
+        The user must have been built with build_user first.
+        """
+        tokens = self._tokens.get(user_id, {})
+        matched = []
+        for query_token, limit in self.query_limits(query, max_distance).items():
+            if max_total is not None:
+                limit = min(limit, max_total)
+            matches = self.match_tokens(user_id, query_token, limit)
+            if not matches:
+                return {}
+            matched.append((sum(len(tokens[token]) for token in matches), matches))
+        if not matched:
+            return {}
+
+        # Bắt đầu từ từ truy vấn khớp ít liên hệ nhất; các từ sau chỉ lọc tập kết quả đó
+        matched.sort(key=lambda item: item[0])
+        results: Dict[int, int] = {}
+        for token, distance in matched[0][1].items():
+            for contact_id in tokens[token]:
+                best = results.get(contact_id)
+                if best is None or distance < best:
+                    results[contact_id] = distance
+        for size, matches in matched[1:]:
+            narrowed = {}
+            if size <= 4 * len(results):
+                # Duyệt danh sách liên hệ của các từ khớp, giữ những liên hệ đã có trong kết quả
+                for token, distance in matches.items():
+                    for contact_id in tokens[token]:
+                        total = results.get(contact_id)
+                        if total is not None:
+                            best = narrowed.get(contact_id)
+                            if best is None or total + distance < best:
+                                narrowed[contact_id] = total + distance
+            else:
+                # Kết quả đã nhỏ: kiểm tra trực tiếp các từ của từng liên hệ
+                for contact_id, total in results.items():
+                    distances = [matches[token] for token in self._contact_tokens[contact_id] if token in matches]
+                    if distances:
+                        narrowed[contact_id] = total + min(distances)
+            results = narrowed
+            if not results:
+                break
+        if max_total is not None and len(matched) > 1:
+            results = {contact_id: total for contact_id, total in results.items() if total <= max_total}
+        return results
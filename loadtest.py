@@ -0,0 +1,152 @@
+"""
+Load-test client for the PhoneBook HTTP/JSON API (server.py)
+Run: python loadtest.py [--url http://127.0.0.1:8080] [--connections 32] [--requests 20000] [--pipeline 1]
+
+Registers (or reuses) a test account, seeds it with contacts, then keeps
+`connections` keep-alive connections busy with a mix of list, search and
+get-by-id requests, sending `pipeline` requests back to back on each connection.
+Reports requests/sec and p50/p99 latency.
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import http.client
+from urllib.parse import urlsplit
+from typing import List, Tuple
+
+TEST_USER = {"username": "loadtest", "email": "loadtest@example.com", "password": "loadtest123"}
+
+
+def setup_account(host: str, port: int, seed: int) -> Tuple[str, List[int]]:
+    """
+    Register and log in the test user, add `seed` contacts and return (token, contact IDs).
+    """
+    conn = http.client.HTTPConnection(host, port)
+
+    def request(method, path, data=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        conn.request(method, path, json.dumps(data) if data is not None else None, headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+
+    request("POST", "/register", TEST_USER)  # 409 nếu tài khoản đã tồn tại
+    status, body = request("POST", "/login", {"email": TEST_USER["email"], "password": TEST_USER["password"]})
+    if status != 200:
+        raise RuntimeError(f"Login failed: {body}")
+    token = body["token"]
+
+    contact_ids = []
+    for i in range(seed):
+        status, body = request("POST", "/contacts", {"first_name": f"Load{i}", "last_name": f"Test{i % 50}",
+                                                     "phone": f"09{i:08d}"}, token)
+        if status == 201:
+            contact_ids.append(body["contact_id"])
+    conn.close()
+    return token, contact_ids
+
+
+def build_request(path: str, host: str, token: str) -> bytes:
+    return (f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Authorization: Bearer {token}\r\n\r\n").encode('latin-1')
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode('latin-1').split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def worker(host: str, port: int, requests: List[bytes], pipeline: int,
+                 latencies: List[float], errors: List[int]):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for start in range(0, len(requests), pipeline):
+            batch = requests[start:start + pipeline]
+            sent = time.perf_counter()
+            writer.write(b"".join(batch))
+            await writer.drain()
+            for _ in batch:
+                status = await read_response(reader)
+                latencies.append(time.perf_counter() - sent)
+                if status >= 400:
+                    errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run_load(host: str, port: int, token: str, contact_ids: List[int],
+                   connections: int, total_requests: int, pipeline: int) -> dict:
+    rng = random.Random(1)
+    paths = []
+    for i in range(total_requests):
+        kind = i % 3
+        if kind == 0:
+            paths.append("/contacts?limit=20")
+        elif kind == 1:
+            paths.append(f"/search?q=Test{rng.randrange(50)}&limit=20")
+        else:
+            paths.append(f"/contacts/{rng.choice(contact_ids)}" if contact_ids else "/favorites")
+    requests = [build_request(path, host, token) for path in paths]
+
+    latencies: List[float] = []
+    errors: List[int] = []
+    per_connection = [requests[i::connections] for i in range(connections)]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(host, port, chunk, pipeline, latencies, errors)
+                           for chunk in per_connection if chunk))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "elapsed": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PhoneBook API load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--pipeline", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=200, help="contacts to add before the run")
+    args = parser.parse_args(argv)
+
+    url = urlsplit(args.url)
+    host, port = url.hostname or "127.0.0.1", url.port or 80
+    token, contact_ids = setup_account(host, port, args.seed)
+    results = asyncio.run(run_load(host, port, token, contact_ids,
+                                   args.connections, args.requests, args.pipeline))
+
+    print(f"LOAD TEST ({args.connections} connections, pipeline {args.pipeline})")
+    print(f"  requests : {results['requests']} ({results['errors']} errors) in {results['elapsed']:.2f} s")
+    print(f"  rate     : {results['requests_per_sec']:.1f} requests/sec")
+    print(f"  latency  : p50 {results['p50_ms']:.2f} ms | p99 {results['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -20,6 +20,7 @@ def main():
         # Start user interface
         ui = PhoneBookUI()
         ui.main_menu()
+        ui.system.close()
         print("Thank you for using the system!")
     except Exception as e:
         print(f"Application startup error: {e}")
@@ -0,0 +1,271 @@
+"""
+Opt-in instrumentation for PhoneBookSystem.
+
+Metrics.instrument(system) shadows the system's public methods and its
+_load_*/_save_*/_persist_* helpers with timing wrappers stored on the instance;
+uninstrument(system) deletes them again. A system without metrics therefore
+runs the plain class methods and pays nothing.
+
+Per method it records:
+    calls and failures (an exception or a False result)
+    a latency histogram (LATENCY_BUCKETS, seconds)
+    bytes read/written by the calling thread (Linux /proc/thread-self/io;
+    0 on other platforms)
+Timings and bytes include nested instrumented calls.
+"""
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import threading
+import functools
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = "phonebook"
+PROC_IO_FILE = "/proc/thread-self/io"
+# Các hàm nội bộ nạp/ghi dữ liệu cũng được đo
+INSTRUMENTED_PREFIXES = ('_load_', '_save_', '_persist_')
+# Các phương thức công khai không đo (bật/tắt chính lớp đo)
+EXCLUDED_METHODS = frozenset({'enable_metrics', 'disable_metrics'})
+
+
+class MethodStats:
+    __slots__ = ('calls', 'failures', 'total_seconds', 'max_seconds', 'buckets',
+                 'bytes_read', 'bytes_written')
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # Một ô cho mỗi cận trên trong LATENCY_BUCKETS, ô cuối là +Inf
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def quantile(self, q: float) -> float:
+        """Estimate a latency quantile as the upper bound of the bucket that holds it."""
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'total_seconds': self.total_seconds,
+            'mean_seconds': self.total_seconds / self.calls if self.calls else 0.0,
+            'max_seconds': self.max_seconds,
+            'p50_seconds': self.quantile(0.50),
+            'p99_seconds': self.quantile(0.99),
+            'buckets': {str(bound): count for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.buckets)},
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+        }
+
+
+class ThreadIOCounter:
+    """
+    Cumulative bytes read/written by the current thread, from /proc/thread-self/io.
+    Each thread keeps its own descriptor; the bytes of reading the counter file
+    itself are subtracted so nested samples stay exact.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @staticmethod
+    def available() -> bool:
+        return os.path.exists(PROC_IO_FILE)
+
+    def sample(self) -> Tuple[int, int]:
+        local = self._local
+        fd = getattr(local, 'fd', None)
+        if fd is None:
+            fd = local.fd = os.open(PROC_IO_FILE, os.O_RDONLY)
+            local.overhead = 0
+        data = os.pread(fd, 512, 0)
+        read = written = 0
+        for line in data.split(b'\n'):
+            if line.startswith(b'rchar:'):
+                read = int(line[6:])
+            elif line.startswith(b'wchar:'):
+                written = int(line[6:])
+        read -= local.overhead
+        local.overhead += len(data)
+        return read, written
+
+
+class Metrics:
+    """
+    Call counts, latency histograms and I/O bytes per instrumented method,
+    exportable as Prometheus text or a JSON snapshot, plus a cProfile toggle.
+    """
+
+    def __init__(self, track_io: bool = True):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, MethodStats] = {}
+        self._installed: Dict[int, List[str]] = {}
+        self._io = ThreadIOCounter() if track_io and ThreadIOCounter.available() else None
+        self._profiler: Optional[cProfile.Profile] = None
+
+    # --- Gắn/gỡ lớp đo ---
+
+    @staticmethod
+    def instrumented_methods(cls) -> List[str]:
+        """Public methods of cls plus its INSTRUMENTED_PREFIXES helpers."""
+        names = set()
+        for klass in cls.__mro__:
+            if klass is object:
+                continue
+            for name, value in vars(klass).items():
+                if not callable(value) or isinstance(value, (staticmethod, classmethod, type)):
+                    continue
+                public = not name.startswith('_') and name not in EXCLUDED_METHODS
+                if public or name.startswith(INSTRUMENTED_PREFIXES):
+                    names.add(name)
+        return sorted(names)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._installed)
+
+    def instrument(self, target):
+        if id(target) in self._installed:
+            return
+        names = self.instrumented_methods(type(target))
+        for name in names:
+            setattr(target, name, self.wrap(name, getattr(target, name)))
+        self._installed[id(target)] = names
+
+    def uninstrument(self, target):
+        for name in self._installed.pop(id(target), []):
+            target.__dict__.pop(name, None)
+
+    def wrap(self, name: str, func):
+        io_counter = self._io
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            before = io_counter.sample() if io_counter else None
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = result is False
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                read = written = 0
+                if before is not None:
+                    after = io_counter.sample()
+                    read, written = after[0] - before[0], after[1] - before[1]
+                self.record(name, elapsed, failed, read, written)
+        return wrapper
+
+    def record(self, name: str, seconds: float, failed: bool = False,
+               bytes_read: int = 0, bytes_written: int = 0):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = MethodStats()
+            stats.calls += 1
+            stats.failures += failed
+            stats.total_seconds += seconds
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+            stats.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.bytes_read += bytes_read
+            stats.bytes_written += bytes_written
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    # --- Xuất số liệu ---
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            methods = {name: stats.to_dict() for name, stats in sorted(self._stats.items())}
+        return {
+            'enabled': self.enabled,
+            'profiling': self.profiling,
+            'io_tracking': self._io is not None,
+            'methods': methods,
+        }
+
+    def top_slow(self, limit: int = 10, key: str = 'p99_seconds') -> List[Dict]:
+        """Methods ordered by `key` (p99_seconds, mean_seconds, max_seconds or total_seconds), slowest first."""
+        rows = [dict(stats, method=name) for name, stats in self.snapshot()['methods'].items()]
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return rows[:limit]
+
+    def to_prometheus(self, prefix: str = METRIC_PREFIX) -> str:
+        with self._lock:
+            items = [(name, stats.to_dict()) for name, stats in sorted(self._stats.items())]
+
+        lines = []
+
+        def family(metric: str, kind: str, help_text: str):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+
+        family("method_calls_total", "counter", "Calls of instrumented PhoneBookSystem methods.")
+        for name, stats in items:
+            lines.append(f'{prefix}_method_calls_total{{method="{name}"}} {stats["calls"]}')
+        family("method_failures_total", "counter", "Calls that raised or returned False.")
+        for name, stats in items:
+            lines.append(f'{prefix}_method_failures_total{{method="{name}"}} {stats["failures"]}')
+        family("method_duration_seconds", "histogram", "Method latency in seconds.")
+        for name, stats in items:
+            cumulative = 0
+            for bound, count in stats["buckets"].items():
+                cumulative += count
+                lines.append(f'{prefix}_method_duration_seconds_bucket{{method="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_method_duration_seconds_sum{{method="{name}"}} {stats["total_seconds"]:.9f}')
+            lines.append(f'{prefix}_method_duration_seconds_count{{method="{name}"}} {stats["calls"]}')
+        family("method_read_bytes_total", "counter", "Bytes read by the calling thread during the method.")
+        for name, stats in items:
+            lines.append(f'{prefix}_method_read_bytes_total{{method="{name}"}} {stats["bytes_read"]}')
+        family("method_written_bytes_total", "counter", "Bytes written by the calling thread during the method.")
+        for name, stats in items:
+            lines.append(f'{prefix}_method_written_bytes_total{{method="{name}"}} {stats["bytes_written"]}')
+        return "\n".join(lines) + "\n"
+
+    # --- cProfile ---
+
+    @property
+    def profiling(self) -> bool:
+        return self._profiler is not None
+
+    def start_profile(self):
+        """Start a cProfile capture of the calling thread."""
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop_profile(self, path: Optional[str] = None, limit: int = 20) -> str:
+        """
+        Stop the capture and return the top `limit` functions by cumulative time.
+        The raw stats are also dumped to `path` (pstats format) when given.
+        """
+        profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            return ""
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
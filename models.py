@@ -1,9 +1,85 @@
+import os
+import sys
+import hmac
 import json
 import hashlib
 import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
+
+# Mốc thời gian để lưu timestamp dạng số nguyên (micro giây) thay vì chuỗi ISO
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+def encode_timestamp(value: Optional[str]) -> Union[int, str, None]:
+    """
+    Pack a naive ISO timestamp into integer microseconds since the epoch.
+    Values that would not round-trip to the exact same string are kept as-is.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    if moment.tzinfo is not None:
+        return value
+    packed = (moment - _EPOCH) // _MICROSECOND
+    if decode_timestamp(packed) != value:
+        return value
+    return packed
+
+def decode_timestamp(value: Union[int, str, None]) -> Optional[str]:
+    if isinstance(value, int):
+        return (_EPOCH + datetime.timedelta(microseconds=value)).isoformat()
+    return value
+
+# Băm mật khẩu: PBKDF2-HMAC có salt, số vòng lặp điều chỉnh được.
+# Định dạng: $PBKDF2$<digest>$<iterations>$<salt hex>$<hash hex>
+PBKDF2_PREFIX = '$PBKDF2$'
+LEGACY_SHA_PREFIX = '$SHA$'
+KDF_DIGEST = 'sha256'
+KDF_ITERATIONS = 100000
+KDF_SALT_BYTES = 16
+
+def is_password_hash(value: str) -> bool:
+    return value.startswith(PBKDF2_PREFIX) or value.startswith(LEGACY_SHA_PREFIX) or len(value) == 64
+
+def hash_password(password: str, iterations: Optional[int] = None, salt: Optional[bytes] = None) -> str:
+    iterations = iterations or KDF_ITERATIONS
+    salt = salt or os.urandom(KDF_SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac(KDF_DIGEST, password.encode(), salt, iterations)
+    return f"{PBKDF2_PREFIX}{KDF_DIGEST}${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password_hash(password_hash: str, password: str) -> bool:
+    """
+    Check a password against a PBKDF2 hash or a legacy unsalted SHA-256 hash.
+    Module-level so it can be shipped to a process pool.
+    """
+    if password_hash.startswith(PBKDF2_PREFIX):
+        try:
+            digest_name, iterations, salt, expected = password_hash[len(PBKDF2_PREFIX):].split('$')
+            digest = hashlib.pbkdf2_hmac(digest_name, password.encode(), bytes.fromhex(salt), int(iterations))
+        except ValueError:
+            return False
+        return hmac.compare_digest(digest.hex(), expected)
+    
+    if password_hash.startswith(LEGACY_SHA_PREFIX):
+        password_hash = password_hash[len(LEGACY_SHA_PREFIX):]
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), password_hash)
+
+def password_needs_rehash(password_hash: str) -> bool:
+    if not password_hash.startswith(PBKDF2_PREFIX):
+        return True
+    try:
+        digest_name, iterations = password_hash[len(PBKDF2_PREFIX):].split('$')[:2]
+        return digest_name != KDF_DIGEST or int(iterations) < KDF_ITERATIONS
+    except ValueError:
+        return True
 
 class User:
+    __slots__ = ('user_id', 'username', 'email', 'reset_token', 'reset_token_expiry',
+                 'password_hash', 'role', '_created_at', '_last_login', 'is_active')
+    
     def __init__(self, user_id: int, username: str, email: str, password: str, role: str = "user", 
                  created_at: str = None, last_login: str = None, is_active: bool = True):
         self.user_id = user_id
@@ -12,21 +88,40 @@ class User:
         self.reset_token = None
         self.reset_token_expiry = None
         
-        if password.startswith('$SHA$') or len(password) == 64:
+        if is_password_hash(password):
             self.password_hash = password
         else:
             self.password_hash = self._hash_password(password)
         
-        self.role = role
+        self.role = sys.intern(role)
         self.created_at = created_at or datetime.datetime.now().isoformat()
         self.last_login = last_login
         self.is_active = is_active
     
+    @property
+    def created_at(self) -> Optional[str]:
+        return decode_timestamp(self._created_at)
+    
+    @created_at.setter
+    def created_at(self, value: Optional[str]):
+        self._created_at = encode_timestamp(value)
+    
+    @property
+    def last_login(self) -> Optional[str]:
+        return decode_timestamp(self._last_login)
+    
+    @last_login.setter
+    def last_login(self, value: Optional[str]):
+        self._last_login = encode_timestamp(value)
+    
     def _hash_password(self, password: str) -> str:
-        return hashlib.sha256(password.encode()).hexdigest()
+        return hash_password(password)
     
     def verify_password(self, password: str) -> bool:
-        return self.password_hash == self._hash_password(password)
+        return verify_password_hash(self.password_hash, password)
+    
+    def needs_rehash(self) -> bool:
+        return password_needs_rehash(self.password_hash)
     
     def update_profile(self, **kwargs):
         allowed_fields = ['username', 'email']
@@ -76,6 +171,14 @@ class User:
         return user
 
 class Contact:
+    # Bố cục gọn: không có __dict__, tên nhóm được intern, hai cờ boolean gói
+    # trong một số nguyên và timestamp lưu dạng số nguyên
+    __slots__ = ('contact_id', 'user_id', 'first_name', 'last_name', 'phone', 'email',
+                 'address', '_group', 'notes', '_flags', '_created_at', '_updated_at')
+    
+    FAVORITE = 1
+    BLOCKED = 2
+    
     def __init__(self, contact_id: int, user_id: int, first_name: str, last_name: str, 
                  phone: str, email: str = "", address: str = "", group: str = "General", 
                  notes: str = "", is_favorite: bool = False, is_blocked: bool = False,
@@ -89,11 +192,50 @@ class Contact:
         self.address = address
         self.group = group
         self.notes = notes
-        self.is_favorite = is_favorite
-        self.is_blocked = is_blocked
+        self._flags = (self.FAVORITE if is_favorite else 0) | (self.BLOCKED if is_blocked else 0)
         self.created_at = created_at or datetime.datetime.now().isoformat()
         self.updated_at = updated_at or self.created_at
     
+    @property
+    def group(self) -> str:
+        return self._group
+    
+    @group.setter
+    def group(self, value: str):
+        self._group = sys.intern(value) if type(value) is str else value
+    
+    @property
+    def is_favorite(self) -> bool:
+        return bool(self._flags & self.FAVORITE)
+    
+    @is_favorite.setter
+    def is_favorite(self, value: bool):
+        self._flags = self._flags | self.FAVORITE if value else self._flags & ~self.FAVORITE
+    
+    @property
+    def is_blocked(self) -> bool:
+        return bool(self._flags & self.BLOCKED)
+    
+    @is_blocked.setter
+    def is_blocked(self, value: bool):
+        self._flags = self._flags | self.BLOCKED if value else self._flags & ~self.BLOCKED
+    
+    @property
+    def created_at(self) -> Optional[str]:
+        return decode_timestamp(self._created_at)
+    
+    @created_at.setter
+    def created_at(self, value: Optional[str]):
+        self._created_at = encode_timestamp(value)
+    
+    @property
+    def updated_at(self) -> Optional[str]:
+        return decode_timestamp(self._updated_at)
+    
+    @updated_at.setter
+    def updated_at(self, value: Optional[str]):
+        self._updated_at = encode_timestamp(value)
+    
     def update_contact(self, **kwargs):
         allowed_fields = ['first_name', 'last_name', 'phone', 'email', 'address', 'group', 'notes']
         for field, value in kwargs.items():
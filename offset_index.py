@@ -0,0 +1,104 @@
+import os
+import mmap
+from typing import Dict, List, Optional
+
+
+class ContactOffsetIndex:
+    """
+    Byte offsets of every record in contacts.txt, keyed by contact_id and by user_id.
+    Lines are read back on demand through a read-only mmap of the file.
+    The index can be cached in a sidecar file that is trusted only while the
+    data file's size and mtime are unchanged.
+    """
+
+    def __init__(self, contacts_file: str, sidecar_file: Optional[str] = None):
+        self.contacts_file = contacts_file
+        self.sidecar_file = sidecar_file
+        self.by_contact: Dict[int, int] = {}
+        self.owner: Dict[int, int] = {}
+        self.by_user: Dict[int, List[int]] = {}
+        self._file = None
+        self._mmap = None
+
+    def _signature(self) -> str:
+        stat = os.stat(self.contacts_file)
+        return f"{stat.st_size} {stat.st_mtime_ns}"
+
+    def _add(self, contact_id: int, user_id: int, offset: int):
+        self.by_contact[contact_id] = offset
+        self.owner[contact_id] = user_id
+        self.by_user.setdefault(user_id, []).append(contact_id)
+
+    def build(self):
+        """
+        Load the sidecar if it is current, otherwise scan contacts.txt once and rewrite it.
+        """
+        self.close()
+        self.by_contact, self.owner, self.by_user = {}, {}, {}
+        if not os.path.exists(self.contacts_file):
+            return
+        if not self._load_sidecar():
+            self._scan()
+            self._save_sidecar()
+
+    def _scan(self):
+        offset = 0
+        with open(self.contacts_file, 'rb') as f:
+            for line in f:
+                if line.strip() and not line.startswith(b'#'):
+                    try:
+                        parts = line.split(b'|', 2)
+                        if len(parts) >= 3:
+                            self._add(int(parts[0]), int(parts[1]), offset)
+                    except ValueError as e:
+                        print(f"Error indexing contact line: {e}")
+                offset += len(line)
+
+    def _load_sidecar(self) -> bool:
+        if not self.sidecar_file or not os.path.exists(self.sidecar_file):
+            return False
+        try:
+            with open(self.sidecar_file, 'r', encoding='utf-8') as f:
+                if f.readline().strip() != f"# {self._signature()}":
+                    return False
+                for line in f:
+                    contact_id, user_id, offset = line.split()
+                    self._add(int(contact_id), int(user_id), int(offset))
+            return True
+        except Exception as e:
+            print(f"Error reading contact index: {e}")
+            self.by_contact, self.owner, self.by_user = {}, {}, {}
+            return False
+
+    def _save_sidecar(self):
+        if not self.sidecar_file:
+            return
+        try:
+            with open(self.sidecar_file, 'w', encoding='utf-8') as f:
+                f.write(f"# {self._signature()}\n")
+                for contact_id, offset in self.by_contact.items():
+                    f.write(f"{contact_id} {self.owner[contact_id]} {offset}\n")
+        except Exception as e:
+            print(f"Error writing contact index: {e}")
+
+    def read_line(self, contact_id: int) -> Optional[str]:
+        offset = self.by_contact.get(contact_id)
+        if offset is None:
+            return None
+        if self._mmap is None:
+            if os.path.getsize(self.contacts_file) == 0:
+                return None
+            self._file = open(self.contacts_file, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        end = self._mmap.find(b'\n', offset)
+        if end == -1:
+            end = len(self._mmap)
+        return self._mmap[offset:end].decode('utf-8').strip()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,46 @@
+"""
+Phone number normalization for the caller-ID index.
+
+Numbers are reduced to an E.164-style key ('+' followed by digits):
+    +84 912-345-678     -> +84912345678
+    0084 912 345 678    -> +84912345678   (00 international prefix)
+    0912 345 678        -> +84912345678   (trunk prefix 0 + default country code)
+    84912345678         -> +84912345678   (country code without '+', see below)
+    912345678           -> +84912345678   (bare digits are a national number)
+Bare digits that start with the default country code are taken as international
+when at least MIN_NATIONAL_DIGITS digits follow it and the total fits E.164
+(MAX_E164_DIGITS); shorter numbers stay national.
+Extensions (x12, ext. 12, ;12, ,12, #12) are dropped. Inputs with fewer than
+MIN_DIGITS digits are returned as plain digits since they are not dialable numbers.
+"""
+
+import re
+
+DEFAULT_COUNTRY_CODE = "84"
+MIN_DIGITS = 3
+MIN_NATIONAL_DIGITS = 8
+MAX_E164_DIGITS = 15
+
+_EXTENSION = re.compile(r'(?i)\s*(?:ext\.?|x|#|,|;).*$')
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(phone: str, default_country_code: str = DEFAULT_COUNTRY_CODE) -> str:
+    number = _EXTENSION.sub('', str(phone).strip())
+    international = number.startswith('+')
+    digits = _NON_DIGITS.sub('', number)
+    if len(digits) < MIN_DIGITS:
+        return digits
+
+    if international:
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if digits.startswith('0'):
+        return '+' + default_country_code + digits[1:]
+    # Số đã có mã quốc gia nhưng thiếu '+' (thường gặp ở caller ID): không thêm mã lần nữa
+    if (digits.startswith(default_country_code)
+            and len(digits) - len(default_country_code) >= MIN_NATIONAL_DIGITS
+            and len(digits) <= MAX_E164_DIGITS):
+        return '+' + digits
+    return '+' + default_country_code + digits
@@ -0,0 +1,626 @@
+"""
+Asyncio HTTP/JSON API for PhoneBook Management System
+Run: python server.py [--host 127.0.0.1] [--port 8080] [--data-dir data] [--metrics] [--write-behind]
+
+Each request carries its own session (Authorization: Bearer <token> from POST /login)
+instead of relying on the single PhoneBookSystem.current_user; tokens expire after
+SESSION_TTL seconds without use and at most MAX_SESSIONS are kept. PhoneBookSystem is not
+thread-safe, so every call into it runs on one dedicated worker thread, which also
+does the blocking persistence; the event loop only parses requests and writes
+responses, and password hashing runs on a separate thread pool. Connections are kept
+alive and pipelined requests are answered in order.
+
+Endpoints:
+    POST   /register                      {username, email, password}
+    POST   /login                         {email, password} -> {token, user}
+    POST   /logout
+    GET    /contacts                      ?limit&cursor&order&favorites=1
+    POST   /contacts                      {first_name, last_name, phone, email, address, group, notes}
+    GET    /contacts/<id>
+    PUT    /contacts/<id>                 {fields to change}
+    DELETE /contacts/<id>
+    POST   /contacts/<id>/favorite        toggle favorite
+    GET    /search                        ?q&limit&cursor
+    GET    /favorites                     ?limit&cursor
+    GET    /lookup                        ?phone&all=1 (caller ID; all=1 searches every user, admin only)
+    GET    /complete                      ?prefix&limit (search-as-you-type on names and phone digits)
+    GET    /fuzzy                         ?q&distance&limit (typo-tolerant name search, closest first)
+    POST   /import                        CSV body with a header line
+    GET    /export                        ?format=csv|jsonl|txt (streamed with chunked encoding)
+    GET    /admin/users                   ?limit&cursor
+    POST   /admin/users/<id>/activate
+    POST   /admin/users/<id>/deactivate
+    GET    /metrics                       Prometheus text (admin; recorded with --metrics)
+    GET    /metrics.json                  JSON snapshot (admin)
+"""
+
+import os
+import re
+import sys
+import json
+import asyncio
+import time
+import secrets
+import argparse
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict, Optional, Callable, AsyncIterator, Tuple
+from models import User, Contact, verify_password_hash
+from system import PhoneBookSystem
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 30
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+# Phiên không dùng quá SESSION_TTL giây thì hết hạn; tối đa MAX_SESSIONS phiên (bỏ phiên cũ nhất)
+SESSION_TTL = 24 * 60 * 60
+MAX_SESSIONS = 100000
+
+CONTACT_FIELDS = ('first_name', 'last_name', 'phone', 'email', 'address', 'group', 'notes')
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'txt': 'text/plain; charset=utf-8',
+}
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 411: "Length Required",
+    413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body', 'version')
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes = b"",
+                 version: str = "HTTP/1.1"):
+        url = urlsplit(target)
+        self.method = method
+        self.version = version
+        self.path = url.path
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Dict:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Request body must be a JSON object")
+        return data
+
+    def token(self) -> Optional[str]:
+        auth = self.headers.get('authorization', '')
+        return auth[7:].strip() if auth.lower().startswith('bearer ') else None
+
+
+class Response:
+    __slots__ = ('status', 'body', 'content_type')
+
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = 'application/json'):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+    def encode(self, keep_alive: bool) -> bytes:
+        head = (f"HTTP/1.1 {self.status} {REASONS.get(self.status, 'OK')}\r\n"
+                f"Content-Type: {self.content_type}\r\n"
+                f"Content-Length: {len(self.body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode('latin-1') + self.body
+
+
+class StreamingResponse:
+    """
+    A response whose body is produced piece by piece: sent with chunked transfer
+    encoding to HTTP/1.1 clients, or as raw bytes up to connection close otherwise.
+    """
+    __slots__ = ('status', 'chunks', 'content_type')
+
+    def __init__(self, chunks: AsyncIterator[bytes], status: int = 200, content_type: str = 'application/json'):
+        self.status = status
+        self.chunks = chunks
+        self.content_type = content_type
+
+    def encode_head(self, chunked: bool, keep_alive: bool) -> bytes:
+        framing = "Transfer-Encoding: chunked\r\n" if chunked else ""
+        return (f"HTTP/1.1 {self.status} {REASONS.get(self.status, 'OK')}\r\n"
+                f"Content-Type: {self.content_type}\r\n{framing}"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1')
+
+
+def json_response(data, status: int = 200) -> Response:
+    return Response(status, json.dumps(data).encode('utf-8'))
+
+
+def user_to_json(user: User) -> Dict:
+    data = user.to_dict()
+    for secret in ('password_hash', 'reset_token', 'reset_token_expiry'):
+        data.pop(secret, None)
+    return data
+
+
+def page_to_json(page: Dict, to_json: Callable = Contact.to_dict) -> Dict:
+    return {"items": [to_json(item) for item in page["items"]], "next_cursor": page["next_cursor"]}
+
+
+class PhoneBookServer:
+    """
+    Routes HTTP requests to a PhoneBookSystem with per-request sessions.
+    """
+
+    def __init__(self, system: PhoneBookSystem, kdf_workers: Optional[int] = None,
+                 session_ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.system = system
+        # token -> (user_id, lần dùng cuối), theo thứ tự dùng cuối: phiên cũ nhất ở đầu
+        self.sessions: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self._system_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="phonebook")
+        self._kdf_executor = ThreadPoolExecutor(max_workers=kdf_workers or os.cpu_count() or 1,
+                                                thread_name_prefix="phonebook-kdf")
+        self.routes = [
+            ('POST', r'/register', self.register),
+            ('POST', r'/login', self.login),
+            ('POST', r'/logout', self.logout),
+            ('GET', r'/contacts', self.list_contacts),
+            ('POST', r'/contacts', self.add_contact),
+            ('GET', r'/contacts/(\d+)', self.get_contact),
+            ('PUT', r'/contacts/(\d+)', self.edit_contact),
+            ('DELETE', r'/contacts/(\d+)', self.delete_contact),
+            ('POST', r'/contacts/(\d+)/favorite', self.toggle_favorite),
+            ('GET', r'/search', self.search),
+            ('GET', r'/favorites', self.favorites),
+            ('GET', r'/lookup', self.lookup_phone),
+            ('GET', r'/complete', self.complete),
+            ('GET', r'/fuzzy', self.fuzzy_search),
+            ('POST', r'/import', self.import_contacts),
+            ('GET', r'/export', self.export_contacts),
+            ('GET', r'/admin/users', self.list_users),
+            ('POST', r'/admin/users/(\d+)/(activate|deactivate)', self.set_user_active),
+            ('GET', r'/metrics', self.metrics),
+            ('GET', r'/metrics\.json', self.metrics_json),
+        ]
+        self.routes = [(method, re.compile(pattern + r'/?$'), handler) for method, pattern, handler in self.routes]
+
+    # --- Chạy lệnh trên PhoneBookSystem ---
+
+    async def call(self, user_id: Optional[int], func: Callable, *args, **kwargs):
+        """
+        Run func on the system thread with current_user set to the session's user.
+        """
+        def run():
+            user = None
+            if user_id is not None:
+                user = self.system.get_user_by_id(user_id)
+                if user is None or not user.is_active:
+                    raise HttpError(401, "Session is no longer valid")
+            self.system.current_user = user
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.system.current_user = None
+
+        return await asyncio.get_running_loop().run_in_executor(self._system_executor, run)
+
+    def session_user(self, request: Request) -> int:
+        now = time.monotonic()
+        self._expire_sessions(now)
+        token = request.token() or ''
+        session = self.sessions.get(token)
+        if session is None:
+            raise HttpError(401, "Login required")
+        self.sessions[token] = (session[0], now)
+        self.sessions.move_to_end(token)
+        return session[0]
+
+    def _start_session(self, user_id: int) -> str:
+        now = time.monotonic()
+        self._expire_sessions(now)
+        while len(self.sessions) >= self.max_sessions:
+            self.sessions.popitem(last=False)
+        token = secrets.token_urlsafe(32)
+        self.sessions[token] = (user_id, now)
+        return token
+
+    def _expire_sessions(self, now: float):
+        # Phiên xếp theo lần dùng cuối: chỉ cần bỏ từ đầu cho tới phiên còn hạn đầu tiên
+        while self.sessions:
+            token, (_, last_seen) = next(iter(self.sessions.items()))
+            if now - last_seen < self.session_ttl:
+                break
+            del self.sessions[token]
+
+    def close(self):
+        self._system_executor.submit(self.system.close).result()
+        self._system_executor.shutdown()
+        self._kdf_executor.shutdown()
+
+    # --- HTTP ---
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except asyncio.LimitOverrunError:
+                    writer.write(json_response({"error": "Headers too large"}, 431).encode(False))
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                try:
+                    request, keep_alive = await self._read_request(head, reader)
+                    response = await self.dispatch(request)
+                except HttpError as e:
+                    # Lỗi ở tầng giao thức: không tin được phần còn lại của luồng dữ liệu
+                    response, keep_alive = json_response({"error": e.message}, e.status), False
+
+                # Request nối đuôi (pipelining) nằm sẵn trong buffer và được trả lời theo thứ tự
+                if isinstance(response, StreamingResponse):
+                    keep_alive = await self._write_stream(writer, response, request, keep_alive)
+                else:
+                    writer.write(response.encode(keep_alive))
+                    await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _write_stream(self, writer: asyncio.StreamWriter, response: StreamingResponse,
+                            request: Request, keep_alive: bool) -> bool:
+        """
+        Send a streaming response; returns whether the connection can be kept open.
+        """
+        # HTTP/1.0 không hiểu chunked: gửi thẳng dữ liệu rồi đóng kết nối để báo hết nội dung
+        chunked = request.version == "HTTP/1.1"
+        keep_alive = keep_alive and chunked
+        writer.write(response.encode_head(chunked, keep_alive))
+        try:
+            async for chunk in response.chunks:
+                if chunk:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                    await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # Header đã gửi nên không thể trả mã lỗi: đóng kết nối để client thấy nội dung bị cắt
+            print(f"Streaming error on {request.method} {request.path}: {e}")
+            return False
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        return keep_alive
+
+    async def _read_request(self, head: bytes, reader: asyncio.StreamReader):
+        lines = head.decode('latin-1').split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        if 'transfer-encoding' in headers:
+            raise HttpError(411, "Chunked bodies are not supported; send Content-Length")
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "Request body too large")
+        try:
+            body = await reader.readexactly(length) if length else b""
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            raise HttpError(400, "Request body is shorter than Content-Length")
+
+        connection = headers.get('connection', '').lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+        return Request(method.upper(), target, headers, body, version), keep_alive
+
+    async def dispatch(self, request: Request) -> Response:
+        path_matched = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+            path_matched = True
+            if method != request.method:
+                continue
+            try:
+                return await handler(request, *match.groups())
+            except HttpError as e:
+                return json_response({"error": e.message}, e.status)
+            except ValueError as e:
+                return json_response({"error": str(e) or "Invalid request"}, 400)
+            except Exception as e:
+                print(f"Request error on {request.method} {request.path}: {e}")
+                return json_response({"error": "Internal server error"}, 500)
+
+        if path_matched:
+            return json_response({"error": "Method not allowed"}, 405)
+        return json_response({"error": "Not found"}, 404)
+
+    def _page_args(self, request: Request) -> Dict:
+        limit = int(request.query.get('limit', DEFAULT_PAGE_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise HttpError(400, f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        return {"limit": limit, "cursor": request.query.get('cursor') or None}
+
+    # --- Tài khoản ---
+
+    async def register(self, request: Request) -> Response:
+        data = request.json()
+        username, email, password = (str(data.get(key, '')).strip() for key in ('username', 'email', 'password'))
+        if not username or not email or not password:
+            raise HttpError(400, "username, email and password are required")
+        if not await self.call(None, self.system.register_user, username, email, password):
+            raise HttpError(409, "Email already registered")
+        return json_response({"registered": True}, 201)
+
+    async def login(self, request: Request) -> Response:
+        data = request.json()
+        email, password = str(data.get('email', '')), str(data.get('password', ''))
+        user = await self.call(None, self.system.get_user_by_email, email)
+        if user is None or not user.is_active:
+            raise HttpError(401, "Invalid email or password")
+
+        # KDF chạy trên pool riêng để luồng hệ thống vẫn phục vụ các request khác
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(self._kdf_executor, verify_password_hash, user.password_hash, password):
+            raise HttpError(401, "Invalid email or password")
+
+        await self.call(None, self.system.record_login, user, password)
+        token = self._start_session(user.user_id)
+        return json_response({"token": token, "user": user_to_json(user)})
+
+    async def logout(self, request: Request) -> Response:
+        self.session_user(request)
+        self.sessions.pop(request.token(), None)
+        await self.call(None, self.system.flush)
+        return json_response({"logged_out": True})
+
+    # --- Danh bạ ---
+
+    async def list_contacts(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        page = await self.call(user_id, self.system.get_contacts_page, order=request.query.get('order', 'name'),
+                               favorites_only=request.query.get('favorites') in ('1', 'true'),
+                               **self._page_args(request))
+        return json_response(page_to_json(page))
+
+    def _contact_fields(self, data: Dict) -> Dict:
+        return {field: str(data[field]).strip() for field in CONTACT_FIELDS if field in data}
+
+    async def add_contact(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        fields = self._contact_fields(request.json())
+        if not fields.get('first_name') or not fields.get('phone'):
+            raise HttpError(400, "first_name and phone are required")
+
+        def add():
+            if not self.system.add_contact(fields.pop('first_name'), fields.pop('last_name', ''),
+                                           fields.pop('phone'), **fields):
+                return None
+            return self.system.get_contact_by_id(self.system.next_contact_id - 1)
+
+        contact = await self.call(user_id, add)
+        if contact is None:
+            raise HttpError(400, "Could not add contact")
+        return json_response(contact.to_dict(), 201)
+
+    async def get_contact(self, request: Request, contact_id: str) -> Response:
+        contact = await self.call(self.session_user(request), self.system.get_user_contact_by_id, int(contact_id))
+        if contact is None:
+            raise HttpError(404, "Contact not found")
+        return json_response(contact.to_dict())
+
+    async def edit_contact(self, request: Request, contact_id: str) -> Response:
+        user_id = self.session_user(request)
+        fields = self._contact_fields(request.json())
+
+        def edit():
+            if not self.system.edit_contact(int(contact_id), **fields):
+                return None
+            return self.system.get_contact_by_id(int(contact_id))
+
+        contact = await self.call(user_id, edit)
+        if contact is None:
+            raise HttpError(404, "Contact not found")
+        return json_response(contact.to_dict())
+
+    async def delete_contact(self, request: Request, contact_id: str) -> Response:
+        if not await self.call(self.session_user(request), self.system.delete_contact, int(contact_id)):
+            raise HttpError(404, "Contact not found")
+        return json_response({"deleted": True})
+
+    async def toggle_favorite(self, request: Request, contact_id: str) -> Response:
+        result = await self.call(self.session_user(request), self.system.toggle_favorite_contact, int(contact_id))
+        if result is None:
+            raise HttpError(404, "Contact not found")
+        return json_response({"is_favorite": result})
+
+    async def search(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        keyword = request.query.get('q', '').strip()
+        if not keyword:
+            raise HttpError(400, "q is required")
+        page = await self.call(user_id, self.system.search_contacts_page, keyword, **self._page_args(request))
+        return json_response(page_to_json(page))
+
+    async def favorites(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        page = await self.call(user_id, self.system.get_favorite_contacts_page, **self._page_args(request))
+        return json_response(page_to_json(page))
+
+    async def lookup_phone(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        phone = request.query.get('phone', '').strip()
+        if not phone:
+            raise HttpError(400, "phone is required")
+        all_users = request.query.get('all') in ('1', 'true')
+
+        def run():
+            if all_users:
+                self._require_admin()
+            return self.system.lookup_by_phone(phone, all_users)
+
+        contacts = await self.call(user_id, run)
+        return json_response({"items": [contact.to_dict() for contact in contacts]})
+
+    async def complete(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        prefix = request.query.get('prefix', '')
+        limit = self._page_args(request)['limit']
+        contacts = await self.call(user_id, self.system.complete, prefix, limit)
+        return json_response({"items": [contact.to_dict() for contact in contacts]})
+
+    async def fuzzy_search(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        query = request.query.get('q', '').strip()
+        if not query:
+            raise HttpError(400, "q is required")
+        limit = self._page_args(request)['limit']
+        # Không truyền distance: độ sai cho phép tự chọn theo độ dài từng từ
+        max_distance = request.query.get('distance')
+        max_distance = int(max_distance) if max_distance else None
+        if max_distance is not None and not 0 <= max_distance <= 3:
+            raise HttpError(400, "distance must be between 0 and 3")
+        matches = await self.call(user_id, self.system.fuzzy_search, query, max_distance, limit)
+        return json_response({"items": [dict(contact.to_dict(), distance=distance)
+                                        for contact, distance in matches]})
+
+    # --- Nhập/Xuất ---
+
+    async def import_contacts(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+
+        def run_import():
+            fd, path = tempfile.mkstemp(suffix=".csv")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(request.body)
+                return self.system.import_contacts_from_txt(path)
+            finally:
+                os.remove(path)
+
+        return json_response(await self.call(user_id, run_import))
+
+    async def export_contacts(self, request: Request) -> Response:
+        user_id = self.session_user(request)
+        fmt = request.query.get('format', 'csv')
+        if fmt not in EXPORT_CONTENT_TYPES:
+            raise HttpError(400, f"format must be one of {', '.join(EXPORT_CONTENT_TYPES)}")
+
+        chunks = await self.call(user_id, self.system.export_contacts_chunks, fmt)
+        if chunks is None:
+            raise HttpError(404, "No contacts to export")
+
+        async def body():
+            # Mỗi phần được định dạng trên luồng hệ thống, xen kẽ với các request khác
+            while True:
+                chunk = await self.call(user_id, next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk.encode('utf-8')
+
+        return StreamingResponse(body(), 200, EXPORT_CONTENT_TYPES[fmt])
+
+    # --- Quản trị ---
+
+    def _require_admin(self):
+        if self.system.current_user.role != "admin":
+            raise HttpError(403, "Admin access required")
+
+    async def list_users(self, request: Request) -> Response:
+        page_args = self._page_args(request)
+
+        def run():
+            self._require_admin()
+            return self.system.get_users_page(**page_args)
+
+        page = await self.call(self.session_user(request), run)
+        return json_response(page_to_json(page, user_to_json))
+
+    async def set_user_active(self, request: Request, user_id: str, action: str) -> Response:
+        def run():
+            self._require_admin()
+            if action == "activate":
+                return self.system.activate_user(int(user_id))
+            return self.system.deactivate_user(int(user_id))
+
+        if not await self.call(self.session_user(request), run):
+            raise HttpError(404, "User not found")
+        return json_response({"user_id": int(user_id), "is_active": action == "activate"})
+
+    async def metrics(self, request: Request) -> Response:
+        def run():
+            self._require_admin()
+            return self.system.metrics.to_prometheus()
+
+        text = await self.call(self.session_user(request), run)
+        return Response(200, text.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+
+    async def metrics_json(self, request: Request) -> Response:
+        def run():
+            self._require_admin()
+            return self.system.metrics.snapshot()
+
+        return json_response(await self.call(self.session_user(request), run))
+
+
+async def serve(host: str, port: int, data_dir: str, metrics: bool = False, write_behind: bool = False):
+    system = PhoneBookSystem(data_dir=data_dir, metrics=metrics, write_behind=write_behind)
+    app = PhoneBookServer(system)
+    server = await asyncio.start_server(app.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    address = server.sockets[0].getsockname()
+    print(f"PhoneBook API listening on http://{address[0]}:{address[1]}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PhoneBook HTTP/JSON API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--metrics", action="store_true", help="record per-method metrics (GET /metrics)")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="persist in a background thread instead of on every request")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.data_dir, args.metrics, args.write_behind))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
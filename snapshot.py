@@ -0,0 +1,102 @@
+"""
+Lossless binary snapshots of the full users + contacts state.
+
+File layout:
+    MAGIC (8 bytes)
+    for each section (users, then contacts):
+        payload length (8 bytes, little endian) | CRC-32 of payload (4 bytes) | payload
+
+Each payload is a marshal dump of a tuple of per-record tuples holding the raw
+__slots__ values (packed flags and integer timestamps included), so dumping
+and loading does no per-field parsing or formatting.
+"""
+
+import gc
+import sys
+import zlib
+import struct
+import marshal
+from operator import attrgetter
+from typing import List, Tuple
+from models import User, Contact
+from storage import atomic_write
+
+SNAPSHOT_MAGIC = b'PBSNAP\x00\x01'
+SECTION_HEADER = struct.Struct('<QI')
+
+_USER_SLOTS = User.__slots__
+_CONTACT_SLOTS = Contact.__slots__
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _pack_records(records, slots) -> bytes:
+    get_state = attrgetter(*slots)
+    return marshal.dumps(tuple(map(get_state, records)))
+
+
+def _unpack_records(states, cls, slots) -> list:
+    # Gán thẳng qua descriptor của từng slot, bỏ qua các property
+    setters = [getattr(cls, name).__set__ for name in slots]
+    records = []
+    new = object.__new__
+    for state in states:
+        record = new(cls)
+        for setter, value in zip(setters, state):
+            setter(record, value)
+        records.append(record)
+    return records
+
+
+def write_snapshot(path: str, users: List[User], contacts: List[Contact]) -> int:
+    """
+    Write users and contacts to `path` atomically. Returns the file size in bytes.
+    """
+    with atomic_write(path, binary=True) as f:
+        f.write(SNAPSHOT_MAGIC)
+        for payload in (_pack_records(users, _USER_SLOTS), _pack_records(contacts, _CONTACT_SLOTS)):
+            f.write(SECTION_HEADER.pack(len(payload), zlib.crc32(payload)))
+            f.write(payload)
+        size = f.tell()
+    return size
+
+
+def _read_section(f) -> bytes:
+    header = f.read(SECTION_HEADER.size)
+    if len(header) != SECTION_HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    length, checksum = SECTION_HEADER.unpack(header)
+    payload = f.read(length)
+    if len(payload) != length:
+        raise SnapshotError("Snapshot is truncated")
+    if zlib.crc32(payload) != checksum:
+        raise SnapshotError("Snapshot checksum mismatch")
+    return payload
+
+
+def read_snapshot(path: str) -> Tuple[List[User], List[Contact]]:
+    """
+    Load users and contacts from a snapshot, verifying the magic and both checksums.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise SnapshotError("Not a PhoneBook snapshot file")
+        users_payload = _read_section(f)
+        contacts_payload = _read_section(f)
+
+    # Tạo hàng triệu đối tượng không chứa vòng tham chiếu: tạm tắt GC để tránh quét lặp lại
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        users = _unpack_records(marshal.loads(users_payload), User, _USER_SLOTS)
+        contacts = _unpack_records(marshal.loads(contacts_payload), Contact, _CONTACT_SLOTS)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    # Tên nhóm lặp lại rất nhiều: intern lại để các liên hệ dùng chung một chuỗi
+    for contact in contacts:
+        if type(contact._group) is str:
+            contact._group = sys.intern(contact._group)
+    return users, contacts
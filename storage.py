@@ -0,0 +1,696 @@
+"""
+Persistence engines for PhoneBookSystem.
+
+TextStorage keeps the original pipe-delimited users.txt/contacts.txt files
+(optionally with an append-only contacts.log and lazy offset-indexed loading).
+Field values escape '\\', '|' and line breaks with a backslash, so every record
+stays on one line; lines without backslashes read exactly as before.
+SQLiteStorage keeps everything in one stdlib sqlite3 database in WAL mode.
+Full rewrites of the txt files go to a temp file that is fsynced and then
+swapped in with os.replace, so a crash never leaves a truncated data file.
+
+Migrate existing txt data with:
+    python storage.py migrate [data_dir] [db_file]
+"""
+
+import os
+import sys
+import sqlite3
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Iterable
+from models import User, Contact
+from offset_index import ContactOffsetIndex
+
+USERS_HEADER = ("# PhoneBook Users Data\n"
+                "# Format: user_id|username|email|password_hash|role|created_at|last_login|is_active|reset_token|reset_token_expiry\n")
+CONTACTS_HEADER = ("# PhoneBook Contacts Data\n"
+                   "# Format: contact_id|user_id|first_name|last_name|phone|email|address|group|notes|is_favorite|is_blocked|created_at|updated_at\n")
+
+SQLITE_FILENAME = "phonebook.db"
+
+
+@contextmanager
+def atomic_write(path: str, binary: bool = False):
+    """
+    Yield a text (or binary) file that replaces `path` only once it is completely written and fsynced.
+    On error the temp file is removed and `path` is left untouched.
+    """
+    temp_path = path + ".tmp"
+    try:
+        with (open(temp_path, 'wb') if binary else open(temp_path, 'w', encoding='utf-8')) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_directory(os.path.dirname(path) or '.')
+
+
+def fsync_directory(path: str):
+    """Make a rename in `path` durable (no-op where directories cannot be opened, e.g. Windows)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Storage:
+    """
+    Interface shared by the storage engines.
+
+    A contact change is an (op, contact) tuple with op 'A' (add), 'U' (update) or 'D' (delete).
+    Engines with incremental_writes persist such changes without rewriting everything;
+    the others rewrite the whole contact set.
+    """
+
+    incremental_writes = False
+
+    def load_users(self) -> List[User]:
+        raise NotImplementedError
+
+    def save_users(self, users: List[User]):
+        raise NotImplementedError
+
+    def persist_user(self, user: User, users: List[User]):
+        """Persist one changed or new user. Defaults to a full save."""
+        self.save_users(users)
+
+    def persist_users(self, changed: List[User], users: List[User]):
+        """Persist a batch of changed users. Defaults to one full save."""
+        self.save_users(users)
+
+    def load_contacts(self) -> List[Contact]:
+        raise NotImplementedError
+
+    def save_contacts(self, contacts: List[Contact]):
+        raise NotImplementedError
+
+    def persist_contact_changes(self, changes: List[tuple], contacts: List[Contact]):
+        """Persist a batch of contact changes. Defaults to a full save."""
+        self.save_contacts(contacts)
+
+    def compact(self, contacts: List[Contact]):
+        """Fold any pending change log into the main store."""
+
+    # Lazy loading: contacts are fetched one owner at a time
+    def open_lazy(self):
+        raise NotImplementedError
+
+    def load_user_contacts(self, user_id: int) -> List[Contact]:
+        raise NotImplementedError
+
+    def contact_owner(self, contact_id: int) -> Optional[int]:
+        raise NotImplementedError
+
+    def contact_user_ids(self) -> List[int]:
+        raise NotImplementedError
+
+    def max_contact_id(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+_ESCAPES = {'\\': '\\', '|': '|', 'n': '\n', 'r': '\r'}
+
+
+def escape_field(value) -> str:
+    # '\' trước tiên, rồi '|' và xuống dòng: mỗi bản ghi luôn nằm trên đúng một dòng
+    return (str(value).replace('\\', '\\\\').replace('|', '\\|')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def split_fields(line: str) -> List[str]:
+    """Split a record on unescaped '|' and unescape each field."""
+    if '\\' not in line:
+        return line.split('|')
+
+    parts, field = [], []
+    chars = iter(line)
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            field.append(_ESCAPES.get(escaped, escaped))
+        elif char == '|':
+            parts.append(''.join(field))
+            field = []
+        else:
+            field.append(char)
+    parts.append(''.join(field))
+    return parts
+
+
+def parse_user_line(line: str) -> Optional[User]:
+    # Định dạng: user_id|username|email|password_hash|role|created_at|last_login|is_active|reset_token|reset_token_expiry
+    parts = split_fields(line)
+    if len(parts) < 7:
+        return None
+
+    user_data = {
+        'user_id': int(parts[0]),
+        'username': parts[1],
+        'email': parts[2],
+        'password_hash': parts[3],
+        'role': parts[4],
+        'created_at': parts[5] if parts[5] != 'None' else None,
+        'last_login': parts[6] if len(parts) > 6 and parts[6] != 'None' else None,
+        'is_active': parts[7].lower() == 'true' if len(parts) > 7 else True
+    }
+
+    if len(parts) > 8 and parts[8] != 'None':
+        user_data['reset_token'] = parts[8]
+    if len(parts) > 9 and parts[9] != 'None':
+        user_data['reset_token_expiry'] = parts[9]
+
+    return User.from_dict(user_data)
+
+
+def format_user_line(user: User) -> str:
+    user_dict = user.to_dict()
+
+    # Chuẩn bị các giá trị, thay None bằng chuỗi 'None'
+    reset_token = user_dict.get('reset_token', 'None')
+    reset_token_expiry = user_dict.get('reset_token_expiry', 'None')
+    last_login = user_dict.get('last_login', 'None')
+
+    return "|".join(escape_field(value) for value in (
+        user_dict['user_id'], user_dict['username'], user_dict['email'], user_dict['password_hash'],
+        user_dict['role'], user_dict['created_at'], last_login, user_dict['is_active'],
+        reset_token, reset_token_expiry))
+
+
+def parse_contact_line(line: str) -> Optional[Contact]:
+    # Định dạng: contact_id|user_id|first_name|last_name|phone|email|address|group|notes|is_favorite|is_blocked|created_at|updated_at
+    parts = split_fields(line)
+    if len(parts) < 5:
+        return None
+
+    contact_data = {
+        'contact_id': int(parts[0]),
+        'user_id': int(parts[1]),
+        'first_name': parts[2],
+        'last_name': parts[3],
+        'phone': parts[4],
+        'email': parts[5] if len(parts) > 5 else '',
+        'address': parts[6] if len(parts) > 6 else '',
+        'group': parts[7] if len(parts) > 7 else 'General',
+        'notes': parts[8] if len(parts) > 8 else '',
+        'is_favorite': parts[9].lower() == 'true' if len(parts) > 9 else False,
+        'is_blocked': parts[10].lower() == 'true' if len(parts) > 10 else False,
+        'created_at': parts[11] if len(parts) > 11 and parts[11] != 'None' else None,
+        'updated_at': parts[12] if len(parts) > 12 and parts[12] != 'None' else None
+    }
+    return Contact.from_dict(contact_data)
+
+
+def format_contact_line(contact: Contact) -> str:
+    contact_dict = contact.to_dict()
+    return "|".join(escape_field(contact_dict[name]) for name in (
+        'contact_id', 'user_id', 'first_name', 'last_name', 'phone', 'email', 'address', 'group',
+        'notes', 'is_favorite', 'is_blocked', 'created_at', 'updated_at'))
+
+
+def apply_log_ops(by_id: Dict[int, Contact], ops: Iterable[tuple]):
+    for op, contact_id, _, contact in ops:
+        if op == 'D':
+            by_id.pop(contact_id, None)
+        else:
+            by_id[contact_id] = contact
+
+
+class TextStorage(Storage):
+    """
+    The original pipe-delimited txt files.
+
+    With use_contact_log, each contact change appends one record to contacts.log
+    instead of rewriting contacts.txt; the log is folded back into the snapshot
+    once it grows past log_compact_threshold bytes.
+    """
+
+    def __init__(self, data_dir: str = "data", use_contact_log: bool = False,
+                 log_compact_threshold: int = 4 * 1024 * 1024):
+        self.data_dir = data_dir
+        self.users_file = os.path.join(data_dir, "users.txt")
+        self.contacts_file = os.path.join(data_dir, "contacts.txt")
+        self.contacts_log_file = os.path.join(data_dir, "contacts.log")
+        self.contacts_index_file = os.path.join(data_dir, "contacts.idx")
+        self.use_contact_log = use_contact_log
+        self.log_compact_threshold = log_compact_threshold
+        self.lazy = False
+        os.makedirs(data_dir, exist_ok=True)
+
+    @property
+    def incremental_writes(self) -> bool:
+        return self.use_contact_log
+
+    def has_log(self) -> bool:
+        return os.path.exists(self.contacts_log_file)
+
+    def load_users(self) -> List[User]:
+        if os.path.exists(self.users_file):
+            try:
+                users = []
+                with open(self.users_file, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+
+                    for line in lines:
+                        line = line.strip()
+                        if not line or line.startswith('#'):
+                            continue
+
+                        try:
+                            user = parse_user_line(line)
+                            if user is None:
+                                continue
+                            users.append(user)
+
+                        except Exception as e:
+                            print(f"Error loading user from line: {e}")
+                            continue
+
+                return users
+            except Exception as e:
+                print(f"Error reading users file: {e}")
+                return []
+        return []
+
+    def save_users(self, users: List[User]):
+        try:
+            with atomic_write(self.users_file) as f:
+                f.write(USERS_HEADER)
+                for user in users:
+                    f.write(format_user_line(user) + "\n")
+        except Exception as e:
+            print(f"Error saving users: {e}")
+
+    def load_contacts(self) -> List[Contact]:
+        contacts = []
+        if os.path.exists(self.contacts_file):
+            try:
+                with open(self.contacts_file, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+
+                    for line in lines:
+                        line = line.strip()
+                        if not line or line.startswith('#'):
+                            continue
+
+                        try:
+                            contact = parse_contact_line(line)
+                            if contact is None:
+                                continue
+                            contacts.append(contact)
+
+                        except Exception as e:
+                            print(f"Error loading contact from line: {e}")
+                            continue
+
+            except Exception as e:
+                print(f"Error reading contacts file: {e}")
+                contacts = []
+
+        return self._replay_log(contacts)
+
+    def iter_log(self):
+        """
+        Yield (op, contact_id, user_id, contact) for each record of contacts.log.
+        contact is None for deletes.
+        """
+        if not self.has_log():
+            return
+
+        try:
+            with open(self.contacts_log_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if not line or line.startswith('#'):
+                        continue
+
+                    try:
+                        # Định dạng: A|<contact line> , U|<contact line> , D|contact_id|user_id
+                        op, _, record = line.partition('|')
+                        if op in ('A', 'U'):
+                            contact = parse_contact_line(record)
+                            if contact is not None:
+                                yield op, contact.contact_id, contact.user_id, contact
+                        elif op == 'D':
+                            contact_id, user_id = record.split('|')[:2]
+                            yield op, int(contact_id), int(user_id), None
+                    except Exception as e:
+                        print(f"Error replaying contact log line: {e}")
+                        continue
+        except Exception as e:
+            print(f"Error reading contact log: {e}")
+
+    def _replay_log(self, contacts: List[Contact]) -> List[Contact]:
+        """
+        Apply contacts.log on top of the snapshot loaded from contacts.txt.
+        Replay is idempotent: an add for an existing ID overwrites it and a delete
+        of a missing ID is ignored, so a crash during compaction is harmless.
+        """
+        if not self.has_log():
+            return contacts
+
+        by_id = {contact.contact_id: contact for contact in contacts}
+        apply_log_ops(by_id, self.iter_log())
+        return list(by_id.values())
+
+    def save_contacts(self, contacts: List[Contact]):
+        if self.lazy:
+            self._save_contacts_lazy(contacts)
+            return
+
+        try:
+            with atomic_write(self.contacts_file) as f:
+                f.write(CONTACTS_HEADER)
+                for contact in contacts:
+                    f.write(format_contact_line(contact) + "\n")
+        except Exception as e:
+            print(f"Error saving contacts: {e}")
+
+    def persist_contact_changes(self, changes: List[tuple], contacts: List[Contact]):
+        if not self.use_contact_log:
+            self.save_contacts(contacts)
+            return
+
+        try:
+            with open(self.contacts_log_file, 'a', encoding='utf-8') as f:
+                for op, contact in changes:
+                    if op == 'D':
+                        f.write(f"D|{contact.contact_id}|{contact.user_id}\n")
+                    else:
+                        f.write(f"{op}|{format_contact_line(contact)}\n")
+                log_size = f.tell()
+        except Exception as e:
+            print(f"Error writing contact log: {e}")
+            return
+
+        if log_size >= self.log_compact_threshold:
+            self.compact(contacts)
+
+    def compact(self, contacts: List[Contact]):
+        """
+        Fold contacts.log into a fresh contacts.txt snapshot and truncate the log.
+        """
+        self.save_contacts(contacts)
+        try:
+            if self.has_log():
+                os.remove(self.contacts_log_file)
+        except Exception as e:
+            print(f"Error compacting contact log: {e}")
+
+    def open_lazy(self):
+        """
+        Lazy mode: index byte offsets of contacts.txt instead of parsing it, and keep
+        log records aside per user until that user's contacts are first requested.
+        """
+        self.lazy = True
+        self._offset_index = ContactOffsetIndex(self.contacts_file, self.contacts_index_file)
+        self._offset_index.build()
+        self._owner: Dict[int, int] = dict(self._offset_index.owner)
+        self._pending_log_ops: Dict[int, List[tuple]] = {}
+        self._loaded_users = set()
+
+        for op in self.iter_log():
+            _, contact_id, user_id, _ = op
+            self._pending_log_ops.setdefault(user_id, []).append(op)
+            if op[0] == 'D':
+                self._owner.pop(contact_id, None)
+            else:
+                self._owner[contact_id] = user_id
+
+    def _read_user_contacts(self, user_id: int) -> List[Contact]:
+        by_id = {}
+        for contact_id in self._offset_index.by_user.get(user_id, []):
+            try:
+                line = self._offset_index.read_line(contact_id)
+                contact = parse_contact_line(line) if line else None
+                if contact is not None:
+                    by_id[contact_id] = contact
+            except Exception as e:
+                print(f"Error loading contact from line: {e}")
+        apply_log_ops(by_id, self._pending_log_ops.get(user_id, []))
+        return list(by_id.values())
+
+    def load_user_contacts(self, user_id: int) -> List[Contact]:
+        contacts = self._read_user_contacts(user_id)
+        self._pending_log_ops.pop(user_id, None)
+        self._loaded_users.add(user_id)
+        return contacts
+
+    def contact_owner(self, contact_id: int) -> Optional[int]:
+        return self._owner.get(contact_id)
+
+    def contact_user_ids(self) -> List[int]:
+        return list(set(self._offset_index.by_user) | set(self._pending_log_ops))
+
+    def max_contact_id(self) -> int:
+        return max(list(self._owner) + [0])
+
+    def _save_contacts_lazy(self, contacts: List[Contact]):
+        """
+        Rewrite contacts.txt from the loaded contacts plus the contacts of users
+        that were never loaded. Those are copied as raw lines unless they still
+        have log records to apply, then re-index the new file.
+        """
+        temp_file = self.contacts_file + ".tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(CONTACTS_HEADER)
+                for contact in contacts:
+                    f.write(format_contact_line(contact) + "\n")
+
+                for user_id in self.contact_user_ids():
+                    if user_id in self._loaded_users:
+                        continue
+                    if user_id in self._pending_log_ops:
+                        for contact in self._read_user_contacts(user_id):
+                            f.write(format_contact_line(contact) + "\n")
+                    else:
+                        for contact_id in self._offset_index.by_user[user_id]:
+                            f.write(self._offset_index.read_line(contact_id) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._offset_index.close()
+            os.replace(temp_file, self.contacts_file)
+            fsync_directory(self.data_dir)
+            self._pending_log_ops.clear()
+            self._offset_index.build()
+        except Exception as e:
+            print(f"Error saving contacts: {e}")
+
+    def close(self):
+        if self.lazy:
+            self._offset_index.close()
+
+
+class SQLiteStorage(Storage):
+    """
+    Stdlib sqlite3 engine in WAL mode. Every mutation is a single-row statement,
+    and '|' or newlines in any field are stored safely.
+    """
+
+    incremental_writes = True
+
+    USER_COLUMNS = ['user_id', 'username', 'email', 'password_hash', 'role', 'created_at',
+                    'last_login', 'is_active', 'reset_token', 'reset_token_expiry']
+    CONTACT_COLUMNS = ['contact_id', 'user_id', 'first_name', 'last_name', 'phone', 'email',
+                       'address', 'group', 'notes', 'is_favorite', 'is_blocked', 'created_at', 'updated_at']
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            email TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            created_at TEXT,
+            last_login TEXT,
+            is_active INTEGER NOT NULL DEFAULT 1,
+            reset_token TEXT,
+            reset_token_expiry TEXT
+        );
+        CREATE TABLE IF NOT EXISTS contacts (
+            contact_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            first_name TEXT NOT NULL DEFAULT '',
+            last_name TEXT NOT NULL DEFAULT '',
+            phone TEXT NOT NULL,
+            email TEXT NOT NULL DEFAULT '',
+            address TEXT NOT NULL DEFAULT '',
+            "group" TEXT NOT NULL DEFAULT 'General',
+            notes TEXT NOT NULL DEFAULT '',
+            is_favorite INTEGER NOT NULL DEFAULT 0,
+            is_blocked INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
+        CREATE INDEX IF NOT EXISTS idx_contacts_user ON contacts (user_id);
+        CREATE INDEX IF NOT EXISTS idx_contacts_user_group ON contacts (user_id, "group");
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_id ON contacts (contact_id);
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        directory = os.path.dirname(db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.lazy = False
+        self._loaded_users = set()
+
+        columns = ", ".join(f'"{c}"' for c in self.USER_COLUMNS)
+        self._upsert_user_sql = (f"INSERT OR REPLACE INTO users ({columns}) "
+                                 f"VALUES ({', '.join('?' * len(self.USER_COLUMNS))})")
+        columns = ", ".join(f'"{c}"' for c in self.CONTACT_COLUMNS)
+        self._upsert_contact_sql = (f"INSERT OR REPLACE INTO contacts ({columns}) "
+                                    f"VALUES ({', '.join('?' * len(self.CONTACT_COLUMNS))})")
+        self._select_contacts_sql = f"SELECT {columns} FROM contacts"
+
+    def _user_row(self, user: User) -> tuple:
+        return (user.user_id, user.username, user.email, user.password_hash, user.role,
+                user.created_at, user.last_login, int(user.is_active),
+                user.reset_token, user.reset_token_expiry)
+
+    def _contact_row(self, contact: Contact) -> tuple:
+        return (contact.contact_id, contact.user_id, contact.first_name, contact.last_name,
+                contact.phone, contact.email, contact.address, contact.group, contact.notes,
+                int(contact.is_favorite), int(contact.is_blocked), contact.created_at, contact.updated_at)
+
+    def _contact_from_row(self, row: tuple) -> Contact:
+        data = dict(zip(self.CONTACT_COLUMNS, row))
+        data['is_favorite'] = bool(data['is_favorite'])
+        data['is_blocked'] = bool(data['is_blocked'])
+        return Contact.from_dict(data)
+
+    def load_users(self) -> List[User]:
+        users = []
+        columns = ", ".join(f'"{c}"' for c in self.USER_COLUMNS)
+        for row in self.conn.execute(f"SELECT {columns} FROM users ORDER BY user_id"):
+            data = dict(zip(self.USER_COLUMNS, row))
+            data['is_active'] = bool(data['is_active'])
+            if data['reset_token'] is None:
+                del data['reset_token']
+            if data['reset_token_expiry'] is None:
+                del data['reset_token_expiry']
+            try:
+                users.append(User.from_dict(data))
+            except Exception as e:
+                print(f"Error loading user from row: {e}")
+        return users
+
+    def save_users(self, users: List[User]):
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM users")
+                self.conn.executemany(self._upsert_user_sql, [self._user_row(u) for u in users])
+        except Exception as e:
+            print(f"Error saving users: {e}")
+
+    def persist_user(self, user: User, users: List[User]):
+        self.persist_users([user], users)
+
+    def persist_users(self, changed: List[User], users: List[User]):
+        try:
+            with self.conn:
+                self.conn.executemany(self._upsert_user_sql, [self._user_row(u) for u in changed])
+        except Exception as e:
+            print(f"Error saving users: {e}")
+
+    def load_contacts(self) -> List[Contact]:
+        return [self._contact_from_row(row) for row in
+                self.conn.execute(self._select_contacts_sql + " ORDER BY contact_id")]
+
+    def save_contacts(self, contacts: List[Contact]):
+        try:
+            with self.conn:
+                if self.lazy:
+                    # Chỉ thay thế liên hệ của những người dùng đã được nạp
+                    self.conn.executemany("DELETE FROM contacts WHERE user_id = ?",
+                                          [(user_id,) for user_id in self._loaded_users])
+                else:
+                    self.conn.execute("DELETE FROM contacts")
+                self.conn.executemany(self._upsert_contact_sql,
+                                      [self._contact_row(c) for c in contacts])
+        except Exception as e:
+            print(f"Error saving contacts: {e}")
+
+    def persist_contact_changes(self, changes: List[tuple], contacts: List[Contact]):
+        try:
+            with self.conn:
+                for op, contact in changes:
+                    if op == 'D':
+                        self.conn.execute("DELETE FROM contacts WHERE contact_id = ?", (contact.contact_id,))
+                    else:
+                        self.conn.execute(self._upsert_contact_sql, self._contact_row(contact))
+        except Exception as e:
+            print(f"Error saving contacts: {e}")
+
+    def open_lazy(self):
+        self.lazy = True
+
+    def load_user_contacts(self, user_id: int) -> List[Contact]:
+        self._loaded_users.add(user_id)
+        return [self._contact_from_row(row) for row in
+                self.conn.execute(self._select_contacts_sql + " WHERE user_id = ? ORDER BY contact_id",
+                                  (user_id,))]
+
+    def contact_owner(self, contact_id: int) -> Optional[int]:
+        row = self.conn.execute("SELECT user_id FROM contacts WHERE contact_id = ?", (contact_id,)).fetchone()
+        return row[0] if row else None
+
+    def contact_user_ids(self) -> List[int]:
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT user_id FROM contacts")]
+
+    def max_contact_id(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(contact_id), 0) FROM contacts").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def migrate_text_to_sqlite(data_dir: str = "data", db_file: Optional[str] = None) -> Dict[str, int]:
+    """
+    One-shot copy of users.txt, contacts.txt and contacts.log into a SQLite database.
+    """
+    source = TextStorage(data_dir)
+    target = SQLiteStorage(db_file or os.path.join(data_dir, SQLITE_FILENAME))
+    try:
+        users = source.load_users()
+        contacts = source.load_contacts()
+        target.save_users(users)
+        target.save_contacts(contacts)
+    finally:
+        target.close()
+    return {"users": len(users), "contacts": len(contacts)}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "migrate":
+        print("Usage: python storage.py migrate [data_dir] [db_file]")
+        return 1
+
+    data_dir = argv[1] if len(argv) > 1 else "data"
+    db_file = argv[2] if len(argv) > 2 else None
+    results = migrate_text_to_sqlite(data_dir, db_file)
+    print(f"Migrated {results['users']} users and {results['contacts']} contacts")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+Sharing one data directory between several PhoneBookSystem instances or processes.
+
+Writers hold an advisory fcntl lock on data/.lock while they catch up and write,
+then append the records they changed to data/changes.log. Before each operation
+an instance compares the journal's inode and size with what it has already read:
+if the journal only grew it applies just the new records, and if it was rotated
+(or holds an 'R' reload marker) it reloads everything.
+
+Write-behind instances journal their changes as they make them and write the data
+files later, so a full load also replays the records written after the data file
+they belong to was last rewritten in full (the last 'R' marker for that table).
+While such records are waiting they hold a shared lock on data/.pending, which
+keeps the journal from being rotated under them.
+
+Journal records, one JSON object per line (field values are escaped, so
+notes containing '|' or newlines survive):
+    {"op": "U", "user": {...}}                        user added or changed
+    {"op": "C", "contact": {...}}                     contact added or changed
+    {"op": "D", "contact_id": 7, "user_id": 1}        contact deleted
+    {"op": "R", "table": "contacts"}                  the table was rewritten, reload in full
+"""
+
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+from models import User, Contact
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khóa giữa các luồng trong cùng tiến trình
+    fcntl = None
+
+JOURNAL_ROTATE_BYTES = 1024 * 1024
+
+
+class ChangeJournal:
+    """
+    Data directory lock plus the shared journal of changed records.
+    """
+
+    def __init__(self, data_dir: str, rotate_bytes: int = JOURNAL_ROTATE_BYTES):
+        self.lock_file = os.path.join(data_dir, ".lock")
+        self.journal_file = os.path.join(data_dir, "changes.log")
+        self.pending_file = os.path.join(data_dir, ".pending")
+        self.rotate_bytes = rotate_bytes
+        self._thread_lock = threading.RLock()
+        self._lock_fd = None
+        self._pending_fd = None
+        self._depth = 0
+        # (inode, byte offset) of the journal read so far
+        self._seen: Tuple[int, int] = (0, 0)
+
+    @contextmanager
+    def locked(self, exclusive: bool = True):
+        """
+        Hold the data directory lock. Re-entrant: nested calls reuse the outer lock.
+        """
+        with self._thread_lock:
+            if self._depth == 0 and fcntl is not None:
+                if self._lock_fd is None:
+                    self._lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _stat(self) -> Tuple[int, int]:
+        try:
+            stat = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return (0, 0)
+        return (stat.st_ino, stat.st_size)
+
+    def changed(self) -> bool:
+        return self._stat() != self._seen
+
+    def mark_seen(self):
+        self._seen = self._stat()
+
+    def _read_new(self) -> Optional[List[tuple]]:
+        # Đọc các dòng trọn vẹn từ vị trí đã đọc; None nếu file đã bị xoay vòng.
+        # ('R', table) đánh dấu bảng vừa được ghi lại toàn bộ (phải nạp lại)
+        inode, size = self._stat()
+        seen_inode, offset = self._seen
+        if (inode, size) == self._seen:
+            return []
+        if inode != seen_inode or size < offset:
+            self._seen = (inode, size)
+            return None
+
+        with open(self.journal_file, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        # Chỉ lấy các dòng đã ghi trọn vẹn
+        complete = data[:data.rfind(b'\n') + 1]
+        self._seen = (inode, offset + len(complete))
+
+        changes = []
+        for line in complete.decode('utf-8').split('\n'):
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                op = record.get('op')
+                if op == 'R':
+                    changes.append(('R', record['table']))
+                elif op == 'U':
+                    changes.append(('U', User.from_dict(record['user'])))
+                elif op == 'C':
+                    changes.append(('C', Contact.from_dict(record['contact'])))
+                elif op == 'D':
+                    changes.append(('D', int(record['contact_id']), int(record['user_id'])))
+            except Exception as e:
+                print(f"Error reading change journal line: {e}")
+        return changes
+
+    def read_changes(self) -> Optional[List[tuple]]:
+        """
+        Return the records appended since the last call, or None if a full reload is needed.
+        Records are ('U', user), ('C', contact) or ('D', contact_id, user_id).
+        """
+        changes = self._read_new()
+        if changes is None or any(change[0] == 'R' for change in changes):
+            return None
+        return changes
+
+    def read_all(self) -> List[tuple]:
+        """
+        Return the records after the journal's last full-reload marker and mark them seen.
+        They may include changes a write-behind instance has not written to the data files yet.
+        """
+        self._seen = (self._stat()[0], 0)
+        changes = []
+        for change in self._read_new() or []:
+            if change[0] != 'R':
+                changes.append(change)
+            else:
+                # Bảng vừa được ghi lại toàn bộ đã chứa các bản ghi trước đó của nó
+                changes = [c for c in changes if RECORD_TABLES[c[0]] != change[1]]
+        return changes
+
+    def append(self, records: List[str]):
+        """
+        Append records (built with the record_* helpers) while holding the lock,
+        rotating the journal once it grows past rotate_bytes.
+        """
+        if not records:
+            return
+        try:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write("\n".join(records) + "\n")
+                size = f.tell()
+            if size >= self.rotate_bytes and self._rotation_allowed():
+                # File mới (inode mới): các instance còn đọc dở sẽ nạp lại toàn bộ
+                temp_file = self.journal_file + ".tmp"
+                open(temp_file, 'w').close()
+                os.replace(temp_file, self.journal_file)
+        except Exception as e:
+            print(f"Error writing change journal: {e}")
+        self.mark_seen()
+
+    def hold_pending(self):
+        """
+        Mark that this instance has journaled changes not yet written to the data files.
+        """
+        if fcntl is None or self._pending_fd is not None:
+            return
+        self._pending_fd = os.open(self.pending_file, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._pending_fd, fcntl.LOCK_SH)
+
+    def release_pending(self):
+        if self._pending_fd is not None:
+            os.close(self._pending_fd)
+            self._pending_fd = None
+
+    def _rotation_allowed(self) -> bool:
+        # Còn instance giữ .pending: bản ghi của nó chỉ mới có trong nhật ký, chưa được xoay vòng
+        if fcntl is None:
+            return True
+        fd = os.open(self.pending_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+        return True
+
+    def close(self):
+        self.release_pending()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+def _record(**fields) -> str:
+    # ensure_ascii=False giữ nguyên tiếng Việt; xuống dòng vẫn được thoát thành \n
+    return json.dumps(fields, ensure_ascii=False, separators=(',', ':'))
+
+
+def record_user(user) -> str:
+    return _record(op='U', user=user.to_dict())
+
+
+def record_contact_change(op: str, contact) -> str:
+    if op == 'D':
+        return _record(op='D', contact_id=contact.contact_id, user_id=contact.user_id)
+    return _record(op='C', contact=contact.to_dict())
+
+
+def record_reload(table: str) -> str:
+    return _record(op='R', table=table)
+
+
+# Bảng dữ liệu mà mỗi loại bản ghi thay đổi
+RECORD_TABLES = {'U': 'users', 'C': 'contacts', 'D': 'contacts'}
@@ -1,191 +1,658 @@
 import os
 import csv
+import heapq
 import random
 import string
+import atexit
+import weakref
 import datetime
-from typing import List, Dict, Optional
-from models import User, Contact
+import functools
+from bisect import bisect_right
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Dict, Optional, Union, Tuple, Iterator
+from models import User, Contact, verify_password_hash
+from indexes import (TrigramIndex, SortedContactIndex, ContactCounters, PhoneIndex, PrefixIndex,
+                     FuzzyIndex, encode_cursor, decode_cursor, CURSOR_SHAPES)
+from storage import Storage, TextStorage, SQLiteStorage, SQLITE_FILENAME
+from snapshot import write_snapshot, read_snapshot
+from backup import BackupStore, BACKUP_RETENTION
+from phone import normalize_phone, DEFAULT_COUNTRY_CODE
+from dedupe import find_duplicates, merge_contact_fields, fold_text, MERGE_THRESHOLD
+from metrics import Metrics
+from flusher import BackgroundFlusher, coalesce_contact_changes, FLUSH_INTERVAL, FLUSH_THRESHOLD
+from sync import ChangeJournal, record_user, record_contact_change, record_reload
+from contact_io import (ImportProgress, ProgressCallback, stream_import_batches,
+                        open_export_file, write_contacts, iter_contact_chunks,
+                        IMPORT_BATCH_SIZE, EXPORT_CHUNK_ROWS, EXPORT_FORMATS)
+
+# Số lỗi chi tiết tối đa giữ lại trong báo cáo nhập liệu
+MAX_IMPORT_ERRORS = 1000
+
+def _synchronized(method):
+    """
+    Run a write operation under the data directory lock, after catching up with
+    changes made by other instances.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._journal.locked():
+            self._refresh()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _refreshed(method):
+    """Catch up with changes made by other instances before a read operation."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._refresh()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+def _flush_at_exit(system_ref: weakref.ref):
+    # Lần ghi cuối khi tiến trình thoát mà chưa gọi close() (chế độ write-behind)
+    system = system_ref()
+    if system is not None and system._flusher is not None:
+        system.close()
 
 class PhoneBookSystem:
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", use_contact_log: bool = False,
+                 log_compact_threshold: int = 4 * 1024 * 1024, lazy_contacts: bool = False,
+                 storage: Union[str, Storage] = "text", login_workers: int = 0,
+                 login_pool: str = "thread", user_flush_threshold: int = 100,
+                 backup_retention: int = BACKUP_RETENTION,
+                 default_country_code: str = DEFAULT_COUNTRY_CODE, metrics: bool = False,
+                 write_behind: bool = False, flush_interval: float = FLUSH_INTERVAL,
+                 flush_threshold: int = FLUSH_THRESHOLD):
         self.data_dir = data_dir
         self.users_file = os.path.join(data_dir, "users.txt")  # Đổi thành .txt
         self.contacts_file = os.path.join(data_dir, "contacts.txt")  # Đổi thành .txt
+        self.contacts_log_file = os.path.join(data_dir, "contacts.log")
+        self.contacts_index_file = os.path.join(data_dir, "contacts.idx")
         self.backups_dir = os.path.join(data_dir, "backups")
+        self.snapshot_file = os.path.join(data_dir, "phonebook.snap")
         
         os.makedirs(data_dir, exist_ok=True)
         os.makedirs(self.backups_dir, exist_ok=True)
         
+        # Sao lưu tăng dần: chunk nén theo nội dung + manifest nhỏ cho mỗi lần sao lưu
+        self.backup_store = BackupStore(self.backups_dir, retention=backup_retention)
+        
+        # Bộ lưu trữ: "text" (users.txt/contacts.txt), "sqlite" (data/phonebook.db)
+        # hoặc một đối tượng Storage bất kỳ.
+        # Chế độ log (text): mỗi thay đổi chỉ ghi thêm một dòng vào contacts.log
+        if storage == "text":
+            storage = TextStorage(data_dir, use_contact_log, log_compact_threshold)
+        elif storage == "sqlite":
+            storage = SQLiteStorage(os.path.join(data_dir, SQLITE_FILENAME))
+        self.storage = storage
+        
+        # Chế độ lazy: chỉ nạp liên hệ của người dùng khi cần (self.contacts chỉ chứa
+        # các liên hệ đã được nạp)
+        self.lazy_contacts = lazy_contacts
+        self._materialized_users = set()
+        
+        # Xác thực mật khẩu (KDF) có thể chạy song song trên một pool luồng/tiến trình
+        self._login_executor: Optional[Executor] = None
+        if login_workers > 0:
+            pool_class = ProcessPoolExecutor if login_pool == "process" else ThreadPoolExecutor
+            self._login_executor = pool_class(max_workers=login_workers)
+        
+        # Mã quốc gia mặc định khi chuẩn hóa số điện thoại trong nước (0912... -> +84912...)
+        self.default_country_code = default_country_code
+        
+        # last_login được gom lại và ghi theo lô thay vì ghi users mỗi lần đăng nhập
+        self.user_flush_threshold = user_flush_threshold
+        self._dirty_users: Dict[int, User] = {}
+        
+        # Write-behind: thao tác chỉ đánh dấu thay đổi rồi trả về ngay; luồng nền gộp các
+        # thay đổi và ghi sau mỗi flush_interval giây hoặc khi đủ flush_threshold thay đổi.
+        # Bản ghi nhật ký vẫn được ghi ngay để instance khác thấy thay đổi và ID đã cấp
+        self.write_behind = write_behind
+        self.flush_threshold = flush_threshold
+        self._pending_contact_changes: List[tuple] = []
+        self._flusher: Optional[BackgroundFlusher] = None
+        
+        # Nhiều instance/tiến trình dùng chung data_dir: khóa fcntl khi ghi và nhật ký
+        # thay đổi (changes.log) để các instance khác chỉ nạp lại những bản ghi đã đổi
+        self._journal = ChangeJournal(data_dir)
+        
+        # Đo lường tùy chọn: chỉ khi bật mới gắn wrapper lên instance, tắt thì không tốn gì
+        self.metrics = Metrics()
+        if metrics:
+            self.enable_metrics()
+        
         self.current_user = None
+        with self._journal.locked(exclusive=False):
+            self._load_state()
+        
+        # Log còn sót lại khi chế độ log đã tắt: gộp lại vào snapshot ngay
+        if isinstance(self.storage, TextStorage) and not self.use_contact_log and self.storage.has_log():
+            self.compact_contact_log()
+        
+        if write_behind:
+            self._flusher = BackgroundFlusher(self.flush, flush_interval)
+            self._flusher.start()
+            atexit.register(_flush_at_exit, weakref.ref(self))
+    
+    def _load_state(self):
         self.users = self._load_users()
-        self.contacts = self._load_contacts()
+        self._materialized_users = set()
+        if self.lazy_contacts:
+            self.storage.open_lazy()
+            self.contacts = []
+            max_contact_id = self.storage.max_contact_id()
+        else:
+            self.contacts = self._load_contacts()
+        self._rebuild_user_indexes()
+        self._rebuild_contact_indexes()
+        # Giá trị tạm: _apply_* chỉ nâng ID lên, ID thật được tính lại bên dưới
+        self.next_user_id = self.next_contact_id = 1
+        
+        # Thay đổi đã ghi nhật ký nhưng có thể chưa ghi xuống đĩa (instance write-behind khác)
+        changes = self._journal.read_all()
+        self._apply_changes(changes)
+        if self.lazy_contacts:
+            journaled = set()
+            for change in changes:
+                if change[0] == 'C':
+                    journaled.add(change[1].contact_id)
+                elif change[0] == 'D':
+                    journaled.discard(change[1])
+            max_contact_id = max([max_contact_id] + list(journaled))
+        else:
+            max_contact_id = max([contact.contact_id for contact in self.contacts] + [0])
         
         self.next_user_id = max([user.user_id for user in self.users] + [0]) + 1
-        self.next_contact_id = max([contact.contact_id for contact in self.contacts] + [0]) + 1
+        self.next_contact_id = max_contact_id + 1
+    
+    def _refresh(self):
+        """
+        Apply changes other instances recorded in the journal since the last check.
+        Costs one stat() when nothing changed.
+        """
+        if not self._journal.changed():
+            return
+        with self._journal.locked(exclusive=False):
+            changes = self._journal.read_changes()
+            # Chế độ lazy: thay đổi liên hệ làm lệch chỉ mục offset, nên nạp lại toàn bộ
+            if changes is None or (self.lazy_contacts and any(change[0] != 'U' for change in changes)):
+                self._reload_all()
+                return
+            self._apply_changes(changes)
+    
+    def _apply_changes(self, changes: List[tuple]):
+        for change in changes:
+            if change[0] == 'U':
+                self._apply_user_change(change[1])
+            elif self.lazy_contacts:
+                # Chế độ lazy nạp liên hệ từ đĩa khi cần; _load_state chỉ giữ lại ID đã cấp
+                continue
+            elif change[0] == 'C':
+                self._apply_contact_change(change[1])
+            else:
+                self._apply_contact_delete(change[1])
+    
+    def _reload_all(self):
+        current_user_id = self.current_user.user_id if self.current_user else None
+        pending_logins = {user_id: user.last_login for user_id, user in self._dirty_users.items()}
+        
+        self._load_state()
+        
+        self.current_user = self._users_by_id.get(current_user_id)
+        # Giữ lại last_login chưa ghi của các user đang chờ flush
+        self._dirty_users = {}
+        for user_id, last_login in pending_logins.items():
+            user = self._users_by_id.get(user_id)
+            if user is not None:
+                user.last_login = last_login
+                self._dirty_users[user_id] = user
+        
+        # Thay đổi liên hệ chưa ghi (write-behind) được áp lại lên dữ liệu vừa nạp
+        for op, contact in self._pending_contact_changes:
+            if op == 'D':
+                self._apply_contact_delete(contact.contact_id)
+            else:
+                self._apply_contact_change(contact)
+    
+    def _apply_user_change(self, changed: User):
+        user = self._users_by_id.get(changed.user_id)
+        if user is None:
+            self._add_user(changed)
+            self.next_user_id = max(self.next_user_id, changed.user_id + 1)
+            return
+        
+        # Cập nhật tại chỗ để current_user và các tham chiếu khác vẫn hợp lệ
+        old_email = user.email
+        for name in User.__slots__:
+            setattr(user, name, getattr(changed, name))
+        if user.email != old_email:
+            if self._users_by_email.get(old_email) is user:
+                del self._users_by_email[old_email]
+            self._users_by_email.setdefault(user.email, user)
+    
+    def _apply_contact_change(self, changed: Contact):
+        contact = self._contacts_by_id.get(changed.contact_id)
+        if contact is None:
+            self.contacts.append(changed)
+            self._index_contact(changed)
+            self.next_contact_id = max(self.next_contact_id, changed.contact_id + 1)
+            return
+        
+        self._before_contact_update(contact)
+        for name in Contact.__slots__:
+            setattr(contact, name, getattr(changed, name))
+        self._after_contact_update(contact)
+    
+    def _apply_contact_delete(self, contact_id: int):
+        contact = self._contacts_by_id.get(contact_id)
+        if contact is not None:
+            self.contacts.remove(contact)
+            self._unindex_contact(contact)
+    
+    @property
+    def use_contact_log(self) -> bool:
+        return getattr(self.storage, 'use_contact_log', False)
+    
+    @property
+    def log_compact_threshold(self) -> int:
+        return getattr(self.storage, 'log_compact_threshold', 0)
+    
+    @log_compact_threshold.setter
+    def log_compact_threshold(self, value: int):
+        self.storage.log_compact_threshold = value
     
     def _load_users(self) -> List[User]:
-        if os.path.exists(self.users_file):
-            try:
-                users = []
-                with open(self.users_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line or line.startswith('#'):
-                            continue
-                            
-                        try:
-                            # Định dạng: user_id|username|email|password_hash|role|created_at|last_login|is_active|reset_token|reset_token_expiry
-                            parts = line.split('|')
-                            if len(parts) < 7:
-                                continue
-                                
-                            user_data = {
-                                'user_id': int(parts[0]),
-                                'username': parts[1],
-                                'email': parts[2],
-                                'password_hash': parts[3],
-                                'role': parts[4],
-                                'created_at': parts[5] if parts[5] != 'None' else None,
-                                'last_login': parts[6] if len(parts) > 6 and parts[6] != 'None' else None,
-                                'is_active': parts[7].lower() == 'true' if len(parts) > 7 else True
-                            }
-                            
-                            if len(parts) > 8 and parts[8] != 'None':
-                                user_data['reset_token'] = parts[8]
-                            if len(parts) > 9 and parts[9] != 'None':
-                                user_data['reset_token_expiry'] = parts[9]
-                                
-                            user = User.from_dict(user_data)
-                            users.append(user)
-                            
-                        except Exception as e:
-                            print(f"Error loading user from line: {e}")
-                            continue
-                            
-                return users
-            except Exception as e:
-                print(f"Error reading users file: {e}")
-                return []
-        return []
+        return self.storage.load_users()
     
     def _load_contacts(self) -> List[Contact]:
-        if os.path.exists(self.contacts_file):
-            try:
-                contacts = []
-                with open(self.contacts_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line or line.startswith('#'):
-                            continue
-                            
-                        try:
-                            # Định dạng: contact_id|user_id|first_name|last_name|phone|email|address|group|notes|is_favorite|is_blocked|created_at|updated_at
-                            parts = line.split('|')
-                            if len(parts) < 5:
-                                continue
-                                
-                            contact_data = {
-                                'contact_id': int(parts[0]),
-                                'user_id': int(parts[1]),
-                                'first_name': parts[2],
-                                'last_name': parts[3],
-                                'phone': parts[4],
-                                'email': parts[5] if len(parts) > 5 else '',
-                                'address': parts[6] if len(parts) > 6 else '',
-                                'group': parts[7] if len(parts) > 7 else 'General',
-                                'notes': parts[8] if len(parts) > 8 else '',
-                                'is_favorite': parts[9].lower() == 'true' if len(parts) > 9 else False,
-                                'is_blocked': parts[10].lower() == 'true' if len(parts) > 10 else False,
-                                'created_at': parts[11] if len(parts) > 11 and parts[11] != 'None' else None,
-                                'updated_at': parts[12] if len(parts) > 12 and parts[12] != 'None' else None
-                            }
-                            
-                            contact = Contact.from_dict(contact_data)
-                            contacts.append(contact)
-                            
-                        except Exception as e:
-                            print(f"Error loading contact from line: {e}")
-                            continue
-                            
-                return contacts
-            except Exception as e:
-                print(f"Error reading contacts file: {e}")
-                return []
-        return []
+        return self.storage.load_contacts()
     
+    # Ghi toàn bộ (nhập liệu vào file snapshot, khôi phục) luôn ghi ngay kể cả ở chế độ
+    # write-behind: ghi trễ cả file sẽ đè lên những dòng instance khác ghi trong lúc chờ
     def _save_users(self):
-        try:
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                f.write("# PhoneBook Users Data\n")
-                f.write("# Format: user_id|username|email|password_hash|role|created_at|last_login|is_active|reset_token|reset_token_expiry\n")
-                
-                for user in self.users:
-                    user_dict = user.to_dict()
-                    
-                    # Chuẩn bị các giá trị, thay None bằng chuỗi 'None'
-                    reset_token = user_dict.get('reset_token', 'None')
-                    reset_token_expiry = user_dict.get('reset_token_expiry', 'None')
-                    last_login = user_dict.get('last_login', 'None')
-                    
-                    line = f"{user_dict['user_id']}|{user_dict['username']}|{user_dict['email']}|{user_dict['password_hash']}|{user_dict['role']}|{user_dict['created_at']}|{last_login}|{user_dict['is_active']}|{reset_token}|{reset_token_expiry}\n"
-                    f.write(line)
-                    
-        except Exception as e:
-            print(f"Error saving users: {e}")
+        self.storage.save_users(self.users)
+        self._journal.append([record_reload('users')])
     
     def _save_contacts(self):
-        try:
-            with open(self.contacts_file, 'w', encoding='utf-8') as f:
-                f.write("# PhoneBook Contacts Data\n")
-                f.write("# Format: contact_id|user_id|first_name|last_name|phone|email|address|group|notes|is_favorite|is_blocked|created_at|updated_at\n")
-                
-                for contact in self.contacts:
-                    contact_dict = contact.to_dict()
-                    
-                    line = f"{contact_dict['contact_id']}|{contact_dict['user_id']}|{contact_dict['first_name']}|{contact_dict['last_name']}|{contact_dict['phone']}|{contact_dict['email']}|{contact_dict['address']}|{contact_dict['group']}|{contact_dict['notes']}|{contact_dict['is_favorite']}|{contact_dict['is_blocked']}|{contact_dict['created_at']}|{contact_dict['updated_at']}\n"
-                    f.write(line)
-                    
-        except Exception as e:
-            print(f"Error saving contacts: {e}")
+        self.storage.save_contacts(self.contacts)
+        self._journal.append([record_reload('contacts')])
+        # Ghi toàn bộ bao trùm các thay đổi lẻ đang chờ
+        self._pending_contact_changes = []
+        if not self.has_pending_writes:
+            self._journal.release_pending()
+    
+    def _defer_write(self, records: List[str]):
+        # Đang giữ khóa thư mục dữ liệu (_synchronized): ghi nhật ký ngay, ghi file sau
+        self._journal.hold_pending()
+        self._journal.append(records)
+        self._wake_flusher_if_full()
+    
+    def _persist_user(self, user: User):
+        if self.write_behind:
+            self._dirty_users[user.user_id] = user
+            self._defer_write([record_user(user)])
+            return
+        self.storage.persist_user(user, self.users)
+        self._dirty_users.pop(user.user_id, None)
+        self._journal.append([record_user(user)])
+    
+    def _mark_user_dirty(self, user: User):
+        self._dirty_users[user.user_id] = user
+        if self.write_behind:
+            self._wake_flusher_if_full()
+        elif len(self._dirty_users) >= self.user_flush_threshold:
+            self.flush()
+    
+    def _wake_flusher_if_full(self):
+        pending = len(self._pending_contact_changes) + len(self._dirty_users)
+        if self._flusher is not None and pending >= self.flush_threshold:
+            self._flusher.wake()
+    
+    @property
+    def has_pending_writes(self) -> bool:
+        return bool(self._pending_contact_changes or self._dirty_users)
+    
+    @_synchronized
+    def flush(self):
+        """
+        Write out batched user changes such as last_login and upgraded password hashes,
+        and in write-behind mode every deferred change, coalescing repeated contact changes.
+        Changes other instances made meanwhile are merged first (_synchronized).
+        """
+        if not self.has_pending_writes:
+            return
+        # Lấy ra rồi thay bằng hàng đợi mới để thay đổi đến sau thuộc lần ghi kế tiếp
+        contact_changes, self._pending_contact_changes = self._pending_contact_changes, []
+        dirty_users, self._dirty_users = list(self._dirty_users.values()), {}
+        
+        records = []
+        if dirty_users:
+            self.storage.persist_users(dirty_users, self.users)
+            records.extend(record_user(user) for user in dirty_users)
+        
+        if contact_changes:
+            changes = coalesce_contact_changes(contact_changes)
+            self.storage.persist_contact_changes(changes, self.contacts)
+            # Ghi lại sau khi xuống đĩa: instance lazy nạp lại từ đĩa khi thấy bản ghi liên hệ
+            records.extend(record_contact_change(op, contact) for op, contact in changes)
+        
+        self._journal.append(records)
+        self._journal.release_pending()
+    
+    def close(self):
+        """
+        Stop the background flusher, write everything still pending, shut down the
+        login pool and release files.
+        """
+        if self._flusher is not None:
+            self._flusher.stop()
+            self._flusher = None
+        self.flush()
+        # Pool tiến trình: không tắt thì các tiến trình worker sống lâu hơn hệ thống
+        if self._login_executor is not None:
+            self._login_executor.shutdown()
+            self._login_executor = None
+        self.storage.close()
+        self._journal.close()
+    
+    def _persist_contact_changes(self, changes: List[tuple]):
+        if self.write_behind:
+            self._pending_contact_changes.extend(changes)
+            self._defer_write([record_contact_change(op, contact) for op, contact in changes])
+            return
+        self.storage.persist_contact_changes(changes, self.contacts)
+        self._journal.append([record_contact_change(op, contact) for op, contact in changes])
+    
+    @_synchronized
+    def compact_contact_log(self):
+        """
+        Fold the storage's change log (contacts.log for text storage) into the main store.
+        """
+        self.storage.compact(self.contacts)
+    
+    def _ensure_user_loaded(self, user_id: int):
+        if not self.lazy_contacts or user_id in self._materialized_users:
+            return
+        self._materialized_users.add(user_id)
+        
+        for contact in self.storage.load_user_contacts(user_id):
+            self.contacts.append(contact)
+            self._index_contact(contact)
+    
+    def _ensure_all_contacts_loaded(self):
+        if not self.lazy_contacts:
+            return
+        for user_id in self.storage.contact_user_ids():
+            self._ensure_user_loaded(user_id)
+    
+    def _rebuild_user_indexes(self):
+        # Chỉ mục băm: user_id -> User, email -> User (email trùng: giữ user đầu tiên)
+        self._users_by_id: Dict[int, User] = {}
+        self._users_by_email: Dict[str, User] = {}
+        for user in self.users:
+            self._index_user(user)
+        # self.users luôn theo thứ tự user_id tăng dần để phân trang bằng tìm kiếm nhị phân
+        # (sắp xếp sau khi lập chỉ mục: email trùng vẫn giữ user đứng đầu file)
+        self.users.sort(key=lambda user: user.user_id)
+    
+    def _user_position(self, user_id: int) -> int:
+        # Vị trí ngay sau user_id trong self.users (như bisect_right)
+        low, high = 0, len(self.users)
+        while low < high:
+            middle = (low + high) // 2
+            if self.users[middle].user_id <= user_id:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    
+    def _add_user(self, user: User):
+        self.users.insert(self._user_position(user.user_id), user)
+        self._index_user(user)
+    
+    def _index_user(self, user: User):
+        self._users_by_id[user.user_id] = user
+        self._users_by_email.setdefault(user.email, user)
+    
+    def _rebuild_contact_indexes(self):
+        # Chỉ mục băm: contact_id -> Contact
+        self._contacts_by_id: Dict[int, Contact] = {}
+        # Phân vùng theo chủ sở hữu: user_id -> {contact_id -> Contact} (giữ thứ tự thêm vào)
+        self._contacts_by_user: Dict[int, Dict[int, Contact]] = {}
+        # Thứ tự chèn của từng liên hệ, để kết quả tìm kiếm giữ đúng thứ tự danh sách
+        self._contact_order: Dict[int, int] = {}
+        self._next_order = 0
+        # Chỉ mục trigram cho search_contacts (dựng cho từng người dùng ở lần tìm kiếm đầu tiên)
+        self._search_index = TrigramIndex()
+        # Danh sách liên hệ đã sắp xếp theo từng kiểu (tên, họ, cập nhật gần nhất)
+        self._sorted_index = SortedContactIndex()
+        # Bộ đếm tổng hợp (liên hệ, yêu thích, bị chặn, theo nhóm) cho stats()
+        self._counters = ContactCounters()
+        # Chỉ mục số điện thoại đã chuẩn hóa -> liên hệ, cho lookup_by_phone
+        self._phone_index = PhoneIndex(functools.partial(normalize_phone,
+                                                         default_country_code=self.default_country_code))
+        # Mảng tiền tố (tên đã chuẩn hóa, chữ số điện thoại) cho complete(); dựng khi dùng lần đầu
+        self._prefix_index = PrefixIndex(fold_text, self._phone_index.normalize)
+        # Kho từ (tên đã chuẩn hóa) và trigram của từ cho fuzzy_search(); dựng khi dùng lần đầu
+        self._fuzzy_index = FuzzyIndex(fold_text)
+        
+        # Dựng lại trong một lượt: từng chỉ mục phụ được nạp hàng loạt thay vì thêm từng liên hệ
+        for contact in self.contacts:
+            partition = self._contacts_by_user.get(contact.user_id)
+            if partition is None:
+                partition = self._contacts_by_user[contact.user_id] = {}
+            partition[contact.contact_id] = contact
+            self._contacts_by_id[contact.contact_id] = contact
+        
+        if len(self._contacts_by_id) != len(self.contacts):
+            # contact_id trùng lặp: dùng đường chậm để liên hệ sau thay thế liên hệ trước
+            self._contacts_by_id, self._contacts_by_user = {}, {}
+            for contact in self.contacts:
+                self._index_contact(contact)
+            return
+        
+        self._contact_order = {contact_id: order for order, contact_id in enumerate(self._contacts_by_id)}
+        self._next_order = len(self._contact_order)
+        self._sorted_index.rebuild(self.contacts)
+        self._counters.rebuild(self.contacts)
+        self._phone_index.rebuild(self.contacts)
+    
+    def _index_contact(self, contact: Contact):
+        existing = self._contacts_by_id.get(contact.contact_id)
+        if existing is not None and existing is not contact:
+            self._unindex_contact(existing)
+        self._contacts_by_id[contact.contact_id] = contact
+        self._contacts_by_user.setdefault(contact.user_id, {})[contact.contact_id] = contact
+        self._contact_order[contact.contact_id] = self._next_order
+        self._next_order += 1
+        self._after_contact_update(contact)
+    
+    def _unindex_contact(self, contact: Contact):
+        if self._contacts_by_id.get(contact.contact_id) is contact:
+            del self._contacts_by_id[contact.contact_id]
+        partition = self._contacts_by_user.get(contact.user_id)
+        if partition is not None and partition.get(contact.contact_id) is contact:
+            del partition[contact.contact_id]
+            self._contact_order.pop(contact.contact_id, None)
+        self._before_contact_update(contact)
+    
+    def _before_contact_update(self, contact: Contact):
+        # Gỡ liên hệ khỏi các chỉ mục phụ trước khi các trường của nó thay đổi
+        self._search_index.remove(contact)
+        self._sorted_index.remove(contact)
+        self._counters.remove(contact)
+        self._phone_index.remove(contact)
+        self._prefix_index.remove(contact)
+        self._fuzzy_index.remove(contact)
+    
+    def _after_contact_update(self, contact: Contact):
+        self._search_index.add(contact)
+        self._sorted_index.add(contact)
+        self._counters.add(contact)
+        self._phone_index.add(contact)
+        self._prefix_index.add(contact)
+        self._fuzzy_index.add(contact)
+    
+    # Phiên bản theo lô: danh sách đã sắp xếp chỉ được lọc/sắp lại một lần cho cả lô
+    def _before_contacts_update(self, contacts: List[Contact]):
+        for contact in contacts:
+            self._search_index.remove(contact)
+            self._counters.remove(contact)
+            self._phone_index.remove(contact)
+            self._fuzzy_index.remove(contact)
+        self._sorted_index.remove_many(contacts)
+        self._prefix_index.remove_many(contacts)
     
+    def _after_contacts_update(self, contacts: List[Contact]):
+        for contact in contacts:
+            self._search_index.add(contact)
+            self._counters.add(contact)
+            self._phone_index.add(contact)
+            self._fuzzy_index.add(contact)
+        self._sorted_index.add_many(contacts)
+        self._prefix_index.add_many(contacts)
+    
+    def _unindex_contacts(self, contacts: List[Contact]):
+        for contact in contacts:
+            if self._contacts_by_id.get(contact.contact_id) is contact:
+                del self._contacts_by_id[contact.contact_id]
+            partition = self._contacts_by_user.get(contact.user_id)
+            if partition is not None and partition.get(contact.contact_id) is contact:
+                del partition[contact.contact_id]
+                self._contact_order.pop(contact.contact_id, None)
+        self._before_contacts_update(contacts)
+    
+    def _user_partition(self, user_id: int) -> Dict[int, Contact]:
+        self._ensure_user_loaded(user_id)
+        return self._contacts_by_user.get(user_id, {})
+    
+    @_synchronized
     def register_user(self, username: str, email: str, password: str, role: str = "user") -> bool:
-        if any(user.email == email for user in self.users):
+        if email in self._users_by_email:
             return False
         
         new_user = User(self.next_user_id, username, email, password, role)
-        self.users.append(new_user)
+        self._add_user(new_user)
         self.next_user_id += 1
-        self._save_users()
+        self._persist_user(new_user)
         return True
     
+    def _finish_authentication(self, user: User, password: str):
+        # Nâng cấp băm cũ (SHA-256 không salt) hoặc số vòng lặp thấp sang KDF hiện tại
+        if user.needs_rehash():
+            user.password_hash = user._hash_password(password)
+            self._mark_user_dirty(user)
+    
+    @_refreshed
+    def authenticate(self, email: str, password: str) -> Optional[User]:
+        """
+        Verify credentials without changing the session. Returns the user or None.
+        """
+        user = self._users_by_email.get(email)
+        if not user or not user.is_active:
+            return None
+        if self._login_executor:
+            verified = self._login_executor.submit(verify_password_hash, user.password_hash, password).result()
+        else:
+            verified = user.verify_password(password)
+        if not verified:
+            return None
+        self._finish_authentication(user, password)
+        return user
+    
+    @_refreshed
+    def authenticate_many(self, credentials: List[Tuple[str, str]]) -> List[Optional[User]]:
+        """
+        Verify many (email, password) pairs, spreading the KDF work over the login pool.
+        """
+        candidates = [self._users_by_email.get(email) for email, _ in credentials]
+        jobs = []
+        for user, (_, password) in zip(candidates, credentials):
+            if not user or not user.is_active:
+                jobs.append(None)
+            elif self._login_executor:
+                jobs.append(self._login_executor.submit(verify_password_hash, user.password_hash, password))
+            else:
+                jobs.append(user.verify_password(password))
+        
+        results = []
+        for user, (_, password), job in zip(candidates, credentials, jobs):
+            verified = job.result() if hasattr(job, 'result') else job
+            if verified:
+                self._finish_authentication(user, password)
+                results.append(user)
+            else:
+                results.append(None)
+        return results
+    
+    @_refreshed
     def login(self, email: str, password: str) -> bool:
-        for user in self.users:
-            if user.email == email and user.verify_password(password) and user.is_active:
-                user.last_login = datetime.datetime.now().isoformat()
-                self.current_user = user
-                self._save_users()
-                return True
+        user = self.authenticate(email, password)
+        if user:
+            self.record_login(user)
+            self.current_user = user
+            self._ensure_user_loaded(user.user_id)
+            return True
         return False
     
+    @_refreshed
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        return self._users_by_email.get(email)
+    
+    @_refreshed
+    def get_user_by_id(self, user_id: int) -> Optional[User]:
+        return self._users_by_id.get(user_id)
+    
+    def record_login(self, user: User, password: Optional[str] = None):
+        """
+        Stamp last_login (batched) for a user whose password was verified.
+        Pass the password when it was verified outside authenticate() so an outdated hash is upgraded.
+        """
+        if password is not None:
+            self._finish_authentication(user, password)
+        user.last_login = datetime.datetime.now().isoformat()
+        self._mark_user_dirty(user)
+    
+    @_synchronized
+    def update_user_profile(self, user: User, **kwargs) -> bool:
+        """
+        Update a user's profile and keep the email index in sync.
+        Returns False if the new email already belongs to another user.
+        """
+        new_email = kwargs.get('email')
+        if new_email and new_email != user.email and new_email in self._users_by_email:
+            return False
+        
+        old_email = user.email
+        user.update_profile(**kwargs)
+        if user.email != old_email:
+            if self._users_by_email.get(old_email) is user:
+                del self._users_by_email[old_email]
+            self._users_by_email[user.email] = user
+        self._persist_user(user)
+        return True
+    
+    @_refreshed
+    def email_exists(self, email: str) -> bool:
+        return email in self._users_by_email
+    
     def generate_reset_token(self) -> str:
         return ''.join(random.choices(string.ascii_letters + string.digits, k=32))
     
+    @_synchronized
     def request_password_reset(self, email: str) -> Optional[str]:
-        user = next((u for u in self.users if u.email == email and u.is_active), None)
-        if not user:
+        user = self._users_by_email.get(email)
+        if not user or not user.is_active:
             return None
         
         reset_token = self.generate_reset_token()
         user.reset_token = reset_token
         user.reset_token_expiry = (datetime.datetime.now() + 
                                  datetime.timedelta(hours=24)).isoformat()
-        self._save_users()
+        self._persist_user(user)
         return reset_token
     
+    @_synchronized
     def reset_password(self, token: str, new_password: str) -> bool:
         user = next((u for u in self.users if hasattr(u, 'reset_token') and 
                     u.reset_token == token and u.is_active), None)
@@ -204,9 +671,10 @@ class PhoneBookSystem:
         user.password_hash = user._hash_password(new_password)
         user.reset_token = None
         user.reset_token_expiry = None
-        self._save_users()
+        self._persist_user(user)
         return True
     
+    @_refreshed
     def validate_reset_token(self, token: str) -> bool:
         user = next((u for u in self.users if hasattr(u, 'reset_token') and 
                     u.reset_token == token and u.is_active), None)
@@ -225,40 +693,54 @@ class PhoneBookSystem:
     
     def logout(self):
         self.current_user = None
+        self.flush()
     
+    @_synchronized
     def add_contact(self, first_name: str, last_name: str, phone: str, **kwargs) -> bool:
         if not self.current_user:
             return False
         
+        self._ensure_user_loaded(self.current_user.user_id)
         new_contact = Contact(self.next_contact_id, self.current_user.user_id, 
                              first_name, last_name, phone, **kwargs)
         self.contacts.append(new_contact)
+        self._index_contact(new_contact)
         self.next_contact_id += 1
-        self._save_contacts()
+        self._persist_contact_changes([('A', new_contact)])
         return True
     
+    @_synchronized
     def edit_contact(self, contact_id: int, **kwargs) -> bool:
         contact = self.get_contact_by_id(contact_id)
         if contact and contact.user_id == self.current_user.user_id:
+            self._before_contact_update(contact)
             contact.update_contact(**kwargs)
-            self._save_contacts()
+            self._after_contact_update(contact)
+            self._persist_contact_changes([('U', contact)])
             return True
         return False
     
+    @_synchronized
     def delete_contact(self, contact_id: int) -> bool:
         contact = self.get_contact_by_id(contact_id)
         if contact and contact.user_id == self.current_user.user_id:
             self.contacts.remove(contact)
-            self._save_contacts()
+            self._unindex_contact(contact)
+            self._persist_contact_changes([('D', contact)])
             return True
         return False
     
+    @_refreshed
     def get_contact_by_id(self, contact_id: int) -> Optional[Contact]:
-        for contact in self.contacts:
-            if contact.contact_id == contact_id:
-                return contact
-        return None
+        contact = self._contacts_by_id.get(contact_id)
+        if contact is None and self.lazy_contacts:
+            owner = self.storage.contact_owner(contact_id)
+            if owner is not None and owner not in self._materialized_users:
+                self._ensure_user_loaded(owner)
+                contact = self._contacts_by_id.get(contact_id)
+        return contact
 
+    @_refreshed
     def get_user_contact_by_id(self, contact_id: int) -> Optional[Contact]:
         """
         Get a contact by ID, only if it belongs to the current user.
@@ -266,11 +748,12 @@ class PhoneBookSystem:
         if not self.current_user:
             return None
         
-        for contact in self.contacts:
-            if contact.contact_id == contact_id and contact.user_id == self.current_user.user_id:
-                return contact
+        contact = self.get_contact_by_id(contact_id)
+        if contact and contact.user_id == self.current_user.user_id:
+            return contact
         return None
 
+    @_synchronized
     def toggle_favorite_contact(self, contact_id: int) -> Optional[bool]:
         """
         Toggle the is_favorite status of a contact.
@@ -282,204 +765,621 @@ class PhoneBookSystem:
         contact = self.get_user_contact_by_id(contact_id)
         
         if contact:
+            self._counters.remove(contact)
             if contact.is_favorite:
                 contact.unmark_favorite()
                 result = False
             else:
                 contact.mark_as_favorite()
                 result = True
-            self._save_contacts()
+            self._counters.add(contact)
+            self._persist_contact_changes([('U', contact)])
             return result
         return None
     
-    def search_contacts(self, keyword: str) -> List[Contact]:
+    @_refreshed
+    def get_user_contacts(self, include_blocked: bool = False) -> List[Contact]:
+        """
+        Get the current user's contacts from their partition, in insertion order.
+        """
         if not self.current_user:
             return []
         
-        results = []
+        partition = self._user_partition(self.current_user.user_id)
+        if include_blocked:
+            return list(partition.values())
+        return [contact for contact in partition.values() if not contact.is_blocked]
+    
+    @_refreshed
+    def iter_user_contacts(self, order: str = 'name', include_blocked: bool = False) -> Iterator[Contact]:
+        """
+        Iterate the current user's contacts in a maintained sort order:
+        'name' (first, last), 'last_name' (last, first) or 'updated' (most recent first).
+        """
+        if not self.current_user:
+            return
+        
+        partition = self._user_partition(self.current_user.user_id)
+        for contact_id in self._sorted_index.iter_ids(self.current_user.user_id, order):
+            contact = partition.get(contact_id)
+            if contact is not None and (include_blocked or not contact.is_blocked):
+                yield contact
+    
+    @_refreshed
+    def search_contacts(self, keyword: str) -> List[Contact]:
+        if not self.current_user:
+            return []
+        return list(self._iter_search_results(keyword))
+    
+    def _iter_search_results(self, keyword: str, after: Optional[int] = None) -> Iterator[Contact]:
+        """
+        Yield matches in list order, skipping those at or before insertion position `after`.
+        """
         keyword_lower = keyword.lower()
-        for contact in self.contacts:
-            if contact.user_id == self.current_user.user_id and not contact.is_blocked:
+        partition = self._user_partition(self.current_user.user_id)
+        if not self._search_index.has_user(self.current_user.user_id):
+            self._search_index.build_user(self.current_user.user_id, partition.values())
+        candidate_ids = self._search_index.candidates(self.current_user.user_id, keyword_lower)
+        if candidate_ids is None:
+            # Từ khóa ngắn hơn 3 ký tự: quét toàn bộ phân vùng của người dùng
+            candidates = partition.values()
+            if after is not None:
+                candidates = (c for c in candidates if self._contact_order[c.contact_id] > after)
+        else:
+            ordered_ids = sorted(candidate_ids, key=self._contact_order.get)
+            if after is not None:
+                positions = [self._contact_order[contact_id] for contact_id in ordered_ids]
+                ordered_ids = ordered_ids[bisect_right(positions, after):]
+            candidates = (partition[contact_id] for contact_id in ordered_ids
+                          if contact_id in partition)
+        
+        for contact in candidates:
+            if not contact.is_blocked:
                 search_fields = [
                     contact.first_name, contact.last_name, contact.phone,
                     contact.email, contact.address, contact.group, contact.notes
                 ]
                 if any(keyword_lower in str(field).lower() for field in search_fields):
-                    results.append(contact)
-        return results
+                    yield contact
     
+    @_refreshed
     def get_contacts_by_group(self, group: str) -> List[Contact]:
         if not self.current_user:
             return []
         
-        return [contact for contact in self.contacts 
-                if contact.user_id == self.current_user.user_id 
-                and contact.group == group 
+        return [contact for contact in self._user_partition(self.current_user.user_id).values()
+                if contact.group == group 
                 and not contact.is_blocked]
     
+    @_refreshed
+    def find_duplicate_contacts(self, threshold: float = MERGE_THRESHOLD) -> List[Dict]:
+        """
+        Propose merges of the current user's likely duplicate contacts.
+        Returns [{"keep", "duplicates", "score", "reasons"}], ready for apply_merges().
+        """
+        if not self.current_user:
+            return []
+        partition = self._user_partition(self.current_user.user_id)
+        return find_duplicates(partition.values(),
+                               lambda contact: self._phone_index.key_for(contact.contact_id),
+                               threshold)
+    
+    @_synchronized
+    def apply_merges(self, proposals: List[Dict]) -> Dict:
+        """
+        Merge each proposal's duplicates into its kept contact and delete them, persisting once.
+        Returns {"kept", "merged", "errors"}.
+        """
+        results = {"kept": 0, "merged": 0, "errors": []}
+        if not self.current_user:
+            return results
+        
+        # Gom các đề xuất theo liên hệ được giữ: mỗi liên hệ chỉ được cập nhật chỉ mục một lần
+        merges: Dict[int, Tuple[Contact, List[Contact]]] = {}
+        removed = set()
+        for proposal in proposals:
+            keep = self.get_user_contact_by_id(proposal["keep"])
+            if keep is None or keep.contact_id in removed:
+                results["errors"].append({"contact_id": proposal["keep"], "error": "Contact to keep not found."})
+                continue
+            
+            duplicates = []
+            for contact_id in proposal["duplicates"]:
+                duplicate = self.get_user_contact_by_id(contact_id)
+                if (duplicate is None or contact_id in removed or contact_id == keep.contact_id
+                        or contact_id in merges):
+                    results["errors"].append({"contact_id": contact_id, "error": "Duplicate not found."})
+                    continue
+                duplicates.append(duplicate)
+                removed.add(contact_id)
+            if not duplicates:
+                continue
+            
+            merges.setdefault(keep.contact_id, (keep, []))[1].extend(duplicates)
+        
+        if not merges:
+            return results
+        
+        # Cập nhật chỉ mục theo lô: mỗi danh sách đã sắp xếp chỉ lọc và sắp lại một lần
+        kept = [keep for keep, _ in merges.values()]
+        duplicates = [duplicate for _, group in merges.values() for duplicate in group]
+        self._before_contacts_update(kept)
+        for keep, group in merges.values():
+            for duplicate in group:
+                merge_contact_fields(keep, duplicate)
+        self._after_contacts_update(kept)
+        self._unindex_contacts(duplicates)
+        self.contacts[:] = [contact for contact in self.contacts if contact.contact_id not in removed]
+        
+        self._persist_contact_changes([('D', duplicate) for duplicate in duplicates] +
+                                      [('U', keep) for keep in kept])
+        results["kept"] = len(kept)
+        results["merged"] = len(duplicates)
+        return results
+    
+    @_refreshed
+    def lookup_by_phone(self, phone: str, all_users: bool = False) -> List[Contact]:
+        """
+        Find contacts by phone number regardless of formatting ("+84 912 345 678",
+        "0912345678", ...). Searches the current user's contacts, or every user's
+        contacts with all_users=True (admin only). Blocked contacts are included.
+        """
+        if not self.current_user:
+            return []
+        if all_users:
+            if self.current_user.role != "admin":
+                return []
+            self._ensure_all_contacts_loaded()
+            contact_ids = self._phone_index.lookup(phone)
+        else:
+            self._ensure_user_loaded(self.current_user.user_id)
+            contact_ids = self._phone_index.lookup(phone, self.current_user.user_id)
+        return [self._contacts_by_id[contact_id] for contact_id in sorted(contact_ids, key=self._contact_order.get)]
+    
+    @_refreshed
+    def complete(self, prefix: str, limit: int = 10) -> List[Contact]:
+        """
+        Search-as-you-type: up to `limit` of the current user's unblocked contacts whose
+        first, last or full name (accent-insensitive) or phone digits start with `prefix`.
+        """
+        if not self.current_user or limit <= 0:
+            return []
+        user_id = self.current_user.user_id
+        partition = self._user_partition(user_id)
+        if not self._prefix_index.has_user(user_id):
+            self._prefix_index.build_user(user_id, partition.values())
+        
+        results = []
+        for contact_id in self._prefix_index.iter_matches(user_id, prefix):
+            contact = partition.get(contact_id)
+            if contact is not None and not contact.is_blocked:
+                results.append(contact)
+                if len(results) >= limit:
+                    break
+        return results
+    
+    @_refreshed
+    def fuzzy_search(self, query: str, max_distance: Optional[int] = None,
+                     limit: int = 10) -> List[Tuple[Contact, int]]:
+        """
+        Typo-tolerant name search: up to `limit` (contact, distance) pairs for the current
+        user's unblocked contacts, closest first (ties by contact ID). Every query word must
+        be within `max_distance` edits of a first/last name word (accent-insensitive);
+        distance is the sum over the query words. max_distance None allows 0 edits for
+        words of up to 2 characters, 1 up to 5 and 2 for longer words.
+        """
+        if not self.current_user or limit <= 0:
+            return []
+        user_id = self.current_user.user_id
+        partition = self._user_partition(user_id)
+        if not self._fuzzy_index.has_user(user_id):
+            self._fuzzy_index.build_user(user_id, partition.values())
+        
+        # Nới dần tổng khoảng cách cho phép: mọi liên hệ bị loại ở mức `max_total` đều xa hơn
+        # các liên hệ đã tìm được, nên đủ `limit` kết quả thì dừng mà thứ hạng không đổi
+        ceiling = sum(self._fuzzy_index.query_limits(query, max_distance).values())
+        results = []
+        for max_total in range(ceiling + 1):
+            # Đống (khoảng cách, contact_id): chỉ lấy ra đủ `limit` phần tử thay vì sắp xếp toàn bộ
+            ranked = [(distance, contact_id) for contact_id, distance
+                      in self._fuzzy_index.search(user_id, query, max_distance, max_total).items()]
+            heapq.heapify(ranked)
+            results = []
+            while ranked and len(results) < limit:
+                distance, contact_id = heapq.heappop(ranked)
+                contact = partition.get(contact_id)
+                if contact is not None and not contact.is_blocked:
+                    results.append((contact, distance))
+            if len(results) >= limit:
+                break
+        return results
+    
+    @_refreshed
     def get_favorite_contacts(self) -> List[Contact]:
         if not self.current_user:
             return []
         
-        return [contact for contact in self.contacts 
-                if contact.user_id == self.current_user.user_id 
-                and contact.is_favorite 
+        return [contact for contact in self._user_partition(self.current_user.user_id).values()
+                if contact.is_favorite 
                 and not contact.is_blocked]
     
+    def _page(self, entries: Iterator[tuple], limit: int) -> Dict:
+        """
+        Build a page from (cursor_value, item) pairs: up to `limit` items plus the
+        opaque cursor of the last one, or None when nothing follows.
+        """
+        items = []
+        last_value = None
+        for value, item in entries:
+            if len(items) == limit:
+                return {"items": items, "next_cursor": encode_cursor(last_value)}
+            items.append(item)
+            last_value = value
+        return {"items": items, "next_cursor": None}
+    
+    @_refreshed
+    def get_contacts_page(self, limit: int = 20, cursor: Optional[str] = None,
+                          order: str = 'name', favorites_only: bool = False) -> Dict:
+        """
+        Page through the current user's contacts in a maintained sort order.
+        Returns {"items": [...], "next_cursor": str or None}; pass next_cursor back for the next page.
+        """
+        if not self.current_user:
+            return {"items": [], "next_cursor": None}
+        
+        partition = self._user_partition(self.current_user.user_id)
+        after = decode_cursor(cursor, CURSOR_SHAPES.get(order, ()))
+        
+        def entries():
+            for key in self._sorted_index.iter_keys(self.current_user.user_id, order, after):
+                contact = partition.get(key[-1])
+                if contact is None or contact.is_blocked:
+                    continue
+                if favorites_only and not contact.is_favorite:
+                    continue
+                yield key, contact
+        
+        return self._page(entries(), limit)
     
+    @_refreshed
+    def get_favorite_contacts_page(self, limit: int = 20, cursor: Optional[str] = None) -> Dict:
+        return self.get_contacts_page(limit, cursor, favorites_only=True)
+    
+    @_refreshed
+    def search_contacts_page(self, keyword: str, limit: int = 20, cursor: Optional[str] = None) -> Dict:
+        if not self.current_user:
+            return {"items": [], "next_cursor": None}
+        
+        entries = ((self._contact_order[contact.contact_id], contact)
+                   for contact in self._iter_search_results(keyword, decode_cursor(cursor)))
+        return self._page(entries, limit)
     
     def export_contacts_to_txt(self, filename: str) -> bool:
+        return self.export_contacts(filename, fmt='txt')
+    
+    def _export_selection(self, group: Optional[str], favorites_only: bool) -> Iterator[Contact]:
+        for contact in self._user_partition(self.current_user.user_id).values():
+            if contact.is_blocked:
+                continue
+            if group is not None and contact.group != group:
+                continue
+            if favorites_only and not contact.is_favorite:
+                continue
+            yield contact
+    
+    @_refreshed
+    def export_contacts_chunks(self, fmt: str = 'csv', fields: Optional[List[str]] = None,
+                               group: Optional[str] = None, favorites_only: bool = False,
+                               chunk_rows: int = EXPORT_CHUNK_ROWS) -> Optional[Iterator[str]]:
+        """
+        Same selection and formats as export_contacts, returned as an iterator of text pieces
+        (about chunk_rows rows each) for streaming; None when there is nothing to export.
+        The selection is fixed now; rows are formatted as the iterator is advanced, so callers
+        sharing the system between threads must advance it on the system's thread.
+        """
+        if not self.current_user:
+            return None
+        # Chỉ giữ danh sách tham chiếu, nội dung được định dạng dần theo từng phần
+        contacts = list(self._export_selection(group, favorites_only))
+        if not contacts:
+            return None
+        return iter_contact_chunks(contacts, fmt, fields, chunk_rows)
+    
+    @_refreshed
+    def export_contacts(self, filename: str, fmt: str = 'csv', fields: Optional[List[str]] = None,
+                        group: Optional[str] = None, favorites_only: bool = False,
+                        compress: Optional[bool] = None) -> bool:
+        """
+        Stream the current user's contacts to a file as 'txt', 'csv' or 'jsonl'.
+        Rows go straight from the user's partition to a buffered (optionally gzip) writer.
+        compress defaults to True when filename ends with '.gz'.
+        """
         if not self.current_user:
             return False
+        # Kiểm tra định dạng trước khi mở file để không để lại file rỗng
+        if fmt not in EXPORT_FORMATS:
+            print(f"Export error: Unsupported export format: {fmt}")
+            return False
         
-        user_contacts = [contact for contact in self.contacts 
-                        if contact.user_id == self.current_user.user_id 
-                        and not contact.is_blocked]
-        
-        if not user_contacts:
+        selected_contacts = functools.partial(self._export_selection, group, favorites_only)
+        if next(selected_contacts(), None) is None:
             return False
         
+        if compress is None:
+            compress = filename.endswith('.gz')
+        
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                # Ghi tiêu đề
-                header = "first_name,last_name,phone,email,address,group,notes"
-                f.write(header + '\n')
-                
-                # Ghi dữ liệu từng liên hệ
-                for contact in user_contacts:
-                    line = ",".join([
-                        contact.first_name,
-                        contact.last_name,
-                        contact.phone,
-                        contact.email,
-                        contact.address,
-                        contact.group,
-                        contact.notes.replace('\n', ' ') 
-                    ])
-                    f.write(line + '\n')
+            with open_export_file(filename, compress) as f:
+                write_contacts(f, selected_contacts(), fmt, fields)
             return True
         except Exception as e:
             print(f"Export error: {e}")
             return False
     
-    def import_contacts_from_txt(self, filename: str) -> Dict[str, int]:
+    @_synchronized
+    def add_contacts_bulk(self, rows: List[Dict], persist: bool = True) -> Dict:
+        """
+        Validate and add many contacts for the current user, persisting once.
+        Each row is a dict of contact fields; an optional 'line' key is echoed in error details.
+        With persist=False the caller is responsible for saving afterwards.
+        Returns {"success", "failed", "total", "errors": [{"line", "error"}]}.
+        """
+        results = {"success": 0, "failed": 0, "total": 0, "errors": []}
         if not self.current_user:
-            return {"success": 0, "failed": 0, "total": 0}
+            return results
+        
+        self._ensure_user_loaded(self.current_user.user_id)
+        new_contacts = []
+        for position, row in enumerate(rows, 1):
+            results["total"] += 1
+            line = row.get('line', position)
+            phone = row.get('phone')
+            if not phone:
+                results["failed"] += 1
+                results["errors"].append({"line": line, "error": "Missing phone number."})
+                continue
+            
+            new_contacts.append(Contact(
+                self.next_contact_id + len(new_contacts),
+                self.current_user.user_id,
+                row.get('first_name', ''),
+                row.get('last_name', ''),
+                phone,
+                email=row.get('email', ''),
+                address=row.get('address', ''),
+                group=row.get('group', 'General'),
+                notes=row.get('notes', '')
+            ))
         
-        results = {"success": 0, "failed": 0, "total": 0}
+        if new_contacts:
+            self.next_contact_id += len(new_contacts)
+            self.contacts.extend(new_contacts)
+            for contact in new_contacts:
+                self._index_contact(contact)
+            if persist:
+                self._persist_contact_changes([('A', contact) for contact in new_contacts])
+        
+        results["success"] = len(new_contacts)
+        return results
+    
+    @_synchronized
+    def import_contacts_from_txt(self, filename: str,
+                                 progress_callback: Optional[ProgressCallback] = None,
+                                 batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+        """
+        Stream contacts from a CSV/TXT file with a header line.
+        Rows are parsed with proper quoting and added in fixed-size batches, so memory
+        stays bounded by batch_size. progress_callback receives an ImportProgress after each batch.
+        """
+        results = {"success": 0, "failed": 0, "total": 0, "errors": []}
+        if not self.current_user:
+            return results
         
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                if not lines:
-                    return results
-                
-                # Giả định dòng đầu tiên là tiêu đề (header)
-                header = [h.strip() for h in lines[0].strip().split(',')]
-                
-                for line in lines[1:]: # Bỏ qua dòng tiêu đề
-                    line = line.strip()
-                    if not line:
-                        continue
-                        
-                    results["total"] += 1
-                    try:
-                        # Tách các trường dữ liệu dựa trên dấu phẩy (,)
-                        values = [v.strip() for v in line.split(',')]
-                        
-                        # Tạo một dictionary từ header và values
-                        if len(header) != len(values):
-                            raise ValueError("Mismatched number of fields in line.")
-                        
-                        row = dict(zip(header, values))
-                        
-                        phone = row.get('phone')
-                        if not phone:
-                            results["failed"] += 1
-                            continue
-                        
-                        # Thêm liên hệ
-                        self.add_contact(
-                            first_name=row.get('first_name', ''),
-                            last_name=row.get('last_name', ''),
-                            phone=phone,
-                            email=row.get('email', ''),
-                            address=row.get('address', ''),
-                            group=row.get('group', 'General'),
-                            notes=row.get('notes', '')
-                        )
-                        results["success"] += 1
-                    except Exception as e:
-                        print(f"Import line failed: {e}")
-                        results["failed"] += 1
+            progress = ImportProgress(os.path.getsize(filename))
+            with open(filename, 'r', encoding='utf-8', newline='') as f:
+                for batch in stream_import_batches(f, batch_size, progress):
+                    rows = [row for row in batch if 'error' not in row]
+                    parse_errors = [row for row in batch if 'error' in row]
+                    
+                    # Ghi tăng dần (log/SQLite): ghi từng lô; snapshot: ghi file một lần ở cuối
+                    batch_results = self.add_contacts_bulk(rows, persist=self.storage.incremental_writes)
+                    results["success"] += batch_results["success"]
+                    results["failed"] += batch_results["failed"] + len(parse_errors)
+                    results["total"] += batch_results["total"] + len(parse_errors)
+                    errors = sorted(batch_results["errors"] + parse_errors, key=lambda e: e["line"])
+                    results["errors"].extend(errors[:MAX_IMPORT_ERRORS - len(results["errors"])])
+                    
+                    if progress_callback:
+                        progress_callback(progress)
         except Exception as e:
             print(f"Import error: {e}")
         
+        if results["success"] and not self.storage.incremental_writes:
+            self._save_contacts()
         return results
     
+    @_synchronized
+    def create_backup(self) -> Dict:
+        """
+        Write an incremental backup: only record chunks changed since the last backup
+        are stored. Returns the BackupStore report (manifest path, chunks written/reused).
+        Runs under the data directory lock: retention deletes unreferenced chunks, which
+        another process's backup may be about to reference.
+        """
+        self._ensure_all_contacts_loaded()
+        return self.backup_store.create(self.users, self.contacts)
+    
     def backup_data(self) -> str:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(self.backups_dir, f"backup_{timestamp}.txt")
-        
-        backup_lines = [f"--- PhoneBook System Backup: {timestamp} ---"]
-        
-        # Sao lưu Users
-        backup_lines.append("\n### USERS ###")
-        for user in self.users:
-            user_data = user.to_dict()
-            backup_lines.append(f"User ID: {user_data['user_id']}")
-            backup_lines.append(f"  Username: {user_data['username']}")
-            backup_lines.append(f"  Email: {user_data['email']}")
-            backup_lines.append(f"  Role: {user_data['role']}")
-            backup_lines.append(f"  Is Active: {user_data['is_active']}")
-            # Không nên sao lưu password_hash vào plain text
-            backup_lines.append("  (Password hash omitted)")
-            backup_lines.append("-" * 20)
-            
-        # Sao lưu Contacts
-        backup_lines.append("\n### CONTACTS ###")
-        for contact in self.contacts:
-            contact_data = contact.to_dict()
-            backup_lines.append(f"Contact ID: {contact_data['contact_id']} | User ID: {contact_data['user_id']}")
-            backup_lines.append(f"  Name: {contact_data['first_name']} {contact_data['last_name']}")
-            backup_lines.append(f"  Phone: {contact_data['phone']}")
-            backup_lines.append(f"  Email: {contact_data.get('email', 'N/A')}")
-            backup_lines.append(f"  Group: {contact_data.get('group', 'N/A')}")
-            backup_lines.append(f"  Notes: {contact_data.get('notes', 'N/A')[:50]}...")
-            backup_lines.append("=" * 30)
-
-        # Ghi nội dung vào file .txt
         try:
-            with open(backup_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(backup_lines))
-            return backup_file
+            return self.create_backup()["manifest"]
         except Exception as e:
             print(f"Error during backup: {e}")
             return f"Backup failed: {e}"
     
+    def list_backups(self) -> List[str]:
+        return self.backup_store.list_backups()
+    
+    @_synchronized
+    def restore_backup(self, manifest: Optional[str] = None) -> bool:
+        """
+        Replace all users and contacts with those of a backup (the latest by default).
+        """
+        try:
+            users, contacts = self.backup_store.restore(manifest)
+        except Exception as e:
+            print(f"Error restoring backup: {e}")
+            return False
+        self._replace_state(users, contacts)
+        return True
+    
+    @_refreshed
+    def snapshot(self, path: Optional[str] = None) -> str:
+        """
+        Dump the full users + contacts state to a binary snapshot file and return its path.
+        """
+        self._ensure_all_contacts_loaded()
+        path = path or self.snapshot_file
+        write_snapshot(path, self.users, self.contacts)
+        return path
+    
+    @_synchronized
+    def restore_snapshot(self, path: Optional[str] = None, persist: bool = True) -> bool:
+        """
+        Load a snapshot written by snapshot(), rebuild the in-memory indexes in one pass
+        and (unless persist is False) write the restored state to storage.
+        """
+        try:
+            users, contacts = read_snapshot(path or self.snapshot_file)
+        except Exception as e:
+            print(f"Error restoring snapshot: {e}")
+            return False
+        self._replace_state(users, contacts, persist)
+        return True
+    
+    def _replace_state(self, users: List[User], contacts: List[Contact], persist: bool = True):
+        # Nạp hết liên hệ trước để chế độ lazy không chép lại các dòng cũ khi ghi
+        self._ensure_all_contacts_loaded()
+        self.users = users
+        self.contacts = contacts
+        self._dirty_users.clear()
+        self._rebuild_user_indexes()
+        self._rebuild_contact_indexes()
+        self.next_user_id = max([user.user_id for user in self.users] + [0]) + 1
+        self.next_contact_id = max([contact.contact_id for contact in self.contacts] + [0]) + 1
+        if self.current_user:
+            self.current_user = self._users_by_id.get(self.current_user.user_id)
+        
+        if not persist:
+            return
+        self._save_users()
+        if isinstance(self.storage, TextStorage) and self.storage.has_log():
+            self.compact_contact_log()
+            self._journal.append([record_reload('contacts')])
+        else:
+            self._save_contacts()
+    
+    @_refreshed
+    def stats(self, user_id: Optional[int] = None) -> Dict:
+        """
+        Contact counters of the current user (or of user_id, admin only):
+        {"contacts", "favorites", "blocked", "groups": {group: count}}.
+        """
+        if not self.current_user:
+            return {}
+        if user_id is None:
+            user_id = self.current_user.user_id
+        elif user_id != self.current_user.user_id and self.current_user.role != "admin":
+            return {}
+        self._ensure_user_loaded(user_id)
+        return self._counters.user_counts(user_id)
+    
+    @_refreshed
+    def overall_stats(self) -> Dict:
+        """
+        Totals across all users (admin only), read from the maintained counters.
+        """
+        if not self.current_user or self.current_user.role != "admin":
+            return {}
+        self._ensure_all_contacts_loaded()
+        totals = self._counters.totals()
+        totals["users"] = len(self.users)
+        return totals
+    
+    @_refreshed
+    def verify_stats(self, repair: bool = False) -> Dict:
+        """
+        Recount every loaded contact and compare with the maintained counters.
+        Returns {"consistent", "mismatches": [{"user_id", "expected", "actual"}]};
+        user_id is None for the totals. With repair=True the recount replaces the counters.
+        """
+        expected = ContactCounters()
+        expected.rebuild(self.contacts)
+        expected_counts, actual_counts = expected.snapshot(), self._counters.snapshot()
+        
+        mismatches = []
+        for user_id in sorted(set(expected_counts["users"]) | set(actual_counts["users"])):
+            wanted = expected_counts["users"].get(user_id)
+            found = actual_counts["users"].get(user_id)
+            if wanted != found:
+                mismatches.append({"user_id": user_id, "expected": wanted, "actual": found})
+        if expected_counts["totals"] != actual_counts["totals"]:
+            mismatches.append({"user_id": None, "expected": expected_counts["totals"],
+                               "actual": actual_counts["totals"]})
+        
+        if mismatches and repair:
+            self._counters = expected
+        return {"consistent": not mismatches, "mismatches": mismatches}
+    
+    def enable_metrics(self):
+        """Record call counts, latency and I/O bytes for public methods and _load_/_save_/_persist_ helpers."""
+        self.metrics.instrument(self)
+    
+    def disable_metrics(self):
+        """Stop recording; collected metrics are kept until self.metrics.reset()."""
+        self.metrics.uninstrument(self)
+    
+    @_refreshed
     def get_all_users(self) -> List[User]:
         if not self.current_user or self.current_user.role != "admin":
             return []
         return self.users
     
+    @_refreshed
+    def get_users_page(self, limit: int = 20, cursor: Optional[str] = None) -> Dict:
+        """
+        Page through all users by user_id (admin only).
+        """
+        if not self.current_user or self.current_user.role != "admin":
+            return {"items": [], "next_cursor": None}
+        
+        # self.users được giữ theo thứ tự user_id tăng dần (_rebuild_user_indexes, _add_user)
+        after = decode_cursor(cursor)
+        low = 0 if after is None else self._user_position(after)
+        
+        entries = ((self.users[i].user_id, self.users[i]) for i in range(low, len(self.users)))
+        return self._page(entries, limit)
+    
+    @_synchronized
     def deactivate_user(self, user_id: int) -> bool:
         if not self.current_user or self.current_user.role != "admin":
             return False
         
-        for user in self.users:
-            if user.user_id == user_id:
-                user.is_active = False
-                self._save_users()
-                return True
+        user = self._users_by_id.get(user_id)
+        if user:
+            user.is_active = False
+            self._persist_user(user)
+            return True
         return False
 
+    @_synchronized
     def activate_user(self, user_id: int) -> bool:
         if not self.current_user or self.current_user.role != "admin":
             return False
         
-        for user in self.users:
-            if user.user_id == user_id:
-                user.is_active = True
-                self._save_users()
-                return True
+        user = self._users_by_id.get(user_id)
+        if user:
+            user.is_active = True
+            self._persist_user(user)
+            return True
         return False
\ No newline at end of file
@@ -199,6 +199,59 @@ class TestPhoneBookSystem(unittest.TestCase):
         self.assertEqual(results["success"], 1)
         self.assertEqual(len(self.system.contacts), 1)
         self.assertEqual(self.system.contacts[0].first_name, "John")
+    
+    def test_text_storage_escapes_special_characters(self):
+        """Test that '|', backslashes and newlines in fields survive a reload of the txt files"""
+        self.system.register_user("test|user", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+        self.system.add_contact("X|Y", "Doe", "0912 345 678", notes="C:\\dir\\new|x")
+        self.system.add_contact("Jane", "Roe", "0987654321", notes="l1\nl2\r\nl3")
+        with open(os.path.join(self.test_dir, "contacts.txt"), encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 4)
+        
+        # Reload from the data files alone, without replaying the change journal
+        os.remove(os.path.join(self.test_dir, "changes.log"))
+        for lazy_contacts in (False, True):
+            reloaded = PhoneBookSystem(data_dir=self.test_dir, lazy_contacts=lazy_contacts)
+            self.assertEqual(reloaded.users[0].username, "test|user")
+            reloaded.login("test@example.com", "password123")
+            first, second = sorted(reloaded.get_user_contacts(), key=lambda c: c.contact_id)
+            self.assertEqual((first.first_name, first.last_name), ("X|Y", "Doe"))
+            self.assertEqual(first.notes, "C:\\dir\\new|x")
+            self.assertEqual(second.notes, "l1\nl2\r\nl3")
+            self.assertEqual(reloaded.lookup_by_phone("+84912345678"), [first])
+    
+    def test_export_rejects_unknown_format_without_creating_file(self):
+        """Test that an unsupported export format leaves no empty file behind"""
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+        self.system.add_contact("John", "Doe", "1234567890")
+        for name in ("export_test.xml", "export_test.xml.gz"):
+            export_file = os.path.join(self.test_dir, name)
+            self.assertFalse(self.system.export_contacts(export_file, fmt='xml'))
+            self.assertFalse(os.path.exists(export_file))
+    
+    def test_txt_export_quotes_special_characters(self):
+        """Test that the default txt export quotes commas and re-imports them intact"""
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+        self.system.add_contact("John", "Doe", "1234567890", address="1 Main St, Hanoi",
+                                notes='say "hi"\nlater')
+        self.system.add_contact("Jane", "Roe", "0987654321", email="jane@example.com")
+        
+        export_file = os.path.join(self.test_dir, "export_test.txt")
+        self.assertTrue(self.system.export_contacts_to_txt(export_file))
+        with open(export_file, encoding='utf-8', newline='') as f:
+            lines = f.read().split('\n')
+        self.assertEqual(lines[0], "first_name,last_name,phone,email,address,group,notes")
+        self.assertEqual(lines[2], "Jane,Roe,0987654321,jane@example.com,,General,")
+        
+        self.system.contacts.clear()
+        self.system.next_contact_id = 1
+        results = self.system.import_contacts_from_txt(export_file)
+        self.assertEqual(results["success"], 2)
+        self.assertEqual(self.system.contacts[0].address, "1 Main St, Hanoi")
+        self.assertEqual(self.system.contacts[0].notes, 'say "hi" later')
 
 class TestModels(unittest.TestCase):
     """Test cases for models (User and Contact)"""
@@ -251,6 +304,26 @@ class TestModels(unittest.TestCase):
         contact.unmark_favorite()
         self.assertFalse(contact.is_favorite)
 
+    def test_compact_contact_layout(self):
+        """Test slots, packed flags, interned groups and integer timestamps"""
+        contact = Contact(1, 1, "John", "Doe", "1234567890", group="".join("Work"),
+                          is_blocked=True, created_at="2025-11-19T15:12:48.553322")
+        
+        self.assertFalse(hasattr(contact, '__dict__'))
+        self.assertIs(contact.group, "Work")
+        self.assertIsInstance(contact._created_at, int)
+        self.assertEqual(contact.created_at, "2025-11-19T15:12:48.553322")
+        self.assertEqual(contact.updated_at, contact.created_at)
+        self.assertEqual((contact.is_favorite, contact.is_blocked), (False, True))
+        contact.mark_as_favorite()
+        contact.unblock_contact()
+        self.assertEqual((contact.is_favorite, contact.is_blocked), (True, False))
+        
+        # Timestamps that would not round-trip exactly are kept as strings
+        odd = Contact(2, 1, "A", "B", "1", created_at="2025-11-19T15:12:48.500")
+        self.assertEqual(odd.created_at, "2025-11-19T15:12:48.500")
+        self.assertEqual(Contact.from_dict(contact.to_dict()).to_dict(), contact.to_dict())
+
 class TestUI(unittest.TestCase):
     """Test cases for UI functionality"""
     
@@ -298,6 +371,1306 @@ class TestUI(unittest.TestCase):
             
         self.assertIn("Registration successful!", output)
 
+class TestLookupIndexes(unittest.TestCase):
+    """Test cases for the ID and email hash indexes"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.register_user("other", "other@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_contact_index_follows_mutations(self):
+        """Test that the contact index is updated on add and delete"""
+        self.system.add_contact("John", "Doe", "1234567890")
+        contact_id = self.system.contacts[0].contact_id
+        self.assertIs(self.system.get_contact_by_id(contact_id), self.system.contacts[0])
+        
+        self.system.delete_contact(contact_id)
+        self.assertIsNone(self.system.get_contact_by_id(contact_id))
+        self.assertIsNone(self.system.get_user_contact_by_id(contact_id))
+    
+    def test_email_index_follows_profile_update(self):
+        """Test that email changes re-key the email index"""
+        user = self.system.current_user
+        self.assertFalse(self.system.update_user_profile(user, email="other@example.com"))
+        self.assertTrue(self.system.update_user_profile(user, email="new@example.com"))
+        
+        self.assertFalse(self.system.email_exists("test@example.com"))
+        self.assertTrue(self.system.login("new@example.com", "password123"))
+        self.assertFalse(self.system.register_user("dup", "new@example.com", "password123"))
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        self.assertTrue(reloaded.login("new@example.com", "password123"))
+
+class TestContactPartitions(unittest.TestCase):
+    """Test cases for per-user contact partitions"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("alice", "alice@example.com", "password123")
+        self.system.register_user("bob", "bob@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_queries_are_owner_scoped(self):
+        """Test that each user only sees their own partition"""
+        self.system.login("alice@example.com", "password123")
+        self.system.add_contact("John", "Doe", "111", group="Work")
+        self.system.toggle_favorite_contact(self.system.contacts[0].contact_id)
+        
+        self.system.login("bob@example.com", "password123")
+        self.system.add_contact("John", "Smith", "222", group="Work")
+        
+        self.assertEqual([c.last_name for c in self.system.get_user_contacts()], ["Smith"])
+        self.assertEqual(len(self.system.search_contacts("john")), 1)
+        self.assertEqual(len(self.system.get_contacts_by_group("Work")), 1)
+        self.assertEqual(self.system.get_favorite_contacts(), [])
+        
+        self.system.login("alice@example.com", "password123")
+        self.assertEqual([c.last_name for c in self.system.get_favorite_contacts()], ["Doe"])
+        self.assertTrue(self.system.delete_contact(self.system.contacts[0].contact_id))
+        self.assertEqual(self.system.get_user_contacts(), [])
+
+class TestTrigramSearch(unittest.TestCase):
+    """Test cases for the trigram-indexed search_contacts"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def _scan(self, keyword):
+        keyword_lower = keyword.lower()
+        return [c for c in self.system.get_user_contacts()
+                if any(keyword_lower in str(getattr(c, f)).lower() for f in
+                       ('first_name', 'last_name', 'phone', 'email', 'address', 'group', 'notes'))]
+    
+    def test_matches_full_scan(self):
+        """Test that indexed search returns exactly the full-scan results"""
+        self.system.add_contact("Nguyen", "Van An", "0912345678", email="an@mail.com", group="Work")
+        self.system.add_contact("Tran", "Thi Binh", "0987654321", address="12 Le Loi", notes="Met at WORK")
+        self.system.add_contact("Le", "Van Cuong", "0912000111", group="Family")
+        self.system.add_contact("Pham", "An", "0123", email="pham@work.vn")
+        self.system.contacts[3].block_contact()
+        
+        # Edits must move the contact between posting lists
+        self.system.edit_contact(self.system.contacts[2].contact_id, last_name="Van Dung")
+        
+        for keyword in ["van", "VAN", "work", "0912", "an", "Dung", "Cuong", "le loi", "", "zzz", "@mail.c"]:
+            self.assertEqual(self.system.search_contacts(keyword), self._scan(keyword), keyword)
+        
+        self.system.delete_contact(self.system.contacts[0].contact_id)
+        self.assertEqual(self.system.search_contacts("van"), self._scan("van"))
+
+class TestBulkImport(unittest.TestCase):
+    """Test cases for batched contact import"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_import_persists_once(self):
+        """Test that an import writes the contacts file once and reports line errors"""
+        import_file = os.path.join(self.test_dir, "import.txt")
+        with open(import_file, 'w', encoding='utf-8') as f:
+            f.write("first_name,last_name,phone,email,address,group,notes\n")
+            f.write("John,Doe,111,,,Work,\n")
+            f.write("Bad,Row,222\n")
+            f.write("No,Phone,,,,General,\n")
+            f.write("Jane,Smith,333,,,Family,\n")
+        
+        with patch.object(self.system, '_save_contacts', wraps=self.system._save_contacts) as save:
+            results = self.system.import_contacts_from_txt(import_file)
+        
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual((results["total"], results["success"], results["failed"]), (4, 2, 2))
+        self.assertEqual([e["line"] for e in results["errors"]], [3, 4])
+        self.assertEqual([c.contact_id for c in self.system.contacts], [1, 2])
+        self.assertEqual(self.system.next_contact_id, 3)
+        self.assertEqual(len(PhoneBookSystem(data_dir=self.test_dir).contacts), 2)
+
+    def test_streaming_import_with_quotes_and_progress(self):
+        """Test quoted commas, fixed-size batches and progress reporting"""
+        import_file = os.path.join(self.test_dir, "import.txt")
+        with open(import_file, 'w', encoding='utf-8') as f:
+            f.write("first_name,last_name,phone,email,address,group,notes\n")
+            for i in range(5):
+                f.write(f'First{i},Last{i},0{i},,"{i} Le Loi, District 1",General,"say ""hi"""\n')
+        
+        updates = []
+        results = self.system.import_contacts_from_txt(
+            import_file, progress_callback=lambda p: updates.append(p.rows), batch_size=2)
+        
+        self.assertEqual(results["success"], 5)
+        self.assertEqual(updates, [2, 4, 5])
+        self.assertEqual(self.system.contacts[0].address, "0 Le Loi, District 1")
+        self.assertEqual(self.system.contacts[0].notes, 'say "hi"')
+
+class TestStreamingExport(unittest.TestCase):
+    """Test cases for the multi-format contact exporter"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+        self.system.add_contact("John", "Doe", "111", address="1 Main St, Hanoi", group="Work")
+        self.system.add_contact("Jane", "Smith", "222", group="Family")
+        self.system.toggle_favorite_contact(self.system.contacts[1].contact_id)
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_csv_round_trip(self):
+        """Test that quoted CSV survives commas and re-imports cleanly"""
+        export_file = os.path.join(self.test_dir, "export.csv")
+        self.assertTrue(self.system.export_contacts(export_file, fmt='csv'))
+        
+        self.system.delete_contact(self.system.contacts[0].contact_id)
+        self.system.delete_contact(self.system.contacts[0].contact_id)
+        results = self.system.import_contacts_from_txt(export_file)
+        self.assertEqual(results["success"], 2)
+        self.assertEqual(self.system.contacts[0].address, "1 Main St, Hanoi")
+    
+    def test_gzip_jsonl_with_filters(self):
+        """Test gzip JSON Lines output with projection and filters"""
+        import gzip
+        import json
+        export_file = os.path.join(self.test_dir, "export.jsonl.gz")
+        self.assertTrue(self.system.export_contacts(export_file, fmt='jsonl',
+                                                    fields=['first_name', 'is_favorite'],
+                                                    favorites_only=True))
+        with gzip.open(export_file, 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, [{"first_name": "Jane", "is_favorite": True}])
+        
+        self.assertFalse(self.system.export_contacts(export_file, group="Nobody"))
+    
+    def test_chunks_match_file_export(self):
+        """Test that the chunked exporter yields the same text as the file exporter"""
+        export_file = os.path.join(self.test_dir, "export.csv")
+        self.assertTrue(self.system.export_contacts(export_file, fmt='csv'))
+        with open(export_file, encoding='utf-8', newline='') as f:
+            expected = f.read()
+        chunks = list(self.system.export_contacts_chunks('csv', chunk_rows=1))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual("".join(chunks), expected)
+        self.assertIsNone(self.system.export_contacts_chunks('csv', group="Nobody"))
+
+class TestLazyLoading(unittest.TestCase):
+    """Test cases for offset-indexed lazy contact loading"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        system = PhoneBookSystem(data_dir=self.test_dir)
+        system.register_user("alice", "alice@example.com", "password123")
+        system.register_user("bob", "bob@example.com", "password123")
+        system.login("alice@example.com", "password123")
+        system.add_contact("John", "Doe", "111")
+        system.add_contact("Jane", "Doe", "222")
+        system.login("bob@example.com", "password123")
+        system.add_contact("Bob's", "Friend", "333")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_only_session_user_is_loaded(self):
+        """Test that contacts are materialized per user on demand"""
+        system = PhoneBookSystem(data_dir=self.test_dir, lazy_contacts=True)
+        self.assertEqual(system.contacts, [])
+        self.assertEqual(system.next_contact_id, 4)
+        self.assertTrue(os.path.exists(system.contacts_index_file))
+        
+        system.login("bob@example.com", "password123")
+        self.assertEqual([c.first_name for c in system.contacts], ["Bob's"])
+        self.assertIsNone(system.get_user_contact_by_id(1))
+        self.assertEqual(system.get_contact_by_id(1).first_name, "John")
+    
+    def test_saves_keep_unloaded_users(self):
+        """Test that saving in lazy mode preserves contacts that were never loaded"""
+        for use_contact_log in (False, True):
+            system = PhoneBookSystem(data_dir=self.test_dir, lazy_contacts=True,
+                                     use_contact_log=use_contact_log)
+            system.login("bob@example.com", "password123")
+            system.add_contact("Another", "Friend", "444")
+            system.compact_contact_log()
+            
+            eager = PhoneBookSystem(data_dir=self.test_dir)
+            self.assertEqual(sorted(c.phone for c in eager.contacts)[:4], ["111", "222", "333", "444"])
+
+class TestSQLiteStorage(unittest.TestCase):
+    """Test cases for the SQLite storage engine"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_round_trip(self):
+        """Test that users and contacts survive a restart, including '|' in fields"""
+        system = PhoneBookSystem(data_dir=self.test_dir, storage="sqlite")
+        system.register_user("testuser", "test@example.com", "password123")
+        system.login("test@example.com", "password123")
+        system.add_contact("John", "Doe", "111", notes="a|b\nc", group="Work")
+        system.add_contact("Jane", "Smith", "222")
+        system.edit_contact(1, first_name="Johnny")
+        system.toggle_favorite_contact(1)
+        system.delete_contact(2)
+        system.storage.close()
+        
+        for lazy_contacts in (False, True):
+            reloaded = PhoneBookSystem(data_dir=self.test_dir, storage="sqlite",
+                                       lazy_contacts=lazy_contacts)
+            self.assertTrue(reloaded.login("test@example.com", "password123"))
+            contacts = reloaded.get_user_contacts()
+            self.assertEqual(len(contacts), 1)
+            self.assertEqual(contacts[0].first_name, "Johnny")
+            self.assertEqual(contacts[0].notes, "a|b\nc")
+            self.assertTrue(contacts[0].is_favorite)
+            self.assertEqual(reloaded.next_contact_id, 2)
+            reloaded.storage.close()
+    
+    def test_migrate_from_text(self):
+        """Test the one-shot txt to SQLite migration"""
+        from storage import migrate_text_to_sqlite
+        system = PhoneBookSystem(data_dir=self.test_dir)
+        system.register_user("testuser", "test@example.com", "password123")
+        system.login("test@example.com", "password123")
+        system.add_contact("John", "Doe", "111")
+        
+        self.assertEqual(migrate_text_to_sqlite(self.test_dir), {"users": 1, "contacts": 1})
+        migrated = PhoneBookSystem(data_dir=self.test_dir, storage="sqlite")
+        self.assertTrue(migrated.login("test@example.com", "password123"))
+        self.assertEqual(migrated.get_user_contacts()[0].first_name, "John")
+        migrated.storage.close()
+
+class TestLoginKdf(unittest.TestCase):
+    """Test cases for salted KDF hashing, hash upgrades and batched last_login writes"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir, login_workers=2)
+    
+    def tearDown(self):
+        self.system.close()
+        shutil.rmtree(self.test_dir)
+    
+    def test_close_shuts_down_login_pool(self):
+        """Test that close() stops the login pool so process workers do not outlive the system"""
+        system = PhoneBookSystem(data_dir=self.test_dir, login_workers=2, login_pool="process")
+        system.register_user("a", "a@example.com", "password123")
+        self.assertIsNotNone(system.authenticate_many([("a@example.com", "password123")])[0])
+        pool = system._login_executor
+        workers = list(pool._processes.values())
+        system.close()
+        self.assertIsNone(system._login_executor)
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+        with self.assertRaises(RuntimeError):
+            pool.submit(len, "")
+    
+    def test_salted_hashes(self):
+        """Test that equal passwords get different salted hashes"""
+        self.system.register_user("a", "a@example.com", "password123")
+        self.system.register_user("b", "b@example.com", "password123")
+        hashes = [u.password_hash for u in self.system.users]
+        self.assertTrue(all(h.startswith("$PBKDF2$") for h in hashes))
+        self.assertNotEqual(hashes[0], hashes[1])
+        
+        results = self.system.authenticate_many([("a@example.com", "password123"),
+                                                 ("b@example.com", "wrong"),
+                                                 ("nobody@example.com", "password123")])
+        self.assertEqual([u.username if u else None for u in results], ["a", None, None])
+    
+    def test_legacy_hash_upgraded_on_login(self):
+        """Test that a legacy SHA-256 hash is replaced by a KDF hash on next login"""
+        import hashlib
+        legacy = hashlib.sha256(b"password123").hexdigest()
+        self.system.users.append(User(1, "old", "old@example.com", legacy))
+        self.system._rebuild_user_indexes()
+        
+        self.assertTrue(self.system.login("old@example.com", "password123"))
+        self.assertTrue(self.system.current_user.password_hash.startswith("$PBKDF2$"))
+        
+        # last_login and the new hash are batched until flush/logout
+        self.assertEqual(PhoneBookSystem(data_dir=self.test_dir).users, [])
+        self.system.logout()
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        self.assertIsNotNone(reloaded.users[0].last_login)
+        self.assertTrue(reloaded.login("old@example.com", "password123"))
+
+class TestSortedListing(unittest.TestCase):
+    """Test cases for the maintained sorted contact listings"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_orders_follow_mutations(self):
+        """Test name, last-name and recently-updated orders across add/rename/delete"""
+        self.system.add_contact("charlie", "Adams", "1")
+        self.system.add_contact("Alice", "Young", "2")
+        self.system.add_contact("bob", "Brown", "3")
+        names = lambda order: [c.first_name for c in self.system.iter_user_contacts(order)]
+        
+        self.assertEqual(names('name'), ["Alice", "bob", "charlie"])
+        self.assertEqual(names('last_name'), ["charlie", "bob", "Alice"])
+        
+        self.system.edit_contact(1, first_name="Aaron")
+        self.assertEqual(names('name'), ["Aaron", "Alice", "bob"])
+        self.assertEqual(names('updated')[0], "Aaron")
+        
+        self.system.delete_contact(2)
+        self.assertEqual(names('name'), ["Aaron", "bob"])
+
+class TestPagination(unittest.TestCase):
+    """Test cases for cursor-based pagination"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("admin", "admin@example.com", "password123", "admin")
+        self.system.login("admin@example.com", "password123")
+        for i in range(7):
+            self.system.add_contact(f"Name{i}", "Test", f"09{i}")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def _collect(self, fetch_page):
+        pages, cursor = [], None
+        while True:
+            page = fetch_page(cursor)
+            pages.append(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+    
+    def test_contact_and_search_pages(self):
+        """Test that pages cover every item once and in order"""
+        pages = self._collect(lambda c: self.system.get_contacts_page(3, c))
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual([c for p in pages for c in p], list(self.system.iter_user_contacts()))
+        
+        pages = self._collect(lambda c: self.system.search_contacts_page("name", 2, c))
+        self.assertEqual([c for p in pages for c in p], self.system.search_contacts("name"))
+        
+        pages = self._collect(lambda c: self.system.search_contacts_page("n", 4, c))
+        self.assertEqual([c for p in pages for c in p], self.system.search_contacts("n"))
+    
+    def test_malformed_cursor_raises_value_error(self):
+        """Test that a forged cursor of the wrong shape is rejected instead of reaching bisect"""
+        from indexes import encode_cursor
+        page = self.system.get_contacts_page(3, order='updated')
+        self.assertEqual(len(self.system.get_contacts_page(3, page["next_cursor"], order='updated')["items"]), 3)
+        for value in ({"a": 1}, 5, [1, 2], ["a", "b", True], None):
+            with self.assertRaises(ValueError):
+                self.system.get_contacts_page(3, encode_cursor(value))
+        for value in ({"a": 1}, "5", [1], True):
+            with self.assertRaises(ValueError):
+                self.system.search_contacts_page("name", 3, encode_cursor(value))
+            with self.assertRaises(ValueError):
+                self.system.get_users_page(3, encode_cursor(value))
+        with self.assertRaises(ValueError):
+            self.system.get_contacts_page(3, encode_cursor([0, 5, 1]), order='updated')
+        with self.assertRaises(ValueError):
+            self.system.get_contacts_page(3, "not base64!")
+    
+    def test_users_page(self):
+        """Test that the admin user listing pages by user ID"""
+        for i in range(4):
+            self.system.register_user(f"user{i}", f"user{i}@example.com", "password123")
+        pages = self._collect(lambda c: self.system.get_users_page(2, c))
+        self.assertEqual([u.user_id for p in pages for u in p], [1, 2, 3, 4, 5])
+        
+        # A users file that is not in user_id order still pages correctly after a reload
+        self.system.storage.save_users(list(reversed(self.system.users)))
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        reloaded.login("admin@example.com", "password123")
+        pages = self._collect(lambda c: reloaded.get_users_page(2, c))
+        self.assertEqual([u.user_id for p in pages for u in p], [1, 2, 3, 4, 5])
+
+class TestIncrementalBackup(unittest.TestCase):
+    """Test cases for content-addressed incremental backups"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir, backup_retention=2)
+        self.system.register_user("admin", "admin@example.com", "password123", "admin")
+        self.system.login("admin@example.com", "password123")
+        self.system.backup_store.chunk_records = 4
+        for i in range(10):
+            self.system.add_contact(f"Name{i}", "Test", f"09{i}")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_only_changed_chunks_are_written(self):
+        """Test that a second backup only stores the chunk that changed"""
+        first = self.system.create_backup()
+        self.assertEqual(first["chunks_written"], 4)  # 1 user chunk + 3 contact chunks
+        
+        unchanged = self.system.create_backup()
+        self.assertEqual(unchanged["chunks_written"], 0)
+        
+        self.system.edit_contact(1, first_name="Changed")
+        changed = self.system.create_backup()
+        self.assertEqual(changed["chunks_written"], 1)
+        self.assertEqual(changed["chunks_reused"], 3)
+        
+        # Retention 2: the old chunk stays while the second manifest still references it
+        self.assertEqual(changed["chunks_removed"], 0)
+        latest = self.system.create_backup()
+        self.assertEqual(latest["chunks_removed"], 1)
+        self.assertEqual(self.system.list_backups(), [changed["manifest"], latest["manifest"]])
+    
+    def test_backup_waits_for_data_directory_lock(self):
+        """Test that a backup (which prunes chunks) waits while another process holds the lock"""
+        import threading
+        from sync import ChangeJournal
+        other = ChangeJournal(self.test_dir)
+        reports = []
+        with other.locked():
+            worker = threading.Thread(target=lambda: reports.append(self.system.create_backup()))
+            worker.start()
+            worker.join(0.3)
+            self.assertEqual(reports, [])
+        worker.join(5)
+        other.close()
+        self.assertEqual(len(reports), 1)
+    
+    def test_restore_backup(self):
+        """Test restoring users and contacts from the latest backup"""
+        self.system.create_backup()
+        self.system.delete_contact(1)
+        self.system.add_contact("Extra", "Contact", "0999")
+        
+        self.assertTrue(self.system.restore_backup())
+        self.assertEqual(len(self.system.contacts), 10)
+        self.assertEqual(self.system.get_contact_by_id(1).first_name, "Name0")
+        self.assertEqual(self.system.search_contacts("Extra"), [])
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        self.assertEqual(len(reloaded.contacts), 10)
+        self.assertIsNotNone(reloaded.authenticate("admin@example.com", "password123"))
+    
+    def test_round_trip_special_characters(self):
+        """Test that '|' and newlines in fields survive a backup and restore"""
+        contact = self.system.get_contact_by_id(1)
+        contact.update_contact(address="12 Main St|Apt 4", notes="a|True|True")
+        self.system.get_contact_by_id(2).update_contact(notes="line1\nline2")
+        self.system.create_backup()
+        
+        users, contacts = self.system.backup_store.restore()
+        restored = {c.contact_id: c for c in contacts}
+        self.assertEqual(len(contacts), 10)
+        self.assertEqual((restored[1].address, restored[1].notes), ("12 Main St|Apt 4", "a|True|True"))
+        self.assertFalse(restored[1].is_favorite)
+        self.assertFalse(restored[1].is_blocked)
+        self.assertEqual(restored[1].created_at, contact.created_at)
+        self.assertEqual(restored[2].notes, "line1\nline2")
+        self.assertEqual([u.email for u in users], ["admin@example.com"])
+
+class TestSnapshot(unittest.TestCase):
+    """Test cases for binary snapshot and restore"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("admin", "admin@example.com", "password123", "admin")
+        self.system.login("admin@example.com", "password123")
+        self.system.add_contact("John", "Doe", "0901", notes="x" * 200, group="Work")
+        self.system.add_contact("Jane", "Roe", "0902")
+        self.system.toggle_favorite_contact(1)
+        self.system.get_contact_by_id(2).block_contact()
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_snapshot_round_trip(self):
+        """Test that a snapshot restores every field"""
+        before = [c.to_dict() for c in self.system.contacts]
+        path = self.system.snapshot()
+        self.system.delete_contact(1)
+        
+        self.assertTrue(self.system.restore_snapshot(path))
+        self.assertEqual([c.to_dict() for c in self.system.contacts], before)
+        self.assertEqual(self.system.search_contacts("John")[0].notes, "x" * 200)
+        self.assertEqual(self.system.next_contact_id, 3)
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        self.assertTrue(reloaded.get_contact_by_id(1).is_favorite)
+        self.assertIsNotNone(reloaded.authenticate("admin@example.com", "password123"))
+    
+    def test_corrupted_snapshot(self):
+        """Test that a damaged snapshot is rejected and leaves the state untouched"""
+        path = self.system.snapshot()
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        
+        self.system.delete_contact(1)
+        self.assertFalse(self.system.restore_snapshot(path))
+        self.assertEqual(len(self.system.contacts), 1)
+    
+    def test_snapshot_is_fsynced_and_kept_on_error(self):
+        """Test that a snapshot is fsynced before the rename and a failed write keeps the old one"""
+        import snapshot
+        path = self.system.snapshot()
+        with open(path, 'rb') as f:
+            before = f.read()
+        with patch('storage.os.fsync', wraps=os.fsync) as fsync:
+            snapshot.write_snapshot(path, self.system.users, self.system.contacts)
+        self.assertGreaterEqual(fsync.call_count, 1)
+        
+        with patch('snapshot._pack_records', side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                snapshot.write_snapshot(path, self.system.users, self.system.contacts)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+class TestSharedDataDirectory(unittest.TestCase):
+    """Test cases for several instances sharing one data directory"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.first = PhoneBookSystem(data_dir=self.test_dir)
+        self.first.register_user("alice", "alice@example.com", "password123")
+        self.second = PhoneBookSystem(data_dir=self.test_dir)
+        self.first.login("alice@example.com", "password123")
+        self.second.login("alice@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_no_lost_writes(self):
+        """Test that interleaved writes from two instances are all kept with unique IDs"""
+        self.first.add_contact("From", "First", "0901")
+        self.second.add_contact("From", "Second", "0902")
+        self.first.add_contact("Again", "First", "0903")
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        self.assertEqual(sorted(c.contact_id for c in reloaded.contacts), [1, 2, 3])
+        self.assertEqual(sorted(c.last_name for c in reloaded.contacts), ["First", "First", "Second"])
+    
+    def test_delta_reload(self):
+        """Test that only changed records are applied, keeping the other objects"""
+        self.first.add_contact("John", "Doe", "0901")
+        self.first.add_contact("Jane", "Roe", "0902")
+        kept = self.second.get_contact_by_id(2)
+        
+        with patch.object(self.second, '_load_state') as full_reload:
+            self.first.edit_contact(2, first_name="Janet")
+            self.first.delete_contact(1)
+            self.first.update_user_profile(self.first.current_user, username="alice2")
+            
+            self.assertEqual([c.first_name for c in self.second.get_user_contacts()], ["Janet"])
+            self.assertIsNone(self.second.get_contact_by_id(1))
+            self.assertEqual(self.second.current_user.username, "alice2")
+            full_reload.assert_not_called()
+        self.assertIs(self.second.get_contact_by_id(2), kept)
+    
+    def test_delta_reload_keeps_special_characters(self):
+        """Test that journal records round-trip '|' and newlines (SQLite stores them as-is)"""
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        first = PhoneBookSystem(data_dir=test_dir, storage="sqlite")
+        first.register_user("bob", "bob@example.com", "password123")
+        second = PhoneBookSystem(data_dir=test_dir, storage="sqlite")
+        first.login("bob@example.com", "password123")
+        second.login("bob@example.com", "password123")
+        self.addCleanup(first.storage.close)
+        self.addCleanup(second.storage.close)
+        
+        first.add_contact("Pipe", "Note", "0901", notes="x|True|True")
+        first.add_contact("Multi", "Line", "0902", address="a|b", notes="l1\nl2")
+        contacts = {c.first_name: c for c in second.get_user_contacts()}
+        self.assertEqual(contacts["Pipe"].notes, "x|True|True")
+        self.assertFalse(contacts["Pipe"].is_favorite)
+        self.assertFalse(contacts["Pipe"].is_blocked)
+        self.assertEqual((contacts["Multi"].address, contacts["Multi"].notes), ("a|b", "l1\nl2"))
+
+class TestHttpServer(unittest.TestCase):
+    """Test cases for the asyncio HTTP/JSON API"""
+    
+    def setUp(self):
+        import asyncio
+        import threading
+        from server import PhoneBookServer
+        
+        self.test_dir = tempfile.mkdtemp()
+        self.app = PhoneBookServer(PhoneBookSystem(data_dir=self.test_dir), kdf_workers=2)
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.app.handle_connection, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+    
+    def tearDown(self):
+        import asyncio
+        
+        async def shutdown():
+            self.server.close()
+            connections = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+            await self.server.wait_closed()
+        
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.app.close()
+        shutil.rmtree(self.test_dir)
+    
+    def request(self, conn, method, path, data=None, token=None):
+        import json
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        conn.request(method, path, json.dumps(data) if data is not None else None, headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    
+    def test_sessions_and_contacts(self):
+        """Test per-request sessions, contact CRUD and search over one keep-alive connection"""
+        import http.client
+        conn = http.client.HTTPConnection("127.0.0.1", self.port)
+        for name in ("alice", "bob"):
+            status, _ = self.request(conn, "POST", "/register",
+                                     {"username": name, "email": f"{name}@example.com", "password": "password123"})
+            self.assertEqual(status, 201)
+        _, alice = self.request(conn, "POST", "/login", {"email": "alice@example.com", "password": "password123"})
+        _, bob = self.request(conn, "POST", "/login", {"email": "bob@example.com", "password": "password123"})
+        self.assertEqual(self.request(conn, "POST", "/login", {"email": "bob@example.com", "password": "bad"})[0], 401)
+        
+        status, contact = self.request(conn, "POST", "/contacts",
+                                       {"first_name": "John", "last_name": "Doe", "phone": "0901"}, alice["token"])
+        self.assertEqual(status, 201)
+        path = f"/contacts/{contact['contact_id']}"
+        self.assertEqual(self.request(conn, "PUT", path, {"notes": "friend"}, alice["token"])[1]["notes"], "friend")
+        self.assertEqual(self.request(conn, "GET", path, token=bob["token"])[0], 404)
+        self.assertEqual(self.request(conn, "GET", "/contacts")[0], 401)
+        
+        _, results = self.request(conn, "GET", "/search?q=john", token=alice["token"])
+        self.assertEqual([c["first_name"] for c in results["items"]], ["John"])
+        _, results = self.request(conn, "GET", "/fuzzy?q=Jon", token=alice["token"])
+        self.assertEqual([(c["first_name"], c["distance"]) for c in results["items"]], [("John", 1)])
+        self.assertEqual(self.request(conn, "GET", "/fuzzy?q=Jon&distance=9", token=alice["token"])[0], 400)
+        self.assertEqual(self.request(conn, "GET", "/contacts?cursor=eyJhIjoxfQ==", token=alice["token"])[0], 400)
+        self.assertEqual(self.request(conn, "GET", "/contacts", token=bob["token"])[1]["items"], [])
+        self.assertEqual(self.request(conn, "GET", "/admin/users", token=alice["token"])[0], 403)
+        self.assertEqual(self.request(conn, "DELETE", path, token=alice["token"])[0], 200)
+        conn.close()
+    
+    def test_sessions_expire_and_are_capped(self):
+        """Test that idle sessions expire and the oldest are dropped beyond max_sessions"""
+        import time
+        import http.client
+        from unittest.mock import patch
+        self.app.max_sessions = 2
+        conn = http.client.HTTPConnection("127.0.0.1", self.port)
+        self.request(conn, "POST", "/register",
+                     {"username": "alice", "email": "alice@example.com", "password": "password123"})
+        login = lambda: self.request(conn, "POST", "/login",
+                                     {"email": "alice@example.com", "password": "password123"})[1]["token"]
+        first, second = login(), login()
+        self.assertEqual(self.request(conn, "GET", "/contacts", token=first)[0], 200)
+        third = login()
+        # first was used most recently, so the idle second session is dropped
+        self.assertEqual(list(self.app.sessions), [first, third])
+        self.assertEqual(self.request(conn, "GET", "/contacts", token=second)[0], 401)
+        
+        with patch("server.time.monotonic", return_value=time.monotonic() + self.app.session_ttl + 1):
+            self.assertEqual(self.request(conn, "GET", "/contacts", token=third)[0], 401)
+        self.assertEqual(len(self.app.sessions), 0)
+        conn.close()
+    
+    def test_pipelined_requests(self):
+        """Test that pipelined requests on one connection are answered in order"""
+        import re
+        import socket
+        with socket.create_connection(("127.0.0.1", self.port)) as sock:
+            sock.sendall(b"GET /missing HTTP/1.1\r\nHost: x\r\n\r\n"
+                         b"DELETE /register HTTP/1.1\r\nHost: x\r\n\r\n"
+                         b"GET /contacts HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+            data = b""
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        statuses = re.findall(rb"HTTP/1\.1 (\d{3}) ", data)
+        self.assertEqual(statuses, [b"404", b"405", b"401"])
+    
+    def test_truncated_body_gets_400(self):
+        """Test that a body shorter than Content-Length is answered with 400 and the connection closed"""
+        import socket
+        with socket.create_connection(("127.0.0.1", self.port)) as sock:
+            sock.sendall(b"POST /login HTTP/1.1\r\nHost: x\r\nContent-Length: 100\r\n\r\n{\"email\"")
+            sock.shutdown(socket.SHUT_WR)
+            sock.settimeout(5)
+            data = b""
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        self.assertTrue(data.startswith(b"HTTP/1.1 400 "))
+        self.assertIn(b"Connection: close", data)
+    
+    def test_export_is_streamed(self):
+        """Test that GET /export is sent in chunks and keeps the connection usable"""
+        import csv
+        import http.client
+        self.app.system.register_user("alice", "alice@example.com", "password123")
+        conn = http.client.HTTPConnection("127.0.0.1", self.port)
+        _, alice = self.request(conn, "POST", "/login", {"email": "alice@example.com", "password": "password123"})
+        self.assertEqual(self.request(conn, "GET", "/export", token=alice["token"])[0], 404)
+        for i in range(5):
+            self.request(conn, "POST", "/contacts", {"first_name": f"N{i}", "phone": f"090{i}",
+                                                     "address": "1 Main St, Hanoi"}, alice["token"])
+        
+        conn.request("GET", "/export?format=csv", headers={"Authorization": f"Bearer {alice['token']}"})
+        response = conn.getresponse()
+        body = response.read().decode('utf-8')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader("Transfer-Encoding"), "chunked")
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual([row["first_name"] for row in rows], [f"N{i}" for i in range(5)])
+        self.assertEqual(rows[0]["address"], "1 Main St, Hanoi")
+        self.assertEqual(self.request(conn, "GET", "/contacts", token=alice["token"])[0], 200)
+        conn.close()
+
+class TestContactCounters(unittest.TestCase):
+    """Test cases for incrementally maintained contact counters"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("admin", "admin@example.com", "password123", "admin")
+        self.system.login("admin@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_counters_follow_changes(self):
+        """Test that stats() tracks add, edit, toggle and delete"""
+        self.system.add_contact("John", "Doe", "0901", group="Work")
+        self.system.add_contact("Jane", "Roe", "0902", group="Work")
+        self.system.add_contact("Jim", "Poe", "0903")
+        self.system.toggle_favorite_contact(2)
+        self.system.edit_contact(1, group="Family")
+        self.system.delete_contact(3)
+        
+        self.assertEqual(self.system.stats(), {"contacts": 2, "favorites": 1, "blocked": 0,
+                                               "groups": {"Family": 1, "Work": 1}})
+        overall = self.system.overall_stats()
+        self.assertEqual((overall["users"], overall["contacts"]), (1, 2))
+        self.assertTrue(self.system.verify_stats()["consistent"])
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        reloaded.login("admin@example.com", "password123")
+        self.assertEqual(reloaded.stats(), self.system.stats())
+    
+    def test_verify_detects_and_repairs_drift(self):
+        """Test that direct mutations are caught by the consistency checker"""
+        self.system.add_contact("John", "Doe", "0901")
+        self.system.get_contact_by_id(1).block_contact()
+        
+        report = self.system.verify_stats(repair=True)
+        self.assertFalse(report["consistent"])
+        self.assertEqual(report["mismatches"][0]["user_id"], 1)
+        self.assertEqual(self.system.stats()["blocked"], 1)
+        self.assertTrue(self.system.verify_stats()["consistent"])
+
+class TestPhoneLookup(unittest.TestCase):
+    """Test cases for normalized phone number lookups"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("admin", "admin@example.com", "password123", "admin")
+        self.system.register_user("user", "user@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_normalize_phone(self):
+        """Test that common formats map to the same E.164 key"""
+        from phone import normalize_phone
+        for phone in ("+84 912-345-678", "0084 912 345 678", "(0912) 345.678", "912345678 ext. 9"):
+            self.assertEqual(normalize_phone(phone), "+84912345678")
+        self.assertEqual(normalize_phone("020 7946 0000", default_country_code="44"), "+442079460000")
+        # Country code without '+': recognized when a full national number follows it
+        self.assertEqual(normalize_phone("84912345678"), "+84912345678")
+        self.assertEqual(normalize_phone("84 912 345 678"), "+84912345678")
+        self.assertEqual(normalize_phone("442079460000", default_country_code="44"), "+442079460000")
+        self.assertEqual(normalize_phone("8412345"), "+848412345")
+    
+    def test_lookup_by_phone(self):
+        """Test per-user and admin-wide reverse lookups across formats and edits"""
+        self.system.login("user@example.com", "password123")
+        self.system.add_contact("John", "Doe", "0912 345 678")
+        self.system.add_contact("Jane", "Roe", "0987654321")
+        self.assertEqual([c.first_name for c in self.system.lookup_by_phone("+84912345678")], ["John"])
+        self.assertEqual([c.first_name for c in self.system.lookup_by_phone("84912345678")], ["John"])
+        self.assertEqual(self.system.lookup_by_phone("+84912345678", all_users=True), [])
+        
+        self.system.edit_contact(1, phone="+84 900 000 000")
+        self.assertEqual(self.system.lookup_by_phone("0912345678"), [])
+        self.assertEqual(len(self.system.lookup_by_phone("0900-000-000")), 1)
+        
+        self.system.login("admin@example.com", "password123")
+        self.system.add_contact("Jane", "Copy", "+84 98 765 4321")
+        self.assertEqual(len(self.system.lookup_by_phone("0987654321")), 1)
+        self.assertEqual(len(self.system.lookup_by_phone("0987654321", all_users=True)), 2)
+
+class TestDuplicateMerge(unittest.TestCase):
+    """Test cases for duplicate detection and batch merging"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_find_and_apply_merges(self):
+        """Test that reformatted copies are merged into the oldest contact and persisted once"""
+        self.system.add_contact("Nguyễn", "Văn An", "0912 345 678", email="an@example.com")
+        self.system.add_contact("Nguyen", "Van An", "+84 912-345-678", email="AN@example.com",
+                                address="Hanoi", group="Work")
+        self.system.add_contact("Nguyen", "Van An", "0912345678", notes="met at conference")
+        self.system.add_contact("Jane", "Roe", "0987654321", email="jane@example.com")
+        
+        proposals = self.system.find_duplicate_contacts()
+        self.assertEqual(len(proposals), 1)
+        self.assertEqual(proposals[0]["keep"], 1)
+        self.assertEqual(proposals[0]["duplicates"], [2, 3])
+        self.assertIn("phone", proposals[0]["reasons"])
+        
+        with patch.object(self.system, '_persist_contact_changes',
+                          wraps=self.system._persist_contact_changes) as persist:
+            results = self.system.apply_merges(proposals)
+        self.assertEqual(persist.call_count, 1)
+        self.assertEqual(results, {"kept": 1, "merged": 2, "errors": []})
+        
+        kept = self.system.get_user_contact_by_id(1)
+        self.assertEqual((kept.address, kept.group, kept.notes), ("Hanoi", "Work", "met at conference"))
+        self.assertEqual(len(self.system.get_user_contacts()), 2)
+        self.assertEqual(len(self.system.lookup_by_phone("0912345678")), 1)
+        self.assertTrue(self.system.verify_stats()["consistent"])
+        self.assertEqual(self.system.find_duplicate_contacts(), [])
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        reloaded.login("test@example.com", "password123")
+        self.assertEqual(sorted(c.contact_id for c in reloaded.get_user_contacts()), [1, 4])
+        self.assertEqual(reloaded.get_user_contact_by_id(1).address, "Hanoi")
+    
+    def test_apply_merges_reports_missing_contacts(self):
+        """Test that stale proposals are reported instead of failing"""
+        self.system.add_contact("John", "Doe", "0912345678")
+        results = self.system.apply_merges([{"keep": 1, "duplicates": [99]}, {"keep": 42, "duplicates": [1]}])
+        self.assertEqual(results["merged"], 0)
+        self.assertEqual(len(results["errors"]), 2)
+        self.assertEqual(len(self.system.get_user_contacts()), 1)
+    
+    def test_oversized_blocks_are_split(self):
+        """Test that a large group of exact duplicates is still proposed past MAX_BLOCK_SIZE"""
+        from dedupe import find_duplicates, MAX_BLOCK_SIZE
+        from models import Contact
+        size = MAX_BLOCK_SIZE + 50
+        copies = [Contact(i, 1, "John", "Doe", "0912345678") for i in range(1, size + 1)]
+        # Same common name, distinct phones: one oversized name block with nothing to merge
+        namesakes = [Contact(i, 1, "Jane", "Roe", f"09{i:08d}") for i in range(size + 1, 2 * size + 1)]
+        proposals = find_duplicates(copies + namesakes, lambda contact: contact.phone)
+        self.assertEqual(len(proposals), 1)
+        self.assertEqual(proposals[0]["keep"], 1)
+        self.assertEqual(proposals[0]["duplicates"], list(range(2, size + 1)))
+        self.assertEqual(proposals[0]["reasons"], ["name", "phone"])
+    
+    def test_oversized_blocks_compare_all_pairs_above_two_key_score(self):
+        """Test that a threshold above the two-key score still finds non-adjacent pairs in a split block"""
+        from dedupe import find_duplicates, MAX_BLOCK_SIZE
+        from models import Contact
+        size = MAX_BLOCK_SIZE + 50
+        # Same phone and email everywhere; only every other contact shares a name token (score 0.9),
+        # while neighbours share none (score 0.8)
+        contacts = [Contact(i, 1, "Ann" if i % 2 else "Bob", f"X{i}", "0912345678", "same@example.com")
+                    for i in range(1, size + 1)]
+        proposals = find_duplicates(contacts, lambda contact: contact.phone, threshold=0.85)
+        self.assertEqual([proposal["keep"] for proposal in proposals], [1, 2])
+        self.assertEqual(proposals[0]["duplicates"], list(range(3, size + 1, 2)))
+        self.assertEqual(proposals[1]["duplicates"], list(range(4, size + 1, 2)))
+        self.assertEqual(proposals[0]["score"], 0.9)
+    
+    def test_apply_merges_groups_repeated_keep(self):
+        """Test that proposals sharing a kept contact are merged once and a kept contact is not deleted"""
+        for i in range(4):
+            self.system.add_contact(f"Copy{i}", "Doe", "0912345678", notes=f"note{i}")
+        results = self.system.apply_merges([{"keep": 1, "duplicates": [2]}, {"keep": 1, "duplicates": [3]},
+                                            {"keep": 4, "duplicates": [1]}])
+        self.assertEqual(results["kept"], 1)
+        self.assertEqual(results["merged"], 2)
+        self.assertEqual([error["contact_id"] for error in results["errors"]], [1])
+        self.assertEqual([c.contact_id for c in self.system.iter_user_contacts()], [1, 4])
+        self.assertEqual([c.contact_id for c in self.system.get_contacts_page(10)["items"]], [1, 4])
+        self.assertEqual(self.system.get_user_contact_by_id(1).notes, "note0; note1; note2")
+        self.assertTrue(self.system.verify_stats()["consistent"])
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """Test cases for the benchmark harness and its regression comparison"""
+    
+    def test_run_suite_emits_json_results(self):
+        """Test that every case runs on a small dataset and the report is JSON-serializable"""
+        import json
+        from bench_suite import run_suite
+        report = run_suite(sizes=[50], repeat=2, warmup=0, batch=5)
+        cases = {result["case"] for result in report["results"]}
+        self.assertEqual(cases, {"load", "add", "bulk_import", "edit", "delete", "contact_by_id",
+                                 "email_lookup", "phone_lookup", "search", "complete", "fuzzy", "group",
+                                 "favorites", "dedupe", "merge", "memory", "export", "backup", "login",
+                                 "login_pool", "snapshot", "snapshot_restore"})
+        for result in report["results"]:
+            self.assertEqual(len(result["runs_ns"]), 2)
+            self.assertGreater(result["median_ns"], 0)
+            self.assertEqual("bytes_per_op" in result, result["case"] == "memory")
+        self.assertEqual(json.loads(json.dumps(report)), report)
+    
+    def test_compare_flags_slowdowns(self):
+        """Test that only slowdowns beyond the threshold are flagged"""
+        from bench_suite import compare_results
+        baseline = {"results": [{"case": "add", "size": 10, "median_ns": 1000},
+                                {"case": "search", "size": 10, "median_ns": 1000},
+                                {"case": "export", "size": 10, "median_ns": 1000}]}
+        current = {"results": [{"case": "add", "size": 10, "median_ns": 1050},
+                               {"case": "search", "size": 10, "median_ns": 1500},
+                               {"case": "login", "size": 10, "median_ns": 10}]}
+        statuses = {row["case"]: row["status"] for row in compare_results(baseline, current, threshold=0.10)}
+        self.assertEqual(statuses, {"add": "ok", "search": "slower", "export": "missing", "login": "new"})
+        
+        # Memory cases also regress when their retained bytes grow beyond the threshold
+        baseline = {"results": [{"case": "memory", "size": 10, "median_ns": 1000, "bytes_per_op": 200}]}
+        current = {"results": [{"case": "memory", "size": 10, "median_ns": 1000, "bytes_per_op": 260}]}
+        self.assertEqual([row["status"] for row in compare_results(baseline, current)], ["larger"])
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for opt-in method instrumentation"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("admin", "admin@example.com", "password123", "admin")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_disabled_by_default(self):
+        """Test that no wrappers are installed and nothing is recorded unless enabled"""
+        self.system.login("admin@example.com", "password123")
+        self.assertNotIn("login", vars(self.system))
+        self.assertFalse(self.system.metrics.enabled)
+        self.assertEqual(self.system.metrics.snapshot()["methods"], {})
+    
+    def test_records_calls_and_exports(self):
+        """Test call counts, failures, histograms and both export formats"""
+        self.system.enable_metrics()
+        self.assertFalse(self.system.login("admin@example.com", "wrong"))
+        self.assertTrue(self.system.login("admin@example.com", "password123"))
+        self.system.add_contact("John", "Doe", "0901")
+        
+        methods = self.system.metrics.snapshot()["methods"]
+        self.assertEqual((methods["login"]["calls"], methods["login"]["failures"]), (2, 1))
+        self.assertEqual(sum(methods["add_contact"]["buckets"].values()), 1)
+        self.assertGreater(methods["_persist_contact_changes"]["bytes_written"], 0)
+        self.assertEqual(self.system.metrics.top_slow(1)[0]["method"], "login")
+        
+        text = self.system.metrics.to_prometheus()
+        self.assertIn('phonebook_method_calls_total{method="login"} 2', text)
+        self.assertIn('phonebook_method_duration_seconds_bucket{method="login",le="+Inf"} 2', text)
+        self.assertIn("# TYPE phonebook_method_duration_seconds histogram", text)
+        
+        self.system.disable_metrics()
+        self.assertNotIn("login", vars(self.system))
+        self.system.login("admin@example.com", "password123")
+        self.assertEqual(self.system.metrics.snapshot()["methods"]["login"]["calls"], 2)
+    
+    def test_profile_capture(self):
+        """Test that a cProfile capture reports the profiled calls"""
+        self.system.metrics.start_profile()
+        self.system.login("admin@example.com", "password123")
+        report = self.system.metrics.stop_profile(os.path.join(self.test_dir, "profile.pstats"))
+        self.assertIn("authenticate", report)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "profile.pstats")))
+        self.assertFalse(self.system.metrics.profiling)
+
+class TestWriteBehind(unittest.TestCase):
+    """Test cases for write-behind persistence and atomic file replacement"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        # Cleanups run in reverse: systems are closed (final flush) before the directory is removed
+        self.addCleanup(shutil.rmtree, self.test_dir)
+    
+    def open_system(self, **kwargs):
+        system = PhoneBookSystem(data_dir=self.test_dir, use_contact_log=True, write_behind=True, **kwargs)
+        self.addCleanup(system.close)
+        return system
+    
+    def test_changes_are_deferred_and_coalesced(self):
+        """Test that mutations return before writing and a flush writes each contact once"""
+        system = self.open_system(flush_interval=60)
+        system.register_user("testuser", "test@example.com", "password123")
+        system.login("test@example.com", "password123")
+        system.add_contact("John", "Doe", "0901")
+        system.add_contact("Jane", "Roe", "0902")
+        for i in range(5):
+            system.edit_contact(1, notes=f"note {i}")
+        system.delete_contact(2)
+        self.assertTrue(system.has_pending_writes)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "contacts.log")))
+        
+        with patch.object(system.storage, 'persist_contact_changes',
+                          wraps=system.storage.persist_contact_changes) as persist:
+            system.flush()
+        self.assertEqual([(op, c.contact_id) for op, c in persist.call_args[0][0]], [('A', 1)])
+        self.assertFalse(system.has_pending_writes)
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir, use_contact_log=True)
+        reloaded.login("test@example.com", "password123")
+        self.assertEqual([c.notes for c in reloaded.get_user_contacts()], ["note 4"])
+    
+    def test_threshold_wakes_flusher_and_logout_flushes(self):
+        """Test that the background thread flushes once enough changes are pending"""
+        import time
+        system = self.open_system(flush_interval=60, flush_threshold=3)
+        system.register_user("testuser", "test@example.com", "password123")
+        system.login("test@example.com", "password123")
+        # The pending user plus 2 contacts reach the threshold of 3 and wake the flusher
+        for i in range(2):
+            system.add_contact(f"First{i}", "Last", f"090{i}")
+        deadline = time.time() + 5
+        while system.has_pending_writes and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(system.has_pending_writes)
+        
+        system.add_contact("Late", "Contact", "0999")
+        system.logout()
+        self.assertFalse(system.has_pending_writes)
+        reloaded = PhoneBookSystem(data_dir=self.test_dir, use_contact_log=True)
+        reloaded.login("test@example.com", "password123")
+        self.assertEqual(len(reloaded.get_user_contacts()), 3)
+    
+    def test_shared_directory_keeps_peer_writes(self):
+        """Test that a peer sharing the data directory sees pending changes and keeps its own rows"""
+        writer = self.open_system(flush_interval=60)
+        writer.register_user("testuser", "test@example.com", "password123")
+        writer.login("test@example.com", "password123")
+        writer.add_contact("FromA", "Writer", "0901")
+        
+        # The peer opens while the user and contact are still only in the journal
+        peer = PhoneBookSystem(data_dir=self.test_dir, use_contact_log=True)
+        self.addCleanup(peer.close)
+        self.assertTrue(peer.login("test@example.com", "password123"))
+        peer.add_contact("FromB", "Peer", "0902")
+        writer.add_contact("FromA2", "Writer", "0903")
+        writer.flush()
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir, use_contact_log=True)
+        self.addCleanup(reloaded.close)
+        reloaded.login("test@example.com", "password123")
+        self.assertEqual(sorted((c.contact_id, c.first_name) for c in reloaded.get_user_contacts()),
+                         [(1, "FromA"), (2, "FromB"), (3, "FromA2")])
+    
+    def test_shared_directory_keeps_peer_imports(self):
+        """Test that imports by two instances sharing a snapshot-mode directory both survive"""
+        import_file = os.path.join(self.test_dir, "import.txt")
+        writer = PhoneBookSystem(data_dir=self.test_dir, write_behind=True, flush_interval=60)
+        self.addCleanup(writer.close)
+        peer = PhoneBookSystem(data_dir=self.test_dir)
+        self.addCleanup(peer.close)
+        writer.register_user("testuser", "test@example.com", "password123")
+        for system, name in ((writer, "FromA"), (peer, "FromB")):
+            with open(import_file, 'w', encoding='utf-8') as f:
+                f.write(f"first_name,last_name,phone\n{name},One,0901\n{name},Two,0902\n")
+            system.login("test@example.com", "password123")
+            self.assertEqual(system.import_contacts_from_txt(import_file)["success"], 2)
+        writer.add_contact("FromA", "Three", "0903")
+        writer.flush()
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        self.addCleanup(reloaded.close)
+        reloaded.login("test@example.com", "password123")
+        self.assertEqual(sorted((c.contact_id, c.first_name) for c in reloaded.get_user_contacts()),
+                         [(1, "FromA"), (2, "FromA"), (3, "FromB"), (4, "FromB"), (5, "FromA")])
+    
+    def test_atomic_write_keeps_old_file_on_error(self):
+        """Test that a failed rewrite leaves the previous file intact"""
+        from storage import atomic_write
+        path = os.path.join(self.test_dir, "users.txt")
+        with atomic_write(path) as f:
+            f.write("old\n")
+        with self.assertRaises(RuntimeError):
+            with atomic_write(path) as f:
+                f.write("partial")
+                raise RuntimeError("crash")
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), "old\n")
+        self.assertEqual(os.listdir(self.test_dir), ["users.txt"])
+
+class TestPrefixCompletion(unittest.TestCase):
+    """Test cases for search-as-you-type completion"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+        self.system.add_contact("Nguyễn", "Văn An", "0912 345 678")
+        self.system.add_contact("Nga", "Tran", "+84 987 000 111")
+        self.system.add_contact("John", "Nguyen", "0900 111 222")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def names(self, prefix, limit=10):
+        return [contact.first_name for contact in self.system.complete(prefix, limit)]
+    
+    def test_names_and_phone_prefixes(self):
+        """Test accent-insensitive name prefixes and phone digits in any format"""
+        self.assertEqual(self.names("ng"), ["Nga", "Nguyễn", "John"])
+        self.assertEqual(self.names("NGUYEN V"), ["Nguyễn"])
+        self.assertEqual(self.names("0912-34"), ["Nguyễn"])
+        self.assertEqual(self.names("+84 98"), ["Nga"])
+        self.assertEqual(self.names("ng", limit=1), ["Nga"])
+        self.assertEqual(self.names(""), [])
+    
+    def test_updates_are_incremental(self):
+        """Test that add, edit, block and delete are reflected without a rebuild"""
+        self.assertEqual(self.names("ng"), ["Nga", "Nguyễn", "John"])
+        self.system.add_contact("Ngoc", "Le", "0933")
+        self.system.edit_contact(2, first_name="Zed")
+        self.system.delete_contact(3)
+        self.assertEqual(self.names("ng"), ["Ngoc", "Nguyễn"])
+        self.assertEqual(self.names("zed"), ["Zed"])
+        self.system.get_user_contact_by_id(1).block_contact()
+        self.assertEqual(self.names("ng"), ["Ngoc"])
+
+class TestFuzzySearch(unittest.TestCase):
+    """Test cases for typo-tolerant fuzzy search"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+        self.system.add_contact("Nguyễn", "Văn An", "0912345678")
+        self.system.add_contact("Nguyen", "Thi Ha", "0912345679")
+        self.system.add_contact("Nguyet", "Tran", "0912345680")
+        self.system.add_contact("Johnson", "Smith", "0912345681")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def ranked(self, query, max_distance=None, limit=10):
+        return [(contact.contact_id, distance)
+                for contact, distance in self.system.fuzzy_search(query, max_distance, limit)]
+    
+    def test_typos_are_ranked_by_distance(self):
+        """Test that misspelled names match, closest first, ties by contact ID"""
+        self.assertEqual(self.system.search_contacts("Nguyn"), [])
+        self.assertEqual(self.ranked("Nguyn"), [(1, 1), (2, 1)])
+        self.assertEqual(self.ranked("nguyenn"), [(1, 1), (2, 1), (3, 2)])
+        self.assertEqual(self.ranked("Jonhson"), [(4, 2)])
+        self.assertEqual(self.ranked("Nguyt Tran"), [(3, 1)])
+        self.assertEqual(self.ranked("Nguyn Van"), [(1, 1)])
+        self.assertEqual(self.ranked("nguyenn"), self.ranked("nguyenn"))
+    
+    def test_distance_and_limit(self):
+        """Test the max_distance parameter and the top-k limit"""
+        self.assertEqual(self.ranked("nguyenn", max_distance=1), [(1, 1), (2, 1)])
+        self.assertEqual(self.ranked("nguyen", max_distance=0), [(1, 0), (2, 0)])
+        self.assertEqual(self.ranked("nguyenn", limit=1), [(1, 1)])
+        self.assertEqual(self.ranked("qqqqq", max_distance=2), [])
+        self.assertEqual(self.ranked(""), [])
+    
+    def test_updates_are_incremental(self):
+        """Test that add, edit, block and delete are reflected without a rebuild"""
+        self.assertEqual(self.ranked("Nguyet"), [(3, 0), (1, 1), (2, 1)])
+        self.system.add_contact("Nguyen", "Le", "0933")
+        self.system.edit_contact(2, first_name="Zed")
+        self.system.delete_contact(3)
+        self.system.get_user_contact_by_id(1).block_contact()
+        self.assertEqual(self.ranked("Nguyn"), [(5, 1)])
+        self.assertEqual(self.ranked("Zod"), [(2, 1)])
+
+class TestContactLog(unittest.TestCase):
+    """Test cases for the append-only contact log storage mode"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.system = PhoneBookSystem(data_dir=self.test_dir, use_contact_log=True)
+        self.system.register_user("testuser", "test@example.com", "password123")
+        self.system.login("test@example.com", "password123")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_mutations_append_to_log(self):
+        """Test that mutations are appended to the log and replayed on startup"""
+        self.system.add_contact("John", "Doe", "1234567890")
+        self.system.add_contact("Jane", "Smith", "0987654321")
+        first_id, second_id = [c.contact_id for c in self.system.contacts]
+        self.system.edit_contact(first_id, first_name="Johnny")
+        self.system.delete_contact(second_id)
+        
+        self.assertFalse(os.path.exists(self.system.contacts_file))
+        with open(self.system.contacts_log_file, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 4)
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir, use_contact_log=True)
+        self.assertEqual(len(reloaded.contacts), 1)
+        self.assertEqual(reloaded.contacts[0].first_name, "Johnny")
+        self.assertEqual(reloaded.next_contact_id, first_id + 1)
+    
+    def test_compaction(self):
+        """Test that the log is folded into the snapshot past the threshold"""
+        self.system.log_compact_threshold = 1
+        self.system.add_contact("John", "Doe", "1234567890")
+        
+        self.assertTrue(os.path.exists(self.system.contacts_file))
+        self.assertFalse(os.path.exists(self.system.contacts_log_file))
+        
+        reloaded = PhoneBookSystem(data_dir=self.test_dir)
+        self.assertEqual(len(reloaded.contacts), 1)
+
 def run_comprehensive_test():
     """Run a comprehensive test of the entire system"""
     print("=" * 60)
@@ -396,55 +1769,6 @@ def run_comprehensive_test():
         # Clean up
         shutil.rmtree(test_dir)
 
-def run_performance_test():
-    """Run performance tests with large datasets"""
-    print("\n" + "=" * 60)
-    print("PERFORMANCE TEST")
-    print("=" * 60)
-    
-    import time
-    
-    test_dir = tempfile.mkdtemp()
-    
-    try:
-        system = PhoneBookSystem(data_dir=test_dir)
-        system.register_user("perfuser", "perf@test.com", "password123")
-        system.login("perf@test.com", "password123")
-        
-        # Test adding multiple contacts
-        print("Testing performance with 100 contacts...")
-        start_time = time.time()
-        
-        for i in range(100):
-            system.add_contact(
-                f"First{i}", 
-                f"Last{i}", 
-                f"123456{i:04d}",
-                email=f"user{i}@test.com",
-                group="Test"
-            )
-        
-        add_time = time.time() - start_time
-        print(f"   Added 100 contacts in {add_time:.2f} seconds")
-        
-        # Test search performance
-        start_time = time.time()
-        results = system.search_contacts("First50")
-        search_time = time.time() - start_time
-        print(f"   Search completed in {search_time:.4f} seconds")
-        
-        # Test export performance
-        start_time = time.time()
-        export_file = os.path.join(test_dir, "perf_export.txt")
-        system.export_contacts_to_txt(export_file)
-        export_time = time.time() - start_time
-        print(f"   Export completed in {export_time:.2f} seconds")
-        
-        print("    Performance test completed")
-        
-    finally:
-        shutil.rmtree(test_dir)
-
 if __name__ == "__main__":
     # Run unit tests
     print("Running unit tests...")
@@ -453,8 +1777,7 @@ if __name__ == "__main__":
     # Run comprehensive test
     run_comprehensive_test()
     
-    # Run performance test
-    run_performance_test()
+    # Performance: python bench_suite.py run / compare
     
     print("\n" + "=" * 60)
     print("TESTING COMPLETED")
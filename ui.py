@@ -1,5 +1,31 @@
 import os
+import sys
+import json
 from system import PhoneBookSystem
+from contact_io import print_import_progress
+
+PAGE_SIZE = 10
+BACKSPACE_KEYS = ('\x7f', '\b')
+
+def read_key() -> str:
+    """
+    Read one keypress without waiting for Enter. When stdin is not a terminal
+    (or raw input is unavailable) a whole line is read instead.
+    """
+    if os.name == 'nt':
+        import msvcrt
+        return msvcrt.getwch()
+    if not sys.stdin.isatty():
+        return input()
+    import tty
+    import termios
+    fd = sys.stdin.fileno()
+    old_settings = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        return sys.stdin.read(1)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
 
 class PhoneBookUI:
     def __init__(self):
@@ -17,6 +43,62 @@ class PhoneBookUI:
     def wait_for_enter(self):
         input("\nPress Enter to continue...")
     
+    def browse_pages(self, title: str, fetch_page, render_item, empty_message: str,
+                     select_label: str = None):
+        """
+        Show cursor-paginated results with next/previous navigation.
+        fetch_page(cursor) returns {"items", "next_cursor"}; render_item(number, item) prints one item.
+        With select_label, typing a number shown on the page returns that item
+        (None when the user goes back).
+        """
+        cursors = [None]
+        while True:
+            self.clear_screen()
+            self.display_header(title)
+            
+            page = fetch_page(cursors[-1])
+            if not page["items"] and len(cursors) == 1:
+                print(empty_message)
+                self.wait_for_enter()
+                return
+            
+            first_number = (len(cursors) - 1) * PAGE_SIZE + 1
+            for number, item in enumerate(page["items"], first_number):
+                render_item(number, item)
+            
+            print(f"\nPage {len(cursors)}")
+            options = []
+            if page["next_cursor"]:
+                options.append("N = Next page")
+            if len(cursors) > 1:
+                options.append("P = Previous page")
+            if select_label:
+                options.append(f"Number = Select {select_label}")
+            options.append("Enter = Back")
+            choice = input(" | ".join(options) + ": ").strip().lower()
+            
+            if choice == "n" and page["next_cursor"]:
+                cursors.append(page["next_cursor"])
+            elif choice == "p" and len(cursors) > 1:
+                cursors.pop()
+            elif choice == "":
+                return None
+            elif select_label and choice.isdigit():
+                # Chỉ chọn trong trang hiện tại: không cần nạp toàn bộ danh bạ
+                position = int(choice) - first_number
+                if 0 <= position < len(page["items"]):
+                    return page["items"][position]
+                print("Please enter a number shown on this page!")
+                self.wait_for_enter()
+    
+    def pick_contact(self, title: str, empty_message: str, select_label: str):
+        def render(i, contact):
+            print(f"{i}. [ID: {contact.contact_id}] {contact.first_name} {contact.last_name} - {contact.phone}")
+        
+        return self.browse_pages(title,
+                                 lambda cursor: self.system.get_contacts_page(PAGE_SIZE, cursor),
+                                 render, empty_message, select_label)
+    
     def main_menu(self):
         while self.running:
             self.clear_screen()
@@ -41,6 +123,9 @@ class PhoneBookUI:
                 print("7. Update Profile")
                 print("8. Logout")
                 print("9. Exit")
+                print("10. Statistics Dashboard")
+                if self.system.current_user.role == "admin":
+                    print("11. Performance Metrics (Admin)")
             
             choice = input("\nSelect function: ").strip()
             
@@ -77,6 +162,10 @@ class PhoneBookUI:
                     self.wait_for_enter()
                 elif choice == "9":
                     self.running = False
+                elif choice == "10":
+                    self.stats_dashboard()
+                elif choice == "11" and self.system.current_user.role == "admin":
+                    self.performance_metrics()
                 else:
                     print("Invalid choice!")
                     self.wait_for_enter()
@@ -190,18 +279,17 @@ class PhoneBookUI:
         self.wait_for_enter()
     
     def contact_management(self):
+        cursors = [None]
         while True:
             self.clear_screen()
             self.display_header("CONTACT MANAGEMENT")
             
-            # Liệt kê danh bạ (dùng hàm view_contacts nhưng không chờ Enter)
-            user_contacts = [contact for contact in self.system.contacts 
-                            if contact.user_id == self.system.current_user.user_id 
-                            and not contact.is_blocked]
+            # Liệt kê danh bạ theo trang (dùng hàm view_contacts nhưng không chờ Enter)
+            page = self.system.get_contacts_page(PAGE_SIZE, cursors[-1])
+            user_contacts = page["items"]
             
             if user_contacts:
-                print("Your Contacts:")
-                user_contacts.sort(key=lambda x: (x.first_name.lower(), x.last_name.lower()))
+                print(f"Your Contacts (page {len(cursors)}):")
                 for i, contact in enumerate(user_contacts, 1):
                     favorite = "*" if contact.is_favorite else " "
                     print(f"  ID:{contact.contact_id} | {favorite} {contact.first_name} {contact.last_name} - {contact.phone}")
@@ -216,10 +304,18 @@ class PhoneBookUI:
             print("3. Delete Contact")
             print("4. Toggle Favorite Status") # TÙY CHỌN MỚI
             print("5. Back to Main Menu") # ĐỔI SỐ THỨ TỰ
+            if page["next_cursor"]:
+                print("N. Next Page")
+            if len(cursors) > 1:
+                print("P. Previous Page")
             
             choice = input("\nSelect function: ").strip()
             
-            if choice == "1":
+            if choice.lower() == "n" and page["next_cursor"]:
+                cursors.append(page["next_cursor"])
+            elif choice.lower() == "p" and len(cursors) > 1:
+                cursors.pop()
+            elif choice == "1":
                 self.add_contact()
             elif choice == "2":
                 self.edit_contact()
@@ -259,21 +355,7 @@ class PhoneBookUI:
         self.wait_for_enter()
 
     def view_contacts(self):
-        self.clear_screen()
-        self.display_header("CONTACT LIST")
-        
-        user_contacts = [contact for contact in self.system.contacts 
-                        if contact.user_id == self.system.current_user.user_id 
-                        and not contact.is_blocked]
-        
-        if not user_contacts:
-            print("No contacts yet.")
-            self.wait_for_enter()
-            return
-        
-        user_contacts.sort(key=lambda x: (x.first_name.lower(), x.last_name.lower()))
-        
-        for i, contact in enumerate(user_contacts, 1):
+        def render(i, contact):
             favorite = "* " if contact.is_favorite else "  "
             print(f"{i}. [ID: {contact.contact_id}] {favorite}{contact.first_name} {contact.last_name} - {contact.phone}")
             print(f"   Email: {contact.email} | Group: {contact.group}")
@@ -283,7 +365,9 @@ class PhoneBookUI:
                 print(f"   Notes: {contact.notes}")
             print("-" * 50)
         
-        self.wait_for_enter()
+        self.browse_pages("CONTACT LIST",
+                          lambda cursor: self.system.get_contacts_page(PAGE_SIZE, cursor),
+                          render, "No contacts yet.")
     
     def add_contact(self):
         self.clear_screen()
@@ -312,94 +396,52 @@ class PhoneBookUI:
         self.wait_for_enter()
     
     def edit_contact(self):
-        self.clear_screen()
-        self.display_header("EDIT CONTACT")
-        
-        # Lấy ID của người dùng muốn chỉnh sửa, không dùng index nữa
-        user_contacts = [contact for contact in self.system.contacts 
-                        if contact.user_id == self.system.current_user.user_id 
-                        and not contact.is_blocked]
-        
-        if not user_contacts:
-            print("No contacts to edit.")
-            self.wait_for_enter()
+        # Chọn liên hệ theo từng trang thay vì in toàn bộ danh bạ
+        contact = self.pick_contact("EDIT CONTACT", "No contacts to edit.", "contact to edit")
+        if contact is None:
             return
         
-        print("Available Contacts:")
-        for contact in user_contacts:
-            print(f"ID: {contact.contact_id}. {contact.first_name} {contact.last_name} - {contact.phone}")
-        
-        try:
-            contact_id = int(input("\nEnter Contact ID to edit: ").strip())
-            contact = self.system.get_user_contact_by_id(contact_id) # Dùng hàm mới để check quyền
-            
-            if contact:
-                print(f"\nEditing contact: {contact.first_name} {contact.last_name}")
-                print("(Leave blank to keep current value)")
-                
-                first_name = input(f"First Name [{contact.first_name}]: ").strip() or contact.first_name
-                last_name = input(f"Last Name [{contact.last_name}]: ").strip() or contact.last_name
-                phone = input(f"Phone [{contact.phone}]: ").strip() or contact.phone
-                email = input(f"Email [{contact.email}]: ").strip() or contact.email
-                address = input(f"Address [{contact.address}]: ").strip() or contact.address
-                group = input(f"Group [{contact.group}]: ").strip() or contact.group
-                notes = input(f"Notes [{contact.notes}]: ").strip() or contact.notes
-                
-                updates = {
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'phone': phone,
-                    'email': email,
-                    'address': address,
-                    'group': group,
-                    'notes': notes
-                }
-                
-                if self.system.edit_contact(contact.contact_id, **updates):
-                    print("Contact updated successfully!")
-                else:
-                    print("Error updating contact!")
-            else:
-                print(f"Contact with ID {contact_id} not found or does not belong to you.")
-        except ValueError:
-            print("Please enter a valid number for Contact ID!")
+        print(f"\nEditing contact: {contact.first_name} {contact.last_name}")
+        print("(Leave blank to keep current value)")
+        
+        first_name = input(f"First Name [{contact.first_name}]: ").strip() or contact.first_name
+        last_name = input(f"Last Name [{contact.last_name}]: ").strip() or contact.last_name
+        phone = input(f"Phone [{contact.phone}]: ").strip() or contact.phone
+        email = input(f"Email [{contact.email}]: ").strip() or contact.email
+        address = input(f"Address [{contact.address}]: ").strip() or contact.address
+        group = input(f"Group [{contact.group}]: ").strip() or contact.group
+        notes = input(f"Notes [{contact.notes}]: ").strip() or contact.notes
+        
+        updates = {
+            'first_name': first_name,
+            'last_name': last_name,
+            'phone': phone,
+            'email': email,
+            'address': address,
+            'group': group,
+            'notes': notes
+        }
+        
+        if self.system.edit_contact(contact.contact_id, **updates):
+            print("Contact updated successfully!")
+        else:
+            print("Error updating contact!")
         
         self.wait_for_enter()
     
     def delete_contact(self):
-        self.clear_screen()
-        self.display_header("DELETE CONTACT")
-        
-        user_contacts = [contact for contact in self.system.contacts 
-                        if contact.user_id == self.system.current_user.user_id 
-                        and not contact.is_blocked]
-        
-        if not user_contacts:
-            print("No contacts to delete.")
-            self.wait_for_enter()
+        contact = self.pick_contact("DELETE CONTACT", "No contacts to delete.", "contact to delete")
+        if contact is None:
             return
         
-        print("Available Contacts:")
-        for contact in user_contacts:
-            print(f"ID: {contact.contact_id}. {contact.first_name} {contact.last_name} - {contact.phone}")
-        
-        try:
-            contact_id = int(input("\nEnter Contact ID to delete: ").strip())
-            contact = self.system.get_user_contact_by_id(contact_id)
-            
-            if contact:
-                confirm = input(f"Are you sure you want to delete '{contact.first_name} {contact.last_name}' (ID: {contact.contact_id})? (y/n): ")
-                if confirm.lower() == 'y':
-                    if self.system.delete_contact(contact.contact_id):
-                        print("Contact deleted successfully!")
-                    else:
-                        print("Error deleting contact!")
-                else:
-                    print("Delete operation cancelled.")
+        confirm = input(f"Are you sure you want to delete '{contact.first_name} {contact.last_name}' (ID: {contact.contact_id})? (y/n): ")
+        if confirm.lower() == 'y':
+            if self.system.delete_contact(contact.contact_id):
+                print("Contact deleted successfully!")
             else:
-                print(f"Contact with ID {contact_id} not found or does not belong to you.")
-        except ValueError:
-            print("Please enter a valid number for Contact ID!")
+                print("Error deleting contact!")
+        else:
+            print("Delete operation cancelled.")
         
         self.wait_for_enter()
     
@@ -407,44 +449,88 @@ class PhoneBookUI:
         self.clear_screen()
         self.display_header("SEARCH CONTACTS")
         
-        keyword = input("Enter search keyword: ").strip()
+        keyword = input("Enter search keyword (/ for search-as-you-type, ~name for typo-tolerant): ").strip()
+        
+        if keyword == "/":
+            self.quick_search()
+            return
+        
+        if keyword.startswith("~"):
+            self.fuzzy_search(keyword[1:].strip())
+            return
         
         if not keyword:
             print("Please enter a search keyword!")
             self.wait_for_enter()
             return
         
-        results = self.system.search_contacts(keyword)
+        # Không có kết quả khớp chính xác: gợi ý các tên gần giống (có thể do gõ sai)
+        if not self.system.search_contacts_page(keyword, 1)["items"]:
+            self.fuzzy_search(keyword)
+            return
         
-        if not results:
-            print("No contacts found matching your search.")
-        else:
-            print(f"Found {len(results)} results:")
-            for i, contact in enumerate(results, 1):
-                favorite = "* " if contact.is_favorite else "  "
-                print(f"{i}. [ID: {contact.contact_id}] {favorite}{contact.first_name} {contact.last_name} - {contact.phone}")
-                print(f"   Email: {contact.email} | Group: {contact.group}")
-                print("-" * 50)
+        def render(i, contact):
+            favorite = "* " if contact.is_favorite else "  "
+            print(f"{i}. [ID: {contact.contact_id}] {favorite}{contact.first_name} {contact.last_name} - {contact.phone}")
+            print(f"   Email: {contact.email} | Group: {contact.group}")
+            print("-" * 50)
         
-        self.wait_for_enter()
+        self.browse_pages(f"SEARCH RESULTS: {keyword}",
+                          lambda cursor: self.system.search_contacts_page(keyword, PAGE_SIZE, cursor),
+                          render, "No contacts found matching your search.")
     
-    def favorite_contacts(self):
+    def fuzzy_search(self, query: str):
         self.clear_screen()
-        self.display_header("FAVORITE CONTACTS")
-        
-        favorites = self.system.get_favorite_contacts()
-        
-        if not favorites:
-            print("No favorite contacts yet.")
-            self.wait_for_enter()
-            return
+        self.display_header(f"SIMILAR NAMES: {query}")
         
-        for i, contact in enumerate(favorites, 1):
+        matches = self.system.fuzzy_search(query, limit=PAGE_SIZE) if query else []
+        if not matches:
+            print("No contacts found matching your search.")
+        for i, (contact, distance) in enumerate(matches, 1):
+            favorite = "* " if contact.is_favorite else "  "
+            print(f"{i}. [ID: {contact.contact_id}] {favorite}{contact.first_name} {contact.last_name} - {contact.phone}"
+                  f" ({distance} edit{'s' if distance != 1 else ''})")
+            print(f"   Email: {contact.email} | Group: {contact.group}")
+            print("-" * 50)
+        self.wait_for_enter()
+    
+    def quick_search(self):
+        # Lọc trực tiếp: mỗi phím gõ cập nhật danh sách gợi ý theo tiền tố (tên hoặc số điện thoại)
+        prefix = ""
+        while True:
+            self.clear_screen()
+            self.display_header("SEARCH AS YOU TYPE")
+            print("Type a name or phone prefix | Backspace = delete | Enter = done")
+            print(f"\nSearch: {prefix}_\n")
+            
+            if prefix:
+                matches = self.system.complete(prefix, PAGE_SIZE)
+                for i, contact in enumerate(matches, 1):
+                    favorite = "* " if contact.is_favorite else "  "
+                    print(f"{i}. [ID: {contact.contact_id}] {favorite}{contact.first_name} {contact.last_name} - {contact.phone}")
+                if not matches:
+                    print("No matching contacts.")
+            
+            key = read_key()
+            if key in ("", "\r", "\n", "\x1b"):
+                return
+            if key in BACKSPACE_KEYS:
+                prefix = prefix[:-1]
+            elif len(key) > 1:
+                # Không có terminal: cả dòng vừa nhập là tiền tố mới
+                prefix = key.strip()
+            elif key.isprintable():
+                prefix += key
+    
+    def favorite_contacts(self):
+        def render(i, contact):
             print(f"{i}. [ID: {contact.contact_id}] * {contact.first_name} {contact.last_name} - {contact.phone}")
             print(f"   Email: {contact.email} | Group: {contact.group}")
             print("-" * 50)
         
-        self.wait_for_enter()
+        self.browse_pages("FAVORITE CONTACTS",
+                          lambda cursor: self.system.get_favorite_contacts_page(PAGE_SIZE, cursor),
+                          render, "No favorite contacts yet.")
     
     def import_export_menu(self):
         while True:
@@ -453,7 +539,8 @@ class PhoneBookUI:
             
             print("1. Export Contacts to TXT") # Đổi tên hiển thị
             print("2. Import Contacts from TXT") # Đổi tên hiển thị
-            print("3. Back")
+            print("3. Export Contacts (CSV/JSONL, filters)")
+            print("4. Back")
             
             choice = input("\nSelect function: ").strip()
             
@@ -471,46 +558,87 @@ class PhoneBookUI:
             elif choice == "2":
                 filename = input("TXT filename to import: ").strip()
                 if os.path.exists(filename):
-                    results = self.system.import_contacts_from_txt(filename) # Gọi hàm mới
-                    print(f"Import results:")
+                    results = self.system.import_contacts_from_txt(
+                        filename, progress_callback=print_import_progress)
+                    print(f"\nImport results:")
                     print(f"- Total records: {results['total']}")
                     print(f"- Successful: {results['success']}")
                     print(f"- Failed: {results['failed']}")
+                    for error in results.get('errors', [])[:10]:
+                        print(f"  Line {error['line']}: {error['error']}")
                 else:
                     print("File does not exist!")
                 self.wait_for_enter()
             
             elif choice == "3":
+                self.export_contacts_advanced()
+            
+            elif choice == "4":
                 break
             
             else:
                 print("Invalid choice!")
                 self.wait_for_enter()
     
+    def export_contacts_advanced(self):
+        fmt = input("Format (txt/csv/jsonl) [csv]: ").strip().lower() or "csv"
+        if fmt not in ("txt", "csv", "jsonl"):
+            print("Unsupported format!")
+            self.wait_for_enter()
+            return
+        
+        filename = input("Filename to export: ").strip()
+        if not filename:
+            filename = f"contacts_export.{fmt}"
+        compress = input("Compress with gzip? (y/n): ").strip().lower() == 'y'
+        if compress and not filename.endswith('.gz'):
+            filename += '.gz'
+        
+        group = input("Only group (leave blank for all): ").strip() or None
+        favorites_only = input("Favorites only? (y/n): ").strip().lower() == 'y'
+        fields = input("Fields, comma-separated (leave blank for all): ").strip()
+        fields = [field.strip() for field in fields.split(',') if field.strip()] or None
+        
+        if self.system.export_contacts(filename, fmt=fmt, fields=fields, group=group,
+                                       favorites_only=favorites_only, compress=compress):
+            print(f"Data exported successfully to: {filename}")
+        else:
+            print("Error exporting data!")
+        self.wait_for_enter()
+    
     def user_management(self):
         if not self.system.current_user or self.system.current_user.role != "admin":
             print("Access denied!")
             self.wait_for_enter()
             return
         
+        cursors = [None]
         while True:
             self.clear_screen()
             self.display_header("USER MANAGEMENT (ADMIN)")
             
-            users = self.system.get_all_users()
+            page = self.system.get_users_page(PAGE_SIZE, cursors[-1])
             
-            print("User List:")
-            for user in users:
+            print(f"User List (page {len(cursors)}):")
+            for user in page["items"]:
                 status = "Active" if user.is_active else "Inactive"
                 print(f"{user.user_id}. {user.username} ({user.email}) - {user.role} [{status}]")
             
             print("\n1. Deactivate User")
             print("2. Activate User")
             print("3. Back")
+            if page["next_cursor"]:
+                print("N. Next Page")
+            if len(cursors) > 1:
+                print("P. Previous Page")
             
             choice = input("\nSelect function: ").strip()
             
-            if choice == "1":
+            if choice.lower() == "n" and page["next_cursor"]:
+                cursors.append(page["next_cursor"])
+            elif choice.lower() == "p" and len(cursors) > 1:
+                cursors.pop()
+            elif choice == "1":
                 try:
                     user_id = int(input("Enter user ID to deactivate: "))
                     if self.system.deactivate_user(user_id):
@@ -541,6 +669,108 @@ class PhoneBookUI:
                 print("Invalid choice!")
                 self.wait_for_enter()
     
+    def stats_dashboard(self):
+        while True:
+            self.clear_screen()
+            self.display_header("STATISTICS DASHBOARD")
+            
+            stats = self.system.stats()
+            print("Your Contacts:")
+            print(f"  Total: {stats['contacts']} | Favorites: {stats['favorites']} | Blocked: {stats['blocked']}")
+            if stats['groups']:
+                print("  By group:")
+                for group, count in sorted(stats['groups'].items(), key=lambda item: (-item[1], item[0])):
+                    print(f"    {group:<20} {count}")
+            
+            is_admin = self.system.current_user.role == "admin"
+            if is_admin:
+                overall = self.system.overall_stats()
+                print("-" * 50)
+                print("All Users (Admin):")
+                print(f"  Users: {overall['users']} | Contacts: {overall['contacts']} | "
+                      f"Favorites: {overall['favorites']} | Blocked: {overall['blocked']}")
+                top_groups = sorted(overall['groups'].items(), key=lambda item: (-item[1], item[0]))[:5]
+                if top_groups:
+                    print("  Top groups: " + ", ".join(f"{group} ({count})" for group, count in top_groups))
+                print("\nC = Check counters against a full recount | Enter = Back")
+            
+            choice = input("\nSelect: " if is_admin else "\nPress Enter to continue...").strip().lower()
+            if not (is_admin and choice == "c"):
+                return
+            
+            report = self.system.verify_stats(repair=True)
+            if report["consistent"]:
+                print("Counters are consistent with a full recount.")
+            else:
+                print(f"Found {len(report['mismatches'])} mismatches; counters have been rebuilt.")
+                for mismatch in report["mismatches"][:10]:
+                    owner = mismatch["user_id"] if mismatch["user_id"] is not None else "totals"
+                    print(f"  {owner}: expected {mismatch['expected']}, found {mismatch['actual']}")
+            self.wait_for_enter()
+    
+    def performance_metrics(self):
+        if not self.system.current_user or self.system.current_user.role != "admin":
+            print("Access denied!")
+            self.wait_for_enter()
+            return
+        
+        metrics = self.system.metrics
+        while True:
+            self.clear_screen()
+            self.display_header("PERFORMANCE METRICS")
+            print(f"Metrics: {'ON' if metrics.enabled else 'OFF'} | Profiling: {'ON' if metrics.profiling else 'OFF'}")
+            
+            top = metrics.top_slow(10)
+            if top:
+                print("\nTop slow operations (by p99):")
+                print(f"{'Method':<28} {'Calls':>7} {'Fail':>5} {'Mean ms':>9} {'p99 ms':>9} {'Max ms':>9} "
+                      f"{'Read KB':>9} {'Write KB':>9}")
+                print("-" * 92)
+                for row in top:
+                    print(f"{row['method']:<28} {row['calls']:>7} {row['failures']:>5} "
+                          f"{row['mean_seconds'] * 1000:>9.2f} {row['p99_seconds'] * 1000:>9.2f} "
+                          f"{row['max_seconds'] * 1000:>9.2f} {row['bytes_read'] / 1024:>9.1f} "
+                          f"{row['bytes_written'] / 1024:>9.1f}")
+            else:
+                print("\nNo operations recorded yet.")
+            
+            print(f"\n1. {'Disable' if metrics.enabled else 'Enable'} metrics")
+            print(f"2. {'Stop' if metrics.profiling else 'Start'} cProfile capture")
+            print("3. Export metrics (Prometheus + JSON)")
+            print("4. Reset metrics")
+            print("5. Back")
+            
+            choice = input("\nSelect function: ").strip()
+            if choice == "1":
+                if metrics.enabled:
+                    self.system.disable_metrics()
+                else:
+                    self.system.enable_metrics()
+            elif choice == "2":
+                if not metrics.profiling:
+                    metrics.start_profile()
+                    continue
+                path = os.path.join(self.system.data_dir, "profile.pstats")
+                print(metrics.stop_profile(path, limit=15))
+                print(f"Full profile saved to {path}")
+                self.wait_for_enter()
+            elif choice == "3":
+                prom_path = os.path.join(self.system.data_dir, "metrics.prom")
+                json_path = os.path.join(self.system.data_dir, "metrics.json")
+                try:
+                    with open(prom_path, 'w', encoding='utf-8') as f:
+                        f.write(metrics.to_prometheus())
+                    with open(json_path, 'w', encoding='utf-8') as f:
+                        json.dump(metrics.snapshot(), f, indent=2)
+                    print(f"Metrics exported to {prom_path} and {json_path}")
+                except Exception as e:
+                    print(f"Export failed: {e}")
+                self.wait_for_enter()
+            elif choice == "4":
+                metrics.reset()
+            elif choice == "5":
+                return
+    
     def system_backup(self):
         if not self.system.current_user or self.system.current_user.role != "admin":
             print("Access denied!")
@@ -550,9 +780,20 @@ class PhoneBookUI:
         self.clear_screen()
         self.display_header("SYSTEM BACKUP")
         
-        backup_file = self.system.backup_data()
+        try:
+            report = self.system.create_backup()
+        except Exception as e:
+            print(f"Backup failed: {e}")
+            self.wait_for_enter()
+            return
+        
         print(f"Data backup successful!")
-        print(f"Backup file: {backup_file}")
+        print(f"Backup manifest: {report['manifest']}")
+        print(f"Users: {report['users']} | Contacts: {report['contacts']}")
+        print(f"Chunks written: {report['chunks_written']} ({report['bytes_written']} bytes) | "
+              f"Unchanged chunks: {report['chunks_reused']}")
+        if report['chunks_removed']:
+            print(f"Expired chunks removed: {report['chunks_removed']}")
         
         self.wait_for_enter()
     
@@ -573,15 +814,17 @@ class PhoneBookUI:
         if new_username:
             updates['username'] = new_username
         if new_email:
-            if new_email != user.email and any(u.email == new_email for u in self.system.users):
+            if new_email != user.email and self.system.email_exists(new_email):
                 print("Email already exists in system!")
                 self.wait_for_enter()
                 return
             updates['email'] = new_email
         
         if updates:
-            user.update_profile(**updates)
-            self.system._save_users()
+            if not self.system.update_user_profile(user, **updates):
+                print("Email already exists in system!")
+                self.wait_for_enter()
+                return
             print("Profile updated successfully!")
         else:
             print("No changes made.")